@@ -1,6 +1,7 @@
 package test
 
 import (
+	"bufio"
 	"context"
 	"fmt"
 	bsmsg "github.com/ipfs/go-bitswap/message"
@@ -9,6 +10,7 @@ import (
 	"os"
 	"strconv"
 	"strings"
+	gosync "sync"
 	"time"
 
 	"github.com/ipfs/go-cid"
@@ -30,16 +32,18 @@ type TestPermutation struct {
 
 // TestVars testing variables
 type TestVars struct {
-	Dialer            string
-	EavesdropperCount int
-	Latency           time.Duration
-	LeechCount        int
-	Permutations      []TestPermutation
-	RunCount          int
-	RunTimeout        time.Duration
-	SeedCount         int
-	TCPEnabled        bool
-	Timeout           time.Duration
+	Dialer              string
+	EavesdropperCount   int
+	Latency             time.Duration
+	LeechCount          int
+	MaxRecordedMessages int
+	Permutations        []TestPermutation
+	RecordAllMessages   bool
+	RunCount            int
+	RunTimeout          time.Duration
+	SeedCount           int
+	TCPEnabled          bool
+	Timeout             time.Duration
 }
 
 type BaseTestData struct {
@@ -82,6 +86,11 @@ func GetEnvVars(runenv *runtime.RunEnv) (*TestVars, error) {
 	if runenv.IsParamSet("latency_ms") {
 		tv.Latency = time.Duration(runenv.IntParam("latency_ms")) * time.Millisecond
 	}
+	if runenv.IsParamSet("record_all_messages") {
+		tv.RecordAllMessages = runenv.BooleanParam("record_all_messages")
+	}
+	// The manifest holds the default of the limit, testground fills it in if the composition doesn't set it
+	tv.MaxRecordedMessages = runenv.IntParam("max_recorded_messages")
 
 	tv.LeechCount = 1
 	tv.SeedCount = 1
@@ -496,118 +505,224 @@ func (mr *metricsRecorder) Record(key string, value float64) {
 	mr.runenv.R().RecordPoint(fmt.Sprintf("%s/meta:%s", mr.meta, key), value)
 }
 
+// messageHistoryEntry is a received message as captured on the receive path. It is only encoded to JSON when the
+// recorder is flushed.
+type messageHistoryEntry struct {
+	timestamp int64
+	sender    peer.ID
+	wants     []cid.Cid
+}
+
+// MessageHistoryRecorder records the want messages a node receives during a run. By default, it only records the
+// first message. The messages are kept in memory and written to messageHistory.out in bulk when the recorder is
+// closed, so that the receive path is not slowed down by encoding and writing them.
 type MessageHistoryRecorder struct {
-	runenv    *runtime.RunEnv
-	file      *os.File
-	meta      string
-	host      string
-	shouldLog bool
+	runenv     *runtime.RunEnv
+	file       *os.File
+	meta       string
+	host       string
+	recordAll  bool
+	maxEntries int
+
+	lock    gosync.Mutex
+	entries []messageHistoryEntry
+	dropped int
+	closed  bool
 }
 
 func (m *MessageHistoryRecorder) MessageReceived(pid peer.ID, msg bsmsg.BitSwapMessage) {
-	if !m.shouldLog {
-		return
-	}
 	timestamp := time.Now().UnixNano()
+	wantlist := msg.Wantlist()
 	// don't log non-want-have messages
-	if len(msg.Wantlist()) == 0 {
+	if len(wantlist) == 0 {
 		return
 	}
-	wantlistString := ""
-	for index, entry := range msg.Wantlist() {
-		if index > 0 {
-			wantlistString = wantlistString + fmt.Sprintf(", \"%s\"", entry.Cid)
-		} else {
-			wantlistString = wantlistString + fmt.Sprintf("\"%s\"", entry.Cid)
-		}
-	}
 
-	msgObjectString := fmt.Sprintf("\"wants\": [%s]", wantlistString)
-	logString := fmt.Sprintf(
-		"{ \"meta\": \"%s\", \"receiver\": \"%s\", \"ts\": \"%d\", \"sender\": \"%s\", \"message\": { %s } }",
-		m.meta,
-		m.host,
-		timestamp,
-		pid.String(),
-		msgObjectString,
-	)
-	_, err := fmt.Fprintln(m.file, logString)
-	if err != nil {
-		m.runenv.RecordMessage("Error writing message history entry: %s", err)
+	m.lock.Lock()
+	defer m.lock.Unlock()
+	if m.closed || (!m.recordAll && len(m.entries) > 0) {
 		return
 	}
-
-	// only log once
-	m.shouldLog = false
+	if len(m.entries) >= m.maxEntries {
+		if m.dropped == 0 {
+			m.runenv.RecordMessage(
+				"Warning: message history reached the limit of %d entries, dropping further messages of this run",
+				m.maxEntries,
+			)
+		}
+		m.dropped++
+		return
+	}
+	wants := make([]cid.Cid, len(wantlist))
+	for index, entry := range wantlist {
+		wants[index] = entry.Cid
+	}
+	m.entries = append(m.entries, messageHistoryEntry{timestamp, pid, wants})
 }
 
 func (m *MessageHistoryRecorder) MessageSent(pid peer.ID, msg bsmsg.BitSwapMessage) {
 
 }
 
+// Close stops recording and writes the recorded messages to the message history file.
+func (m *MessageHistoryRecorder) Close() error {
+	m.lock.Lock()
+	entries := m.entries
+	dropped := m.dropped
+	m.entries = nil
+	m.closed = true
+	m.lock.Unlock()
+
+	if dropped > 0 {
+		m.runenv.RecordMessage("Dropped %d message history entries beyond the limit of %d", dropped, m.maxEntries)
+	}
+
+	writer := bufio.NewWriterSize(m.file, 64*1024)
+	buf := make([]byte, 0, 512)
+	for _, entry := range entries {
+		buf = appendMessageHistoryEntry(buf[:0], m.meta, m.host, entry)
+		if _, err := writer.Write(buf); err != nil {
+			m.file.Close()
+			return fmt.Errorf("Error writing message history entry: %w", err)
+		}
+	}
+	if err := writer.Flush(); err != nil {
+		m.file.Close()
+		return fmt.Errorf("Error writing message history: %w", err)
+	}
+	return m.file.Close()
+}
+
+// appendMessageHistoryEntry encodes an entry in the same format the message history was always written in.
+func appendMessageHistoryEntry(buf []byte, meta string, host string, entry messageHistoryEntry) []byte {
+	buf = append(buf, `{ "meta": "`...)
+	buf = append(buf, meta...)
+	buf = append(buf, `", "receiver": "`...)
+	buf = append(buf, host...)
+	buf = append(buf, `", "ts": "`...)
+	buf = strconv.AppendInt(buf, entry.timestamp, 10)
+	buf = append(buf, `", "sender": "`...)
+	buf = append(buf, entry.sender.String()...)
+	buf = append(buf, `", "message": { "wants": [`...)
+	for index, want := range entry.wants {
+		if index > 0 {
+			buf = append(buf, ", "...)
+		}
+		buf = append(buf, '"')
+		buf = append(buf, want.String()...)
+		buf = append(buf, '"')
+	}
+	buf = append(buf, "] } }\n"...)
+	return buf
+}
+
+// NewMessageHistoryRecorder creates a recorder for the messages received during a run. If recordAll is set, it records
+// every want message up to maxEntries, the max_recorded_messages parameter, instead of only the first one.
 func NewMessageHistoryRecorder(
 	runenv *runtime.RunEnv,
 	meta string,
 	host string,
-) *MessageHistoryRecorder {
+	recordAll bool,
+	maxEntries int,
+) (*MessageHistoryRecorder, error) {
+	if recordAll && maxEntries <= 0 {
+		return nil, fmt.Errorf("max_recorded_messages must be positive, got %d", maxEntries)
+	}
 	file, err := os.OpenFile(
 		runenv.TestOutputsPath+"/messageHistory.out",
 		os.O_WRONLY|os.O_CREATE|os.O_APPEND,
 		0755,
 	)
 	if err != nil {
-		runenv.RecordMessage("Error creating message history file: %s", err)
-		return nil
+		return nil, fmt.Errorf("Error creating message history file: %w", err)
+	}
+	capacity := 1
+	if recordAll {
+		// Preallocate for the wants of a typical run, the slice grows beyond that if needed
+		capacity = 1024
+		if maxEntries < capacity {
+			capacity = maxEntries
+		}
+	} else {
+		maxEntries = 1
 	}
-	return &MessageHistoryRecorder{runenv, file, meta, host, true}
-
+	return &MessageHistoryRecorder{
+		runenv:     runenv,
+		file:       file,
+		meta:       meta,
+		host:       host,
+		recordAll:  recordAll,
+		maxEntries: maxEntries,
+		entries:    make([]messageHistoryEntry, 0, capacity),
+	}, nil
 }
 
+// globalInfoRecorder collects the info entries in a buffer that is only written to globalInfo.out when flushed.
 type globalInfoRecorder struct {
 	runenv *runtime.RunEnv
 	file   *os.File
-}
 
-func (g globalInfoRecorder) RecordInfoWithMeta(meta string, info string) {
-	infoType := "LeechInfo"
-	msgString := fmt.Sprintf(
-		"{ \"meta\": \"%s\", \"timestamp\": \"%d\", \"type\": \"%s\", %s }",
-		meta,
-		time.Now().UnixMicro(),
-		infoType,
-		info,
-	)
-	_, err := fmt.Fprintln(g.file, msgString)
+	lock gosync.Mutex
+	buf  []byte
+}
+
+func (g *globalInfoRecorder) RecordInfoWithMeta(meta string, info string) {
+	timestamp := time.Now().UnixMicro()
+	g.lock.Lock()
+	defer g.lock.Unlock()
+	g.buf = append(g.buf, `{ "meta": "`...)
+	g.buf = append(g.buf, meta...)
+	g.buf = append(g.buf, `", "timestamp": "`...)
+	g.buf = strconv.AppendInt(g.buf, timestamp, 10)
+	g.buf = append(g.buf, `", "type": "LeechInfo", `...)
+	g.buf = append(g.buf, info...)
+	g.buf = append(g.buf, " }\n"...)
+}
+
+func (g *globalInfoRecorder) RecordNodeInfo(info string) {
+	timestamp := time.Now().UnixMicro()
+	g.lock.Lock()
+	defer g.lock.Unlock()
+	g.buf = append(g.buf, `{ "timestamp": "`...)
+	g.buf = strconv.AppendInt(g.buf, timestamp, 10)
+	g.buf = append(g.buf, `", "type": "NodeInfo", `...)
+	g.buf = append(g.buf, info...)
+	g.buf = append(g.buf, " }\n"...)
+}
+
+// Flush writes the buffered entries to the global info file in a single write.
+func (g *globalInfoRecorder) Flush() error {
+	g.lock.Lock()
+	defer g.lock.Unlock()
+	if len(g.buf) == 0 {
+		return nil
+	}
+	_, err := g.file.Write(g.buf)
+	g.buf = g.buf[:0]
 	if err != nil {
 		g.runenv.RecordMessage("Error writing global info: %s", err)
-		return
+		return err
 	}
+	return nil
 }
 
-func (g globalInfoRecorder) RecordNodeInfo(info string) {
-	infoType := "NodeInfo"
-	msgString := fmt.Sprintf(
-		"{ \"timestamp\": \"%d\", \"type\": \"%s\", %s }",
-		time.Now().UnixMicro(),
-		infoType,
-		info,
-	)
-	_, err := fmt.Fprintln(g.file, msgString)
-	if err != nil {
-		g.runenv.RecordMessage("Error writing global info: %s", err)
-		return
+// Close flushes the buffered entries and closes the global info file.
+func (g *globalInfoRecorder) Close() error {
+	err := g.Flush()
+	if closeErr := g.file.Close(); err == nil {
+		err = closeErr
 	}
+	return err
 }
 
-func NewGlobalInfoRecorder(runenv *runtime.RunEnv) utils.GlobalInfoRecorder {
+func NewGlobalInfoRecorder(runenv *runtime.RunEnv) (utils.GlobalInfoRecorder, error) {
 	file, err := os.OpenFile(
 		runenv.TestOutputsPath+"/globalInfo.out",
 		os.O_WRONLY|os.O_CREATE|os.O_APPEND,
 		0755,
 	)
 	if err != nil {
-		runenv.RecordMessage("Error creating global info file: %s", err)
-		return nil
+		return nil, fmt.Errorf("Error creating global info file: %w", err)
 	}
-	return &globalInfoRecorder{runenv, file}
+	return &globalInfoRecorder{runenv: runenv, file: file, buf: make([]byte, 0, 4096)}, nil
 }
@@ -184,7 +184,11 @@ func BitswapTransferTrickleTest(runenv *runtime.RunEnv, initCtx *run.InitContext
 		return err
 	}
 
-	globalInfoRecorder := NewGlobalInfoRecorder(runenv)
+	globalInfoRecorder, err := NewGlobalInfoRecorder(runenv)
+	if err != nil {
+		return err
+	}
+	defer globalInfoRecorder.Close()
 
 	// Run test with different topologies
 	runenv.RecordMessage("Running test with %v eavesdroppers", testVars.EavesdropperCount)
@@ -247,9 +251,10 @@ func BitswapTransferTrickleTest(runenv *runtime.RunEnv, initCtx *run.InitContext
 		// Log node info
 		globalInfoRecorder.RecordNodeInfo(
 			fmt.Sprintf(
-				"\"nodeId\": \"%s\", \"nodeType\": \"%s\", \"dialer\": \"%s\", \"exType\": \"trickle\", \"eavesCount\": \"%d\"",
+				"\"nodeId\": \"%s\", \"nodeType\": \"%s\", \"nodeTypeIndex\": \"%d\", \"dialer\": \"%s\", \"exType\": \"trickle\", \"eavesCount\": \"%d\"",
 				h.ID().String(),
 				nodeTestData.NodeType.String(),
+				nodeTestData.TypeIndex,
 				testVars.Dialer,
 				testVars.EavesdropperCount,
 			),
@@ -382,11 +387,16 @@ func BitswapTransferTrickleTest(runenv *runtime.RunEnv, initCtx *run.InitContext
 				nodeTestData.TypeIndex,
 			)
 
-			messageHistoryRecorder := NewMessageHistoryRecorder(
+			messageHistoryRecorder, err := NewMessageHistoryRecorder(
 				runenv,
 				meta,
 				nodeTestData.Node.Host().ID().String(),
+				testVars.RecordAllMessages,
+				testVars.MaxRecordedMessages,
 			)
+			if err != nil {
+				return err
+			}
 
 			nodeTestData.Node.Instance().Server.Tracer = messageHistoryRecorder
 
@@ -526,6 +536,14 @@ func BitswapTransferTrickleTest(runenv *runtime.RunEnv, initCtx *run.InitContext
 				return err
 			}
 
+			// Write the recorded messages and infos now that the measurements of the run are done
+			if err := messageHistoryRecorder.Close(); err != nil {
+				runenv.RecordMessage("%s", err)
+			}
+			if err := globalInfoRecorder.Flush(); err != nil {
+				return err
+			}
+
 			/// --- Report stats
 			err = nodeTestData.EmitMetrics(runenv, meta, timeToFetch, tcpFetch, leechFails)
 			if err != nil {
@@ -40,4 +40,6 @@ type MessageRecorder interface {
 type GlobalInfoRecorder interface {
 	RecordNodeInfo(info string)
 	RecordInfoWithMeta(meta string, info string)
+	Flush() error
+	Close() error
 }
@@ -0,0 +1,313 @@
+import json
+import os
+
+import pandas as pd
+
+import bootstrap
+import instrumentation
+import message_metrics_analysis
+import prediction_analysis
+import propagation
+import result_cache
+import sketches
+import throughput_analysis
+
+# Bump whenever the layout of the aggregates changes to force recomputing them for all experiments
+AGGREGATES_VERSION = 6
+AGGREGATES_DIR = os.path.join(result_cache.CACHE_DIR, "aggregates")
+
+# Columns identifying a cell of the prediction counts, the dialer is needed to split them up per PDF
+PREDICTION_KEYS = prediction_analysis.keys + ["dialer"]
+
+# Columns identifying the quantile sketch of the time to fetch of a cell
+SKETCH_KEYS = ["experiment", "dialer", "exType", "eavesCount", "latencyMS", "fileSize", "tricklingDelay", "meta"]
+
+# Columns identifying the quantile sketch of the delay of the forwarding hops at one depth of a cell
+HOP_SKETCH_KEYS = ["experiment", "dialer", "exType", "eavesCount", "latencyMS", "fileSize", "tricklingDelay", "depth"]
+
+# Columns of every aggregate, used for the aggregates of experiments without any matching results
+AGGREGATE_COLUMNS = {
+    "ttf_samples": ["experiment", "dialer", "exType", "eavesCount", "latencyMS", "fileSize", "tricklingDelay",
+                    "permutationIndex", "run", "seq", "nodeType", "meta", "value"],
+    "ttf_sketches": SKETCH_KEYS + ["bucket", "count"],
+    "message_counters": ["exType", "latencyMS", "fileSize", "tricklingDelay", "eavesCount", "dialer", "experiment",
+                         "meta", "sum", "count"],
+    "message_samples": ["exType", "latencyMS", "fileSize", "tricklingDelay", "eavesCount", "dialer", "experiment",
+                        "permutationIndex", "run", "meta", "sum", "count"],
+    "prediction_counts": PREDICTION_KEYS + ["hits", "targets"],
+    "estimator_counts": PREDICTION_KEYS + ["hits", "targets", "estimator"],
+    "hop_sketches": HOP_SKETCH_KEYS + ["bucket", "count"],
+    "want_spread": propagation.KEY + propagation.CELL_COLUMNS + ["source", "nodes", "connected", "eavesdroppers",
+                                                                 "maxDepth", "depthSum", "spread", "reachedBeforeFetch"],
+}
+
+
+def _empty(name):
+    return pd.DataFrame(columns=AGGREGATE_COLUMNS[name])
+
+
+def compute(results):
+    """
+    Compute the aggregates the figures are rendered from. Every row of an aggregate belongs to a single experiment, so
+    the aggregates of several sets of experiments can be merged by concatenating them.
+    :param results: a dict mapping every output file to its typed dataframe, see result_cache.load
+    :return: a dict mapping the name of every aggregate to its dataframe
+    """
+    metrics = results["results.out"]
+    messages = results["messageHistory.out"]
+    info_items = results["globalInfo.out"]
+    aggregates = {name: _empty(name) for name in AGGREGATE_COLUMNS.keys()}
+
+    if len(metrics) > 0:
+        # The samples are kept as they are, since the time to fetch is plotted sample by sample
+        leech = metrics[(metrics["nodeType"] == "Leech") & metrics["meta"].isin(["time_to_fetch", "tcp_fetch"])]
+        aggregates["ttf_samples"] = leech[AGGREGATE_COLUMNS["ttf_samples"]].reset_index(drop=True)
+        aggregates["ttf_sketches"] = sketches.create_sketches(leech, SKETCH_KEYS, "value")
+        aggregates["message_counters"] = message_metrics_analysis.count_messages(
+            metrics, ["eavesCount", "dialer", "experiment"])[AGGREGATE_COLUMNS["message_counters"]]
+        # The counters of every run are the samples the message counts of two sets of results are compared with
+        aggregates["message_samples"] = message_metrics_analysis.count_messages(
+            metrics, ["eavesCount", "dialer", "experiment", "permutationIndex", "run"])[
+            AGGREGATE_COLUMNS["message_samples"]]
+
+    if len(messages) > 0 and len(info_items) > 0:
+        # Only consider the messages received by Eavesdropper nodes
+        eavesdropper_messages = messages[messages["nodeType"] == "Eavesdropper"]
+        if len(eavesdropper_messages) > 0:
+            aggregates["prediction_counts"] = prediction_analysis.create_prediction_counts(
+                eavesdropper_messages, info_items, PREDICTION_KEYS)
+            aggregates["estimator_counts"] = prediction_analysis.create_estimator_counts(
+                eavesdropper_messages, info_items, messages, PREDICTION_KEYS)
+
+        # The hops of the wants through all nodes are only kept summarized, per want and as sketches of their delays
+        hops = propagation.build_hops(messages, info_items, metrics if len(metrics) > 0 else None)
+        aggregates["hop_sketches"] = sketches.create_sketches(hops.dropna(subset=["depth"]), HOP_SKETCH_KEYS,
+                                                              "hopDelay")
+        aggregates["want_spread"] = propagation.summarize_wants(hops)[AGGREGATE_COLUMNS["want_spread"]]
+
+    return aggregates
+
+
+def _fingerprints(files):
+    """
+    Group the cached output files by experiment
+    :param files: the cached files, see result_cache.cached_files
+    :return: a dict mapping every experiment to the sorted list of the path, modification time and size of its files
+    """
+    fingerprints = {}
+    for path, f in sorted(files.items()):
+        fingerprints.setdefault(f["experiment"], []).append([path, f["mtime"], f["size"]])
+    return fingerprints
+
+
+def _read_manifest(aggregates_dir):
+    try:
+        with open(os.path.join(aggregates_dir, "manifest.json"), 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != AGGREGATES_VERSION:
+        return {}
+    return manifest.get("experiments", {})
+
+
+def _write_manifest(aggregates_dir, experiments):
+    tmp_path = os.path.join(aggregates_dir, "manifest.json.tmp")
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump({"version": AGGREGATES_VERSION, "experiments": experiments}, manifest_file)
+    os.replace(tmp_path, os.path.join(aggregates_dir, "manifest.json"))
+
+
+def _read_aggregate(aggregates_dir, name):
+    path = os.path.join(aggregates_dir, name + ".parquet")
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def load_aggregate(results_dir, name, dialer=None):
+    """
+    Load an aggregate as written by the last update, without loading any results
+    :param results_dir: the directory containing the testground results
+    :param name: the name of the aggregate
+    :param dialer: only load the rows of this dialer, all rows by default
+    :return: the dataframe of the aggregate, empty if it wasn't computed yet
+    """
+    path = os.path.join(results_dir, AGGREGATES_DIR, name + ".parquet")
+    if not os.path.exists(path):
+        return _empty(name)
+    if dialer is None:
+        return pd.read_parquet(path)
+    # Only the row groups holding the dialer are read
+    return pd.read_parquet(path, filters=[("dialer", "==", dialer)])
+
+
+def load_ttf_quantiles(results_dirs, keys=None, qs=(0.5, 0.95, 0.99)):
+    """
+    Get quantiles of the time to fetch of the experiments of one or more result directories by merging their sketches
+    :param results_dirs: the directories containing the testground results, whose aggregates are up to date
+    :param keys: the columns identifying a cell, the keys of the sketches without the experiment by default
+    :param qs: the quantiles to get, between 0 and 1
+    :return: a dataframe with the keys, the number of samples and the quantiles in ns, see sketches.quantiles
+    """
+    keys = [key for key in SKETCH_KEYS if key != "experiment"] if keys is None else keys
+    ttf_sketches = [load_aggregate(results_dir, "ttf_sketches") for results_dir in results_dirs]
+    return sketches.quantiles([df for df in ttf_sketches if len(df) > 0] or [_empty("ttf_sketches")], keys, qs)
+
+
+def _write_aggregate(aggregates_dir, name, df):
+    path = os.path.join(aggregates_dir, name + ".parquet")
+    tmp_path = path + ".tmp"
+    df.reset_index(drop=True).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _concat(dfs, name):
+    dfs = [df for df in dfs if len(df) > 0]
+    if len(dfs) == 0:
+        return _empty(name)
+    return pd.concat(dfs, ignore_index=True)
+
+
+def update(results_dir, processes=None):
+    """
+    Update the aggregates of the results directory, only computing the contribution of the experiments that were added
+    or changed since the last update. The aggregates live in the .cache/aggregates folder of the results directory.
+    :param results_dir: the directory containing the testground results
+    :param processes: the number of worker processes used to parse new results
+    :return: a tuple of a dict mapping the name of every aggregate to its dataframe, and a dict mapping the name of
+    every aggregate to its rows that were added or removed by the update
+    """
+    # Bring the cache up to date without reading any frames from it
+    result_cache.load(results_dir, kinds=[], processes=processes)
+    fingerprints = _fingerprints(result_cache.cached_files(results_dir))
+
+    aggregates_dir = os.path.join(results_dir, AGGREGATES_DIR)
+    os.makedirs(aggregates_dir, exist_ok=True)
+    cached = {name: _read_aggregate(aggregates_dir, name) for name in AGGREGATE_COLUMNS.keys()}
+    cached_fingerprints = _read_manifest(aggregates_dir)
+    if any(df is None for df in cached.values()):
+        # Without all aggregates the state is unusable, so everything is computed again
+        cached = {name: _empty(name) for name in AGGREGATE_COLUMNS.keys()}
+        cached_fingerprints = {}
+
+    changed = {e for e, f in fingerprints.items() if cached_fingerprints.get(e) != f}
+    changed |= {e for e in cached_fingerprints.keys() if e not in fingerprints}
+    if len(changed) == 0:
+        return cached, {name: _empty(name) for name in AGGREGATE_COLUMNS.keys()}
+
+    # Only read the results of the changed experiments from the cache. The messages can't be narrowed down to the
+    # eavesdroppers: the propagation index follows the wants through all nodes, the estimator counts fall back to the
+    # overlay seen in the messages of all nodes and the message counters sum up the metrics of all nodes.
+    results = result_cache.load(results_dir, filters={"experiment": changed})
+    with instrumentation.stage("aggregates", experiments=len(changed)) as measurement:
+        measurement["records"] = sum(len(df) for df in results.values())
+        new = compute(results)
+
+        aggregates = {}
+        changes = {}
+        for name in AGGREGATE_COLUMNS.keys():
+            stale = cached[name]["experiment"].isin(changed)
+            aggregates[name] = _concat([cached[name][~stale], new[name]], name)
+            changes[name] = _concat([cached[name][stale], new[name]], name)
+            _write_aggregate(aggregates_dir, name, aggregates[name])
+        _write_manifest(aggregates_dir, fingerprints)
+
+    return aggregates, changes
+
+
+# Columns identifying a cell of the exported time to fetch and message tables
+CELL_KEYS = ["dialer", "eavesCount", "exType", "latencyMS", "fileSize", "tricklingDelay"]
+
+
+def create_tables(merged):
+    """
+    Create the tables of computed numbers from the aggregates, e.g. to export them for dashboards
+    :param merged: the aggregates returned by update
+    :return: a dict mapping the name of every table to its dataframe
+    """
+    ttf_columns = CELL_KEYS + ["metric", "count", "mean_ms", "median_ms", "min_ms", "max_ms", "mean_low_ms",
+                               "mean_high_ms", "median_low_ms", "median_high_ms", "p95_ms", "p99_ms"]
+    samples = merged["ttf_samples"]
+    if len(samples) > 0:
+        samples = samples.assign(value=samples["value"].astype(float) / 1e6).rename(columns={"meta": "metric"})
+        ttf = samples.groupby(CELL_KEYS + ["metric"], dropna=False)["value"].agg(
+            ["count", "mean", "median", "min", "max"]).reset_index()
+        intervals = bootstrap.bootstrap_statistics(samples, CELL_KEYS + ["metric"], "value")
+        intervals = intervals[CELL_KEYS + ["metric", "mean_low", "mean_high", "median_low", "median_high"]]
+        ttf = ttf.merge(intervals, on=CELL_KEYS + ["metric"], how="left")
+        # The tail quantiles come from the sketches, which are accurate however few samples a cell has
+        tails = sketches.quantiles(merged["ttf_sketches"], CELL_KEYS + ["meta"], (0.95, 0.99))
+        tails = tails.rename(columns={"meta": "metric"}).drop(columns="count")
+        tails[["p95", "p99"]] = tails[["p95", "p99"]] / 1e6
+        ttf = ttf.merge(tails, on=CELL_KEYS + ["metric"], how="left")
+        ttf.columns = ttf_columns
+    else:
+        ttf = pd.DataFrame(columns=ttf_columns)
+
+    message_columns = CELL_KEYS + ["metric", "sum", "count", "average"]
+    counters = merged["message_counters"]
+    if len(counters) > 0:
+        counters = counters.rename(columns={"meta": "metric"})
+        messages = counters.groupby(CELL_KEYS + ["metric"], dropna=False)[["sum", "count"]].sum().reset_index()
+        messages["average"] = messages["sum"] / messages["count"]
+    else:
+        messages = pd.DataFrame(columns=message_columns)
+
+    prediction_columns = PREDICTION_KEYS + ["estimator", "hits", "targets", "rate", "rate_low", "rate_high"]
+    counts = [merged["prediction_counts"].assign(estimator="First Timestamp"), merged["estimator_counts"]]
+    counts = [df for df in counts if len(df) > 0]
+    if len(counts) > 0:
+        counts = pd.concat(counts, ignore_index=True)
+        predictions = counts.groupby(PREDICTION_KEYS + ["estimator"], dropna=False)[["hits", "targets"]].sum()
+        predictions = predictions.reset_index()
+        predictions["rate"] = predictions["hits"] / predictions["targets"]
+        predictions = bootstrap.add_rate_intervals(predictions)
+    else:
+        predictions = pd.DataFrame(columns=prediction_columns)
+
+    if len(samples) > 0 and len(counters) > 0:
+        costs = throughput_analysis.create_cost_dataframe(merged["ttf_samples"], merged["message_counters"], CELL_KEYS)
+    else:
+        costs = pd.DataFrame(columns=CELL_KEYS)
+
+    hop_columns = CELL_KEYS + ["depth", "hops", "median_ms", "p95_ms"]
+    if len(merged["hop_sketches"]) > 0:
+        hops = sketches.quantiles(merged["hop_sketches"], CELL_KEYS + ["depth"], (0.5, 0.95))
+        hops = hops.rename(columns={"count": "hops"}).assign(median_ms=hops["p50"] / 1e6, p95_ms=hops["p95"] / 1e6)
+    else:
+        hops = pd.DataFrame(columns=hop_columns)
+
+    if len(merged["want_spread"]) > 0:
+        spread = propagation.path_lengths(merged["want_spread"], CELL_KEYS)
+    else:
+        spread = pd.DataFrame(columns=CELL_KEYS)
+
+    return {"ttf": ttf, "messages": messages[message_columns], "prediction_rates": predictions[prediction_columns],
+            "costs": costs, "hop_delays": hops[hop_columns], "spread": spread}
+
+
+# File extension and writer of every export format
+export_formats = {
+    "csv": ("csv", lambda df, path: df.to_csv(path, index=False)),
+    "json": ("json", lambda df, path: df.to_json(path, orient="records", indent=2)),
+    "parquet": ("parquet", lambda df, path: df.to_parquet(path, index=False)),
+}
+
+
+def export_tables(tables, target_dir, file_format="csv"):
+    """
+    Write tables to files
+    :param tables: a dict mapping the name of every table to its dataframe, see create_tables
+    :param target_dir: the directory to write the files to
+    :param file_format: the format of the files, one of csv, json or parquet
+    :return: the paths of the written files
+    """
+    extension, write = export_formats[file_format]
+    os.makedirs(target_dir, exist_ok=True)
+    paths = []
+    for name, df in tables.items():
+        path = os.path.join(target_dir, f"{name}.{extension}")
+        write(df, path)
+        paths.append(path)
+    return paths
@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Time the stages of the analysis pipeline on synthetic results')
+    parser.add_argument('--runs', type=int, nargs='+', default=[5, 10, 20, 40], help='''
+                        Runs per permutation of every scale to benchmark
+                        ''')
+    parser.add_argument('--eaves', type=int, nargs='+', default=[0, 1, 4, 7], help='Eavesdropper counts')
+    parser.add_argument('--delays', type=int, nargs='+', default=[0, 50, 100, 150, 200, 250, 300],
+                        help='Trickling delays in ms')
+    parser.add_argument('--latencies', type=int, nargs='+', default=[50, 100, 150], help='Latencies in ms')
+    parser.add_argument('--file-sizes', type=int, nargs='+', default=[512], help='File sizes in bytes')
+    parser.add_argument('--stages', nargs='+', default=list(stages.keys()), help='''
+                        Stages to benchmark. Available: {}
+                        '''.format(', '.join(stages.keys())))
+    parser.add_argument('--no-memory', action='store_true', help='''
+                        Don't measure the peak memory, which runs every stage a second time in a single process under
+                        tracemalloc
+                        ''')
+    parser.add_argument('-o', '--output', type=str, help='Write the measurements as JSON to this file')
+    parser.add_argument('--plot', type=str, help='Write the scaling curves as PDF to this file')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated results directories')
+    return parser.parse_args()
+
+
+def stage_load(results_dir, state):
+    import process
+    kinds = list(process.line_processors.keys())
+    results = process.load_result_records(process.find_result_files(results_dir, kinds), kinds,
+                                          state.get('processes'))
+    return sum(len(records) for records in results.values())
+
+
+def stage_cache_cold(results_dir, state):
+    import result_cache
+    shutil.rmtree(os.path.join(results_dir, result_cache.CACHE_DIR), ignore_errors=True)
+    frames = result_cache.load(results_dir, processes=state.get('processes'))
+    return sum(len(df) for df in frames.values())
+
+
+def stage_cache_warm(results_dir, state):
+    import result_cache
+    state['frames'] = result_cache.load(results_dir)
+    return sum(len(df) for df in state['frames'].values())
+
+
+def _eavesdropper_frames(state):
+    messages = state['frames']['messageHistory.out']
+    info = state['frames']['globalInfo.out']
+    return messages[messages['nodeType'] == 'Eavesdropper'], info
+
+
+def stage_estimation(results_dir, state):
+    import prediction_analysis
+    messages, info = _eavesdropper_frames(state)
+    prediction_analysis.create_prediction_rates_dataframe(messages, info)
+    return len(messages)
+
+
+def stage_estimators(results_dir, state):
+    import prediction_analysis
+    messages, info = _eavesdropper_frames(state)
+    prediction_analysis.create_estimator_rates_dataframe(messages, info, state['frames']['messageHistory.out'])
+    return len(messages)
+
+
+def stage_dataframes(results_dir, state):
+    import message_metrics_analysis
+    import ttf_analysis
+    metrics = state['frames']['results.out']
+    ttf_analysis.create_ttf_dataframe(metrics, 0, False)
+    message_metrics_analysis.create_average_messages_dataframe_compact(metrics, 0)
+    return len(metrics)
+
+
+def stage_render(results_dir, state):
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    import pdf
+    # Render every figure, otherwise the second run of a measurement skips all of them as their data didn't change.
+    # The figures don't map to a number of records, so the stage has no throughput.
+    pdf.create_pdfs(results_dir, processes=state.get('processes'), force=True)
+    plt.close('all')
+    return None
+
+
+# Stages of the pipeline in the order they run in pdf.py. The cached frames of the warm cache stage are used by the
+# stages after it. The number of worker processes of the stages that use a process pool is taken from the state.
+stages = {
+    'load': stage_load,
+    'cache_cold': stage_cache_cold,
+    'cache_warm': stage_cache_warm,
+    'estimation': stage_estimation,
+    'estimators': stage_estimators,
+    'dataframes': stage_dataframes,
+    'render': stage_render,
+}
+
+
+def measure(stage, results_dir, state, memory=True):
+    """
+    Run a stage and measure its wall time and, optionally, its peak memory in a second run. tracemalloc only sees the
+    allocations of the current process, so the second run doesn't spread its work over worker processes.
+    :param stage: the stage function
+    :param results_dir: the directory containing the results
+    :param state: the state shared between the stages
+    :param memory: whether to measure the peak memory
+    :return: a dict with the seconds, the number of processed records (None if the stage has no throughput) and the
+    peak memory in MiB
+    """
+    start = time.perf_counter()
+    records = stage(results_dir, state)
+    seconds = time.perf_counter() - start
+
+    peak_mib = None
+    if memory:
+        state['processes'] = 1
+        tracemalloc.start()
+        try:
+            stage(results_dir, state)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            del state['processes']
+        peak_mib = peak / 2 ** 20
+    return {'seconds': seconds, 'records': records, 'peak_mib': peak_mib}
+
+
+def run_benchmark(runs, eaves_counts, delays, latencies, file_sizes, stage_names, memory=True, keep=False):
+    """
+    Benchmark the given stages on synthetic results of growing size
+    :param runs: the runs per permutation of every scale
+    :param eaves_counts: the eavesdropper counts
+    :param delays: the trickling delays in ms
+    :param latencies: the latencies in ms
+    :param file_sizes: the file sizes in bytes
+    :param stage_names: the names of the stages to run
+    :param memory: whether to measure the peak memory
+    :param keep: whether to keep the generated results directories
+    :return: a list with one measurement per scale and stage
+    """
+    import synthetic_results
+
+    measurements = []
+    for run_count in runs:
+        results_dir = tempfile.mkdtemp(prefix=f'bitswap-benchmark-{run_count}-')
+        synthetic_results.generate(results_dir, run_count, eaves_counts, delays, latencies, file_sizes,
+                                   ['center', 'edge'])
+        size = sum(os.path.getsize(os.path.join(subdir, f)) for subdir, _, files in os.walk(results_dir)
+                   for f in files)
+        state = {}
+        for name in stages.keys():
+            # The stages after the warm cache need its frames, even if it is not benchmarked itself
+            if name not in stage_names:
+                if name == 'cache_warm' and any(n in stage_names for n in ['estimation', 'estimators', 'dataframes']):
+                    stage_cache_warm(results_dir, state)
+                continue
+            result = measure(stages[name], results_dir, state, memory)
+            result.update({'runs': run_count, 'stage': name, 'input_mib': size / 2 ** 20})
+            measurements.append(result)
+            print_measurement(result)
+        if keep:
+            print(f"Kept results in {results_dir}")
+        else:
+            shutil.rmtree(results_dir)
+    return measurements
+
+
+def print_measurement(m):
+    peak = '-' if m['peak_mib'] is None else f"{m['peak_mib']:.1f}"
+    records = ''
+    if m['records'] is not None:
+        throughput = m['records'] / m['seconds'] if m['seconds'] > 0 else 0
+        records = f"  records={m['records']:<9} ({throughput:,.0f}/s)"
+    print(f"runs={m['runs']:<4} input={m['input_mib']:8.1f} MiB  {m['stage']:<11} {m['seconds']:8.3f} s  "
+          f"peak={peak:>8} MiB{records}")
+
+
+def plot_scaling(measurements, path):
+    """
+    Plot the wall time of every stage over the input size
+    :param measurements: the measurements returned by run_benchmark
+    :param path: the path of the PDF to write
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for name in stages.keys():
+        points = [(m['input_mib'], m['seconds']) for m in measurements if m['stage'] == name]
+        if len(points) > 0:
+            ax.plot(*zip(*points), marker='o', label=name)
+    ax.set(xscale='log', yscale='log', xlabel='Input size (MiB)', ylabel='Wall time (s)')
+    ax.legend()
+    fig.savefig(path, bbox_inches='tight')
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = run_benchmark(args.runs, args.eaves, args.delays, args.latencies, args.file_sizes, args.stages,
+                            not args.no_memory, args.keep)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.plot:
+        plot_scaling(results, args.plot)
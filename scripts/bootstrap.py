@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+# Default number of resamples drawn per cell
+N_RESAMPLES = 2000
+
+# Maximum number of resampled values held in memory at once, the resamples are drawn in chunks below it
+MAX_CHUNK_SIZE = 1 << 22
+
+
+def _percentiles(confidence):
+    alpha = (1 - confidence) / 2
+    return [100 * alpha, 100 * (1 - alpha)]
+
+
+def _resample(values, sizes, statistics, n_resamples, rng):
+    """
+    Draw the resampled statistics of every cell
+    :param values: the samples sorted by cell and value
+    :param sizes: the number of samples of every cell, no cell is empty
+    :param statistics: the statistics to compute, mean and/or median
+    :param n_resamples: the number of resamples drawn per cell
+    :param rng: the random number generator
+    :return: a dict mapping every statistic to an array of its resampled values with a row per resample and a column
+    per cell, and a dict mapping every statistic to its point estimate of every cell
+    """
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    n = len(values)
+    lower_medians = offsets + (sizes - 1) // 2
+    upper_medians = offsets + sizes // 2
+
+    estimates = {}
+    if "mean" in statistics:
+        # Every sample position draws its replacement from the samples of its cell
+        position_offsets = np.repeat(offsets, sizes)
+        position_sizes = np.repeat(sizes, sizes)
+        estimates["mean"] = []
+        chunk = max(1, MAX_CHUNK_SIZE // n)
+        for start in range(0, n_resamples, chunk):
+            count = min(chunk, n_resamples - start)
+            indices = position_offsets + (rng.random((count, n)) * position_sizes).astype(np.int64)
+            estimates["mean"].append(np.add.reduceat(values[indices], offsets, axis=1) / sizes)
+        estimates["mean"] = np.concatenate(estimates["mean"])
+    if "median" in statistics:
+        # A resampled sample is the sample at the position of a uniform draw in the sorted samples of its cell, so the
+        # median of a resample only depends on the one or two middle order statistics of the uniform draws. The j-th
+        # smallest of k uniform draws follows Beta(j, k - j + 1), and the next one is spread over the rest of the unit
+        # interval by Beta(1, k - j), so the medians are drawn without drawing and sorting whole resamples.
+        lower_ranks = (sizes - 1) // 2 + 1
+        lower = rng.beta(lower_ranks, sizes - lower_ranks + 1, size=(n_resamples, len(sizes)))
+        upper = lower + (1 - lower) * rng.beta(1, np.maximum(sizes - lower_ranks, 1), size=(n_resamples, len(sizes)))
+        upper = np.where(sizes % 2 == 0, upper, lower)
+        lower_indices = offsets + np.minimum((lower * sizes).astype(np.int64), sizes - 1)
+        upper_indices = offsets + np.minimum((upper * sizes).astype(np.int64), sizes - 1)
+        estimates["median"] = (values[lower_indices] + values[upper_indices]) / 2
+
+    points = {}
+    if "mean" in statistics:
+        points["mean"] = np.add.reduceat(values, offsets) / sizes
+    if "median" in statistics:
+        points["median"] = (values[lower_medians] + values[upper_medians]) / 2
+    return estimates, points
+
+
+def bootstrap_statistics(df, keys, column, statistics=("mean", "median"), n_resamples=N_RESAMPLES, confidence=0.95,
+                         seed=0):
+    """
+    Compute percentile bootstrap confidence intervals of statistics of a column for every cell at once. The samples
+    of every cell are resampled with replacement within the cell, all cells are resampled together in NumPy arrays.
+    :param df: the dataframe holding the samples
+    :param keys: the columns identifying a cell
+    :param column: the column holding the samples, missing values are ignored
+    :param statistics: the statistics to compute, mean and/or median
+    :param n_resamples: the number of resamples drawn per cell
+    :param confidence: the confidence level of the intervals
+    :param seed: the seed of the random number generator, fixed by default so that the intervals are reproducible
+    :return: a dataframe with the keys, the number of samples and the point estimate, the lower and the upper bound of
+    every statistic, e.g. mean, mean_low and mean_high
+    """
+    df = df[keys + [column]].dropna(subset=[column])
+    # Sort the samples by cell and value, so that the indices of a cell are contiguous and sorting indices also sorts
+    # the values they point to
+    df = df.sort_values(keys + [column], kind="stable")
+    cells = df.groupby(keys, sort=False, observed=True, dropna=False).size()
+
+    result = cells.rename("samples").reset_index()
+    if len(df) == 0:
+        for statistic in statistics:
+            result[statistic] = result[statistic + "_low"] = result[statistic + "_high"] = np.nan
+        return result
+
+    resampled, points = _resample(df[column].to_numpy(dtype=float), cells.to_numpy(), statistics, n_resamples,
+                                  np.random.default_rng(seed))
+    for statistic in statistics:
+        low, high = np.percentile(resampled[statistic], _percentiles(confidence), axis=0)
+        result[statistic] = points[statistic]
+        result[statistic + "_low"] = low
+        result[statistic + "_high"] = high
+    return result
+
+
+def _sorted_cell_samples(df, cells, keys, column):
+    df = df[keys + [column]].dropna(subset=[column]).merge(cells, on=keys)
+    df = df.sort_values(["cell", column], kind="stable")
+    return df[column].to_numpy(dtype=float), np.bincount(df["cell"].to_numpy(), minlength=len(cells))
+
+
+def bootstrap_difference(baseline, candidate, keys, column, statistic="median", n_resamples=N_RESAMPLES,
+                         confidence=0.95, seed=0):
+    """
+    Compute percentile bootstrap confidence intervals of the difference of a statistic between two sets of samples,
+    e.g. the results before and after a change, for every cell both sets have samples of. The two sets are resampled
+    independently of each other.
+    :param baseline: the dataframe holding the samples the difference is relative to
+    :param candidate: the dataframe holding the samples compared to the baseline
+    :param keys: the columns identifying a cell
+    :param column: the column holding the samples, missing values are ignored
+    :param statistic: the statistic to compare, mean or median
+    :param n_resamples: the number of resamples drawn per cell
+    :param confidence: the confidence level of the intervals
+    :param seed: the seed of the random number generator
+    :return: a dataframe with the keys, the number of samples and the statistic of both sets, and the difference of the
+    candidate to the baseline with its lower and upper bound
+    """
+    columns = keys + ["baseline_samples", "candidate_samples", "baseline", "candidate", "difference",
+                      "difference_low", "difference_high"]
+    baseline = baseline.dropna(subset=[column])
+    candidate = candidate.dropna(subset=[column])
+    cells = baseline[keys].drop_duplicates().merge(candidate[keys].drop_duplicates(), on=keys)
+    cells = cells.sort_values(keys, kind="stable").reset_index(drop=True)
+    if len(cells) == 0:
+        return pd.DataFrame(columns=columns)
+    cells["cell"] = np.arange(len(cells))
+
+    rng = np.random.default_rng(seed)
+    result = cells[keys].copy()
+    resampled = {}
+    for name, df in [("baseline", baseline), ("candidate", candidate)]:
+        values, sizes = _sorted_cell_samples(df, cells, keys, column)
+        result[name + "_samples"] = sizes
+        resampled[name], points = _resample(values, sizes, (statistic,), n_resamples, rng)
+        result[name] = points[statistic]
+    differences = resampled["candidate"][statistic] - resampled["baseline"][statistic]
+    result["difference"] = result["candidate"] - result["baseline"]
+    result["difference_low"], result["difference_high"] = np.percentile(differences, _percentiles(confidence), axis=0)
+    return result[columns]
+
+
+def bootstrap_rates(hits, targets, n_resamples=N_RESAMPLES, confidence=0.95, seed=0):
+    """
+    Compute percentile bootstrap confidence intervals of the rates of binary outcomes, e.g. correct predictions, for
+    every cell at once. Resampling the outcomes of a cell with replacement draws the number of hits from a binomial
+    distribution, so the outcomes don't need to be kept.
+    :param hits: the number of hits of every cell
+    :param targets: the number of outcomes of every cell
+    :param n_resamples: the number of resamples drawn per cell
+    :param confidence: the confidence level of the intervals
+    :param seed: the seed of the random number generator, fixed by default so that the intervals are reproducible
+    :return: a tuple of arrays with the lower and the upper bound of the rate of every cell, NaN for cells without
+    targets
+    """
+    hits = np.asarray(hits, dtype=float)
+    targets = np.asarray(targets, dtype=np.int64)
+    valid = targets > 0
+    rates = np.where(valid, hits / np.where(valid, targets, 1), 0)
+
+    rng = np.random.default_rng(seed)
+    low = np.full(len(targets), np.nan)
+    high = np.full(len(targets), np.nan)
+    if valid.any():
+        resampled = rng.binomial(targets[valid], rates[valid], size=(n_resamples, int(valid.sum())))
+        low[valid], high[valid] = np.percentile(resampled / targets[valid], _percentiles(confidence), axis=0)
+    return low, high
+
+
+def add_rate_intervals(df, hits="hits", targets="targets", n_resamples=N_RESAMPLES, confidence=0.95, seed=0):
+    """
+    Add the bootstrap confidence interval of the rate of every row of a dataframe of counts
+    :param df: the dataframe with the counts
+    :param hits: the column holding the number of hits
+    :param targets: the column holding the number of outcomes
+    :param n_resamples: the number of resamples drawn per row
+    :param confidence: the confidence level of the intervals
+    :param seed: the seed of the random number generator
+    :return: the dataframe with the additional columns rate_low and rate_high
+    """
+    low, high = bootstrap_rates(df[hits], df[targets], n_resamples, confidence, seed)
+    return df.assign(rate_low=pd.Series(low, index=df.index), rate_high=pd.Series(high, index=df.index))
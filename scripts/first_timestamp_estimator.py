@@ -1,27 +1,51 @@
 import os
 
+import pandas as pd
+
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
 
 class FirstTimestampEstimator:
     def __init__(self, messages):
         self.messages = messages
+        self.first_senders = build_first_sender_index(messages)
 
     def predict(self, permutation, run, cid):
-        run_messages = [m for m in self.messages if m['run'] == run and m['permutationIndex'] == permutation]
-        # filter messages related to target cid
-        cid_messages = [m for m in run_messages if cid in m['message']['wants']]
-        cid_messages.sort(key=lambda x: x['ts'])
-        if len(cid_messages) == 0:
+        first = self.first_senders.get((permutation, run, cid))
+        if first is None:
             return None
-        prediction = cid_messages[0]['sender']
+        prediction = first[1]
         return prediction
 
 
+def build_first_sender_index(messages):
+    """
+    Build an index holding the sender of the earliest message for every (permutationIndex, run, cid) in one pass
+    :param messages: The messages to index, either as parsed items or as typed dataframe
+    :return: A dict mapping (permutationIndex, run, cid) to a (ts, sender) tuple of the earliest message
+    """
+    if isinstance(messages, pd.DataFrame):
+        rows = zip(messages['permutationIndex'], messages['run'], messages['ts'], messages['sender'],
+                   messages['wants'])
+    else:
+        rows = ((m['permutationIndex'], m['run'], m['ts'], m['sender'], m['message']['wants']) for m in messages)
+
+    index = {}
+    for permutation, run, ts, sender, wants in rows:
+        ts = int(ts)
+        for cid in wants:
+            key = (permutation, run, cid)
+            first = index.get(key)
+            # Keep the first message seen on equal timestamps, like the stable sort did before
+            if first is None or ts < first[0]:
+                index[key] = (ts, sender)
+    return index
+
+
 def get_prediction_rate(messages, targets):
     """
     Calculate the prediction rate for a given set of messages and the targets containing info about the true source
-    :param messages: The messages to use for prediction
+    :param messages: The messages to use for prediction, either as parsed items or as typed dataframe
     :param targets: The targets containing info about the true source
     :return: The prediction rate
     """
@@ -37,3 +61,51 @@ def get_prediction_rate(messages, targets):
 
     # Return the prediction rate
     return correct_predictions / len(targets)
+
+
+def get_first_senders(messages):
+    """
+    Find the sender of the earliest message for every (experiment, permutationIndex, run, cid) at once
+    :param messages: The messages as typed dataframe
+    :return: A dataframe with the experiment, permutationIndex, run, cid, ts and sender of every earliest message
+    """
+    wanted = messages[['experiment', 'permutationIndex', 'run', 'ts', 'sender', 'wants']]
+    # One row per wanted CID, messages without wants don't predict anything
+    wanted = wanted.explode('wants').rename(columns={'wants': 'cid'}).dropna(subset=['cid'])
+    wanted = wanted.reset_index(drop=True)
+    # idxmin keeps the first message seen on equal timestamps
+    first = wanted.groupby(['experiment', 'permutationIndex', 'run', 'cid'], sort=False)['ts'].idxmin()
+    return wanted.loc[first.to_numpy()].reset_index(drop=True)
+
+
+def get_prediction_counts(messages, targets, keys):
+    """
+    Count the correct predictions and the targets of all cells at once by joining the first senders with the true
+    sources. Unlike rates, counts of disjoint sets of targets can be merged by summing them.
+    :param messages: The messages to use for prediction as typed dataframe
+    :param targets: The LeechInfo items containing info about the true source as typed dataframe
+    :param keys: The columns identifying a cell, e.g. eavesCount, latencyMS, experiment and tricklingDelay
+    :return: A dataframe with the keys, the number of correct predictions and of targets of every cell that has messages
+    and targets
+    """
+    first = get_first_senders(messages)[['experiment', 'permutationIndex', 'run', 'cid', 'sender']]
+    predictions = targets.merge(first, how='left', left_on=['experiment', 'permutationIndex', 'run', 'lookingFor'],
+                                right_on=['experiment', 'permutationIndex', 'run', 'cid'])
+    predictions['prediction_correct'] = (predictions['sender'] == predictions['peer']).fillna(False).astype(int)
+
+    counts = predictions.groupby(keys, sort=False)['prediction_correct'].agg(hits='sum', targets='size').reset_index()
+    # Only cells with messages get a prediction rate
+    cells = messages[keys].drop_duplicates()
+    return counts.merge(cells, on=keys)
+
+
+def get_prediction_rates(messages, targets, keys):
+    """
+    Calculate the prediction rates of all cells at once by joining the first senders with the true sources
+    :param messages: The messages to use for prediction as typed dataframe
+    :param targets: The LeechInfo items containing info about the true source as typed dataframe
+    :param keys: The columns identifying a cell, e.g. eavesCount, latencyMS, experiment and tricklingDelay
+    :return: A dataframe with the keys and the prediction rate of every cell that has messages and targets
+    """
+    counts = get_prediction_counts(messages, targets, keys)
+    return counts[keys].assign(rate=counts['hits'] / counts['targets'])
@@ -0,0 +1,188 @@
+import math
+import sys
+
+import pandas as pd
+
+# Attributes of the meta strings that hold integers
+INT_COLUMNS = ["permutationIndex", "run", "eavesCount", "latencyMS", "tricklingDelay", "seq", "fileSize",
+               "nodeTypeIndex"]
+
+# Columns holding nanosecond or microsecond timestamps
+TIMESTAMP_COLUMNS = ["ts", "timestamp"]
+_int_columns = frozenset(INT_COLUMNS + TIMESTAMP_COLUMNS)
+
+
+class Records:
+    """
+    Compact column-wise store of the items parsed from one kind of output file. Integer attributes are parsed once,
+    strings like peer IDs and CIDs are interned so that repeated values share one object, and the wanted CIDs of a
+    message are kept as a tuple instead of a nested dict. Attributes missing in an item are None.
+    """
+    __slots__ = ("kind", "columns", "length")
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.columns = {}
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, item):
+        """
+        Add an item returned by the line processors of process.py
+        :param item: the parsed item
+        """
+        columns = self.columns
+        length = self.length
+        for key, value in item.items():
+            if key == "message":
+                key, value = "wants", tuple(sys.intern(cid) for cid in value.get("wants", ()))
+            elif value.__class__ is str:
+                value = int(value) if key in _int_columns else sys.intern(value)
+            elif key in _int_columns and value is not None:
+                value = int(value)
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * length
+            column.append(value)
+        self.length = length + 1
+        # Pad the columns of attributes the item doesn't have
+        if len(item) != len(columns):
+            for column in columns.values():
+                if len(column) == length:
+                    column.append(None)
+
+    def extend(self, other):
+        """
+        Add all items of another store of the same kind
+        :param other: the other store
+        """
+        for key in other.columns.keys():
+            if key not in self.columns:
+                self.columns[key] = [None] * self.length
+        for key, column in self.columns.items():
+            column.extend(other.columns.get(key, [None] * other.length))
+        self.length += other.length
+
+
+def to_frame(kind, items):
+    """
+    Convert parsed items to a typed dataframe
+    :param kind: the name of the output file the items were parsed from
+    :param items: the items returned by the line processors of process.py, as list or Records
+    :return: the dataframe with integer meta attributes, int64 timestamps and the wanted CIDs as list column
+    """
+    if isinstance(items, Records):
+        df = pd.DataFrame({column: pd.array(values, dtype="Int64") if column in INT_COLUMNS else values
+                           for column, values in items.columns.items()})
+        if "wants" in df:
+            # Keep the wanted CIDs last, where they end up when converting items
+            df = df[[column for column in df.columns if column != "wants"] + ["wants"]]
+    else:
+        df = pd.DataFrame(items)
+        for column in INT_COLUMNS:
+            if column in df:
+                df[column] = pd.to_numeric(df[column]).astype("Int64")
+        if "message" in df:
+            df["wants"] = [m["wants"] for m in df["message"]]
+            df = df.drop(columns=["message"])
+    if kind == "results.out" and "value" in df:
+        df["value"] = df["value"].astype("float64")
+    if kind == "messageHistory.out" and len(df) > 0:
+        df["ts"] = df["ts"].astype("int64")
+    if kind == "globalInfo.out" and "timestamp" in df:
+        df["timestamp"] = df["timestamp"].astype("int64")
+    return df
+
+
+def to_items(kind, df):
+    """
+    Convert a typed dataframe back to the string-valued items the line processors of process.py return
+    :param kind: the name of the output file the frame was built from
+    :param df: the typed dataframe
+    :return: the list of items
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column].tolist()
+        if column in INT_COLUMNS or column in TIMESTAMP_COLUMNS:
+            values = [None if _is_missing(value) else str(value) for value in values]
+        columns[column] = values
+    if kind == "messageHistory.out" and "wants" in columns:
+        columns["message"] = [{"wants": list(wants)} for wants in columns.pop("wants")]
+
+    names = list(columns.keys())
+    items = [dict(zip(names, values)) for values in zip(*columns.values())]
+    # Attributes missing in a line are missing in its item as well
+    sparse_columns = [column for column in df.columns if column in columns and df[column].isna().any()]
+    for item in items:
+        for column in sparse_columns:
+            if _is_missing(item[column]):
+                del item[column]
+    return items
+
+
+def _is_missing(value):
+    return value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value))
+
+
+def ensure_frame(kind, data):
+    """
+    Get the typed dataframe of parsed results, converting lists of items or Records returned by process.py
+    :param kind: the name of the output file the results were parsed from
+    :param data: a typed dataframe, a list of items or Records
+    :return: the typed dataframe
+    """
+    if isinstance(data, pd.DataFrame):
+        return data
+    return to_frame(kind, data)
+
+
+def normalize_filters(filters):
+    """
+    Bring filters on the attributes of the parsed items into one form
+    :param filters: a dict mapping attributes like nodeType, dialer, eavesCount, exType or latencyMS to the value or the
+    collection of values to keep, or None to keep everything
+    :return: a dict mapping every attribute to the set of values to keep as strings, like they appear in the meta
+    strings
+    """
+    if not filters:
+        return {}
+    normalized = {}
+    for attr, values in filters.items():
+        if isinstance(values, (str, int)) or not hasattr(values, "__iter__"):
+            values = [values]
+        normalized[attr] = {str(value) for value in values}
+    return normalized
+
+
+def filter_frame(df, filters):
+    """
+    Only keep the rows of a typed dataframe that match the filters
+    :param df: the typed dataframe
+    :param filters: the filters, see normalize_filters
+    :return: the filtered dataframe
+    """
+    filters = normalize_filters(filters)
+    if len(filters) == 0 or len(df) == 0:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for attr, values in filters.items():
+        if attr not in df:
+            return df.iloc[0:0]
+        mask &= df[attr].astype(str).isin(values)
+    return df[mask]
+
+
+def parquet_filters(filters):
+    """
+    Convert filters to the filters pyarrow applies while reading a parquet file
+    :param filters: the filters, see normalize_filters
+    :return: the list of pyarrow filters, None without filters
+    """
+    filters = normalize_filters(filters)
+    if len(filters) == 0:
+        return None
+    return [(attr, "in", sorted(int(value) for value in values) if attr in INT_COLUMNS else sorted(values))
+            for attr, values in filters.items()]
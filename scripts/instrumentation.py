@@ -0,0 +1,161 @@
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+# Measurements of the stages that ran since the instrumentation was enabled, None while it is disabled
+_measurements = None
+# Measurements of the stages that are running, the innermost last
+_running = []
+# Whether the peak memory is traced, which makes the stages noticeably slower
+_trace_memory = False
+
+
+def enable(memory=False):
+    """
+    Start measuring the stages of the pipeline. Until then, stages only cost a function call.
+    :param memory: whether to measure the peak memory of every stage with tracemalloc
+    """
+    global _measurements, _trace_memory
+    _measurements = []
+    _trace_memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """
+    Stop measuring the stages of the pipeline
+    :return: the measurements of the stages that ran since the instrumentation was enabled
+    """
+    global _measurements, _trace_memory
+    measurements = _measurements or []
+    if _trace_memory:
+        tracemalloc.stop()
+    _measurements = None
+    _trace_memory = False
+    return measurements
+
+
+def options():
+    """
+    Get the options the instrumentation was enabled with, to enable it the same way in worker processes
+    :return: the keyword arguments of enable, or None if the instrumentation is disabled
+    """
+    return None if _measurements is None else {"memory": _trace_memory}
+
+
+def measurements():
+    """
+    :return: the measurements of the stages that ran since the instrumentation was enabled
+    """
+    return list(_measurements or [])
+
+
+def add_measurements(stages):
+    """
+    Add measurements taken elsewhere, e.g. by a worker process
+    :param stages: the measurements returned by disable
+    """
+    if _measurements is not None:
+        _measurements.extend(stages)
+
+
+@contextlib.contextmanager
+def stage(name, **info):
+    """
+    Measure the wall time and, if enabled, the peak memory of a stage. The stage can set the number of records it
+    processed in the yielded dict to get its throughput.
+    :param name: the name of the stage
+    :param info: additional information stored with the measurement, e.g. the figure a stage renders
+    :return: a context manager yielding the dict of the measurement
+    """
+    if _measurements is None:
+        yield {}
+        return
+
+    measurement = {"stage": name, "pid": os.getpid(), **info}
+    measurement["_peak"] = 0
+    measurement["depth"] = len(_running)
+    if _trace_memory:
+        tracemalloc.reset_peak()
+    _running.append(measurement)
+    start = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        measurement["seconds"] = time.perf_counter() - start
+        _running.pop()
+        if "records" in measurement:
+            measurement["records_per_second"] = measurement["records"] / measurement["seconds"] \
+                if measurement["seconds"] > 0 else None
+        peak = measurement.pop("_peak")
+        if _trace_memory:
+            # A nested stage resets the peak, so the peak of a stage is the larger one of its own and its children's
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            measurement["peak_mib"] = peak / 2 ** 20
+            if _running:
+                _running[-1]["_peak"] = max(_running[-1]["_peak"], peak)
+        _measurements.append(measurement)
+
+
+def timed(name):
+    """
+    Measure every call of a function as a stage, with the length of its first argument as the number of records
+    :param name: the name of the stage
+    :return: the decorator
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _measurements is None:
+                return func(*args, **kwargs)
+            with stage(name) as measurement:
+                if args and hasattr(args[0], "__len__"):
+                    measurement["records"] = len(args[0])
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextlib.contextmanager
+def profile(path):
+    """
+    Profile the code of the context with cProfile and dump the statistics, which can be read with pstats or turned
+    into a flame graph with e.g. flameprof or snakeviz
+    :param path: the path of the dumped statistics, nothing is profiled if it is None
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def write_report(path, **info):
+    """
+    Write the measurements as JSON, so that the performance of the pipeline can be tracked over time
+    :param path: the path of the JSON file
+    :param info: additional information stored in the report, e.g. the command line arguments
+    """
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        **info,
+        "stages": measurements(),
+    }
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
@@ -1,8 +1,16 @@
 import pandas as pd
-import seaborn as sns
-from matplotlib import pyplot as plt
 
-import process
+import frames
+import instrumentation
+
+
+# Names of the averaged metrics, in the order they are listed in the dataframe
+message_types = {
+    "blks_sent": "Blocks Sent",
+    "blks_rcvd": "Blocks Received",
+    "dup_blks_rcvd": "Duplicate Blocks Received",
+    "msgs_rcvd": "Messages Received",
+}
 
 
 def create_average_messages_dataframe_compact(metrics, eaves_count):
@@ -12,64 +20,52 @@ def create_average_messages_dataframe_compact(metrics, eaves_count):
     :param eaves_count: The number of eavesdroppers that were used in the experiment
     :return: the dataframe containing the metrics
     """
-    df = pd.DataFrame(columns=["Latency", "Trickling Delay", "File Size", "Type", "Eaves Count", "Experiment Type"])
-
-    by_experiment_type = process.group_by(metrics, "exType")
-    for ex_type, ex_type_items in by_experiment_type.items():
-        by_latency = process.group_by(ex_type_items, "latencyMS")
-        by_latency = sorted(by_latency.items(), key=lambda x: int(x[0]))
-        for latency, latency_items in by_latency:
-            by_filesize = process.group_by(latency_items, "fileSize")
-            by_filesize = sorted(by_filesize.items(), key=lambda x: int(x[0]))
-            for filesize, filesize_items in by_filesize:
-                by_trickling_delay = process.group_by(filesize_items, "tricklingDelay")
-                by_trickling_delay = sorted(by_trickling_delay.items(), key=lambda x: int(x[0]))
-
-                for delay, value in by_trickling_delay:
-                    blks_sent = blks_rcvd = dup_blks_rcvd = msgs_rcvd = 0
-                    blks_sent_n = blks_rcvd_n = dup_blks_rcvd_n = msgs_rcvd_n = 0
-                    for i in value:
-                        if i["meta"] == "blks_sent":
-                            blks_sent += i["value"]
-                            blks_sent_n += 1
-                        if i["meta"] == "blks_rcvd":
-                            blks_rcvd += i["value"]
-                            blks_rcvd_n += 1
-                        if i["meta"] == "dup_blks_rcvd":
-                            dup_blks_rcvd += i["value"]
-                            dup_blks_rcvd_n += 1
-                        if i["meta"] == "msgs_rcvd":
-                            msgs_rcvd += i["value"]
-                            msgs_rcvd_n += 1
-
-                    df = df.append({"Latency": latency + ' ms',
-                                    "Trickling Delay": delay,
-                                    "File Size": filesize + ' B',
-                                    "Experiment Type": ex_type,
-                                    "Type": "Blocks Sent",
-                                    "value": blks_sent / blks_sent_n,
-                                    "Eaves Count": eaves_count}, ignore_index=True)
-                    df = df.append({"Latency": latency + ' ms',
-                                    "Trickling Delay": delay,
-                                    "File Size": filesize + ' B',
-                                    "Experiment Type": ex_type,
-                                    "Type": "Blocks Received",
-                                    "value": blks_rcvd / blks_rcvd_n,
-                                    "Eaves Count": eaves_count}, ignore_index=True)
-                    df = df.append({"Latency": latency + ' ms',
-                                    "Trickling Delay": delay,
-                                    "File Size": filesize + ' B',
-                                    "Experiment Type": ex_type,
-                                    "Type": "Duplicate Blocks Received",
-                                    "value": dup_blks_rcvd / dup_blks_rcvd_n,
-                                    "Eaves Count": eaves_count}, ignore_index=True)
-                    df = df.append({"Latency": latency + ' ms',
-                                    "Trickling Delay": delay,
-                                    "File Size": filesize + ' B',
-                                    "Experiment Type": ex_type,
-                                    "Type": "Messages Received",
-                                    "value": msgs_rcvd / msgs_rcvd_n,
-                                    "Eaves Count": eaves_count}, ignore_index=True)
+    return create_average_messages_dataframe_from_counters(count_messages(metrics), eaves_count)
+
+
+@instrumentation.timed("message_counters")
+def count_messages(metrics, extra_keys=()):
+    """
+    Sum up the number of messages received, and (duplicate) blocks sent and received per cell. Unlike averages, the
+    counters of disjoint sets of metrics can be merged by summing them.
+    :param metrics: The metrics to count
+    :param extra_keys: Columns identifying a cell in addition to the experiment type, latency, file size and delay
+    :return: a dataframe with the keys, the type of the metric, the sum of its values and the number of values
+    """
+    metrics = frames.ensure_frame("results.out", metrics)
+    metrics = metrics[metrics["meta"].isin(message_types.keys())]
+
+    keys = ["exType", "latencyMS", "fileSize", "tricklingDelay"] + list(extra_keys) + ["meta"]
+    counters = metrics.groupby(keys, sort=False)["value"].agg(["sum", "count"])
+    return counters.reset_index()
+
+
+@instrumentation.timed("messages_dataframe")
+def create_average_messages_dataframe_from_counters(counters, eaves_count):
+    """
+    Create the dataframe of create_average_messages_dataframe_compact from message counters
+    :param counters: The counters returned by count_messages, possibly concatenated for several sets of metrics
+    :param eaves_count: The number of eavesdroppers that were used in the experiment
+    :return: the dataframe containing the metrics
+    """
+    # Keep the experiment types in the order they appear in and the types in the order they are listed in
+    keys = pd.DataFrame({
+        "exType": pd.Categorical(counters["exType"], categories=pd.unique(counters["exType"])),
+        "latencyMS": counters["latencyMS"],
+        "fileSize": counters["fileSize"],
+        "tricklingDelay": counters["tricklingDelay"],
+        "meta": pd.Categorical(counters["meta"], categories=list(message_types.keys())),
+    })
+    sums = counters[["sum", "count"]].groupby([keys[column] for column in keys.columns], observed=True).sum()
+    averages = (sums["sum"] / sums["count"]).rename("value").reset_index()
+
+    df = pd.DataFrame({"Latency": averages["latencyMS"].astype(str) + ' ms',
+                       "Trickling Delay": averages["tricklingDelay"].astype(str),
+                       "File Size": averages["fileSize"].astype(str) + ' B',
+                       "Type": averages["meta"].map(message_types).astype(object),
+                       "Eaves Count": eaves_count,
+                       "Experiment Type": averages["exType"].astype(object),
+                       "value": averages["value"]})
     return df
 
 
@@ -79,6 +75,9 @@ def plot_messages_for_0_trickling(dataframe_compact):
     forwarding with 0 delay
     :param dataframe_compact: The dataframe containing the metrics
     """
+    import seaborn as sns
+    from matplotlib import pyplot as plt
+
     # rename variable to make it shorter
     df = dataframe_compact
     df.sort_values(by=['Eaves Count'], inplace=True)
@@ -0,0 +1,287 @@
+import argparse
+import concurrent.futures
+import copy
+import itertools
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+
+import toml
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+# Every composition has a leech, a seed and 9 passives in addition to its eavesdroppers
+NODES_WITHOUT_EAVESDROPPERS = 11
+
+# Output of testground run naming the ID of the queued task
+TASK_ID_PATTERN = re.compile(r"run is queued with ID:\s*(\S+)")
+STATUS_PATTERN = re.compile(r"Status:\s*(\S+)")
+OUTCOME_PATTERN = re.compile(r"Outcome:\s*(\S+)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='''
+                                     Run a grid of testground compositions concurrently and collect their results
+                                     ''')
+    parser.add_argument('composition', type=str, help='''
+                        Composition file the compositions of the grid are derived from,
+                        e.g. experiments/composition-docker-1-eaves.toml
+                        ''')
+    parser.add_argument('-g', '--grid', nargs='+', action='append', default=[], metavar=('PARAM', 'VALUE'), help='''
+                        A test parameter and the values to run the composition with, e.g.
+                        --grid latency_ms 50 100 150 --grid dialer center edge. Every combination of the values of
+                        all parameters is run. The number of instances follows eavesdropper_count.
+                        ''')
+    parser.add_argument('-dir', '--dir', type=str, default=os.path.join(dir_path, '..', 'experiments', 'results'),
+                        help='Result directory the results are extracted to, ../experiments/results by default')
+    parser.add_argument('--work-dir', type=str, help='''
+                        Directory the compositions are written to and the results are collected in, a temporary
+                        directory by default
+                        ''')
+    parser.add_argument('-j', '--jobs', type=int, default=2, help='Number of compositions in flight at once')
+    parser.add_argument('--retries', type=int, default=2, help='''
+                        Number of times a composition whose task failed or timed out is run again, as errors like
+                        'inconsistent mutex state' usually go away when re-running. Errors of the testground CLI are
+                        not retried.
+                        ''')
+    parser.add_argument('--poll-interval', type=float, default=10, help='Seconds between status checks of a task')
+    parser.add_argument('--timeout', type=float, default=4 * 60 * 60, help='''
+                        Seconds after which a task that didn't complete is terminated and counts as failed
+                        ''')
+    parser.add_argument('--runner', type=str, default='local:docker', help='Runner to collect the results from')
+    parser.add_argument('--testground-bin', type=str, default='testground', help='testground executable to use')
+    parser.add_argument('--dry-run', action='store_true', help='Only write the compositions of the grid')
+    return parser.parse_args()
+
+
+def expand_grid(composition, grid):
+    """
+    Expand a parameter grid into compositions
+    :param composition: the parsed composition the compositions are derived from
+    :param grid: a list of (test parameter, values) tuples
+    :return: a list of (name, composition) tuples, one per combination of the values, named after the values
+    """
+    names = [param for param, _ in grid]
+    compositions = []
+    for values in itertools.product(*[values for _, values in grid]):
+        derived = copy.deepcopy(composition)
+        groups = derived.get("groups", [])
+        for group in groups:
+            params = group.setdefault("run", {}).setdefault("test_params", {})
+            params.update(zip(names, values))
+            if "eavesdropper_count" in names:
+                group["instances"] = {"count": NODES_WITHOUT_EAVESDROPPERS + int(params["eavesdropper_count"])}
+        if "eavesdropper_count" in names and "global" in derived:
+            derived["global"]["total_instances"] = sum(group["instances"]["count"] for group in groups)
+        name = "-".join(f"{param}_{value}" for param, value in zip(names, values)).replace(",", "_")
+        compositions.append((name or "composition", derived))
+    return compositions
+
+
+class TaskFailed(RuntimeError):
+    """
+    Raised when a task completed with an outcome other than success or didn't complete in time. Unlike errors of the
+    testground CLI itself, these are worth running the composition again for.
+    """
+
+
+class Testground:
+    """
+    Runs the commands of the testground CLI
+    """
+
+    def __init__(self, executable, runner, work_dir):
+        self.executable = executable
+        self.runner = runner
+        self.work_dir = work_dir
+
+    def _run(self, *args):
+        completed = subprocess.run([self.executable, *args], cwd=self.work_dir, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{self.executable} {' '.join(args)} failed: {completed.stdout.strip()}")
+        return completed.stdout
+
+    def submit(self, composition_path):
+        """
+        Queue a composition
+        :param composition_path: the path of the composition file
+        :return: the ID of the task
+        """
+        output = self._run("run", "composition", "-f", composition_path)
+        match = TASK_ID_PATTERN.search(output)
+        if match is None:
+            raise RuntimeError(f"no task ID in the output of testground run: {output.strip()}")
+        return match.group(1)
+
+    def status(self, task_id):
+        """
+        Get the status of a task
+        :param task_id: the ID of the task
+        :return: a tuple of the status, e.g. scheduled, processing or complete, and the outcome, e.g. success or
+        failure, which is None until the task is complete
+        """
+        output = self._run("status", "--task", task_id)
+        statuses = STATUS_PATTERN.findall(output)
+        outcomes = OUTCOME_PATTERN.findall(output)
+        return (statuses[-1] if statuses else None), (outcomes[-1] if outcomes else None)
+
+    def terminate(self, task_id):
+        """
+        Stop a task that is still running
+        :param task_id: the ID of the task
+        """
+        self._run("terminate", "--task", task_id)
+
+    def collect(self, task_id):
+        """
+        Collect the outputs of a task
+        :param task_id: the ID of the task
+        :return: the path of the archive holding the outputs
+        """
+        self._run("collect", "--runner", self.runner, task_id)
+        return os.path.join(self.work_dir, f"{task_id}.tgz")
+
+
+def extract_results(archive_path, task_id, results_dir):
+    """
+    Extract the outputs of a task into the result directory. The outputs only appear in the result directory once
+    they are complete, so the analysis scripts never see a partially extracted experiment.
+    :param archive_path: the path of the archive returned by Testground.collect
+    :param task_id: the ID of the task, the name of the top level folder of the archive
+    :param results_dir: the result directory
+    :return: the path of the extracted experiment
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{task_id}-", dir=results_dir)
+    try:
+        with tarfile.open(archive_path, "r:gz") as archive:
+            archive.extractall(tmp_dir)
+        target = os.path.join(results_dir, task_id)
+        os.replace(os.path.join(tmp_dir, task_id), target)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.remove(archive_path)
+    return target
+
+
+def run_composition(testground, name, composition_path, results_dir, retries=2, poll_interval=10, timeout=None):
+    """
+    Run a composition until it succeeds or ran out of retries, and extract its results as soon as it completed. Only
+    tasks that failed or timed out are run again, a task that timed out is terminated first so that it doesn't keep
+    running next to its retry. Errors of the testground CLI end the composition right away.
+    :param testground: the Testground to run the commands with
+    :param name: the name of the composition, used for logging
+    :param composition_path: the path of the composition file
+    :param results_dir: the result directory
+    :param retries: the number of times a failed composition is run again
+    :param poll_interval: the seconds between status checks
+    :param timeout: the seconds after which a task that didn't complete counts as failed, no limit if None
+    :return: a dict with the name, the ID of the last task, the number of attempts, whether it succeeded, the path of
+    the results and the error of the last failed attempt
+    """
+    result = {"name": name, "task": None, "attempts": 0, "success": False, "results": None, "error": None}
+    for attempt in range(retries + 1):
+        result["attempts"] = attempt + 1
+        running = None
+        try:
+            task_id = testground.submit(composition_path)
+            result["task"] = running = task_id
+            print(f"[{name}] queued task {task_id} (attempt {attempt + 1})", flush=True)
+
+            started = time.monotonic()
+            status, outcome = testground.status(task_id)
+            while status != "complete":
+                if timeout is not None and time.monotonic() - started > timeout:
+                    testground.terminate(task_id)
+                    running = None
+                    raise TaskFailed(f"task {task_id} didn't complete within {timeout} s and was terminated")
+                time.sleep(poll_interval)
+                status, outcome = testground.status(task_id)
+            running = None
+            if outcome is not None and outcome != "success":
+                raise TaskFailed(f"task {task_id} completed with outcome {outcome}")
+
+            result["results"] = extract_results(testground.collect(task_id), task_id, results_dir)
+            result["success"] = True
+            result["error"] = None
+            print(f"[{name}] collected results of task {task_id}", flush=True)
+            return result
+        except TaskFailed as e:
+            result["error"] = str(e)
+            print(f"[{name}] {e}", flush=True)
+        except (RuntimeError, OSError, tarfile.TarError) as e:
+            result["error"] = str(e)
+            print(f"[{name}] {e}, not retrying", flush=True)
+            if running is not None:
+                # The status of the task is unknown, so it is stopped rather than left running outside of the bound
+                try:
+                    testground.terminate(running)
+                except RuntimeError as terminate_error:
+                    print(f"[{name}] {terminate_error}", flush=True)
+            return result
+    return result
+
+
+def orchestrate(composition_path, grid, results_dir, work_dir=None, jobs=2, retries=2, poll_interval=10,
+                timeout=None, runner="local:docker", testground_bin="testground", dry_run=False):
+    """
+    Run every composition of a parameter grid, keeping a bounded number of them in flight
+    :param composition_path: the path of the composition the compositions of the grid are derived from
+    :param grid: a list of (test parameter, values) tuples
+    :param results_dir: the result directory the results are extracted to
+    :param work_dir: the directory the compositions are written to and the results are collected in, a temporary
+    directory by default
+    :param jobs: the number of compositions in flight at once
+    :param retries: the number of times a failed composition is run again
+    :param poll_interval: the seconds between status checks of a task
+    :param timeout: the seconds after which a task that didn't complete counts as failed, no limit if None
+    :param runner: the runner to collect the results from
+    :param testground_bin: the testground executable
+    :param dry_run: whether to only write the compositions
+    :return: the results of run_composition of every composition, or the paths of the compositions for a dry run
+    """
+    with open(composition_path, 'r') as composition_file:
+        composition = toml.load(composition_file)
+    work_dir = os.path.abspath(work_dir or tempfile.mkdtemp(prefix="testground-"))
+    results_dir = os.path.abspath(results_dir)
+    os.makedirs(work_dir, exist_ok=True)
+
+    paths = []
+    for name, derived in expand_grid(composition, grid):
+        path = os.path.join(work_dir, name + ".toml")
+        with open(path, 'w') as derived_file:
+            toml.dump(derived, derived_file)
+        paths.append((name, path))
+    if dry_run:
+        return [path for _, path in paths]
+
+    testground = Testground(testground_bin, runner, work_dir)
+    # The threads only wait for the testground CLI, so they don't contend for the interpreter
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [executor.submit(run_composition, testground, name, path, results_dir, retries, poll_interval,
+                                   timeout) for name, path in paths]
+        return [future.result() for future in futures]
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if any(len(values) < 2 for values in args.grid):
+        raise SystemExit("--grid needs a test parameter and at least one value")
+    grid = [(values[0], values[1:]) for values in args.grid]
+    results = orchestrate(args.composition, grid, args.dir, args.work_dir, args.jobs, args.retries,
+                          args.poll_interval, args.timeout, args.runner, args.testground_bin, args.dry_run)
+    if args.dry_run:
+        for path in results:
+            print(path)
+    else:
+        failed = [result for result in results if not result["success"]]
+        print(f"{len(results) - len(failed)} of {len(results)} compositions succeeded")
+        for result in failed:
+            print(f"[{result['name']}] failed after {result['attempts']} attempts: {result['error']}")
+        if failed:
+            raise SystemExit(1)
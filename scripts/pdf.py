@@ -1,14 +1,17 @@
+import argparse
+import multiprocessing
 import os
-import sys
 
 import matplotlib.pyplot as plt
 import seaborn as sns
 from matplotlib.backends.backend_pdf import PdfPages
 from numpy import sqrt
 
+import aggregates
+import instrumentation
 import message_metrics_analysis
 import prediction_analysis
-import process
+import throughput_analysis
 import ttf_analysis
 
 fig_width_pt = 246.0
@@ -27,105 +30,244 @@ params = {'backend': 'ps',
 plt.rcParams.update(params)
 
 
-def analyse_prediction_rates(message_items, info_items):
+def analyse_prediction_rates(prediction_counts):
     """
     Analyse the prediction rates for all topologies
-    :param message_items: the message items received by the eavesdroppers
-    :param info_items: the info items emitted by the leech node. This is used to know the true source of the message
+    :param prediction_counts: the prediction counts of the first timestamp estimator, see aggregates.py
     """
-    prediction_analysis.analyse_prediction_rates_per_eaves(message_items, info_items)
+    df = prediction_analysis.create_prediction_rates_dataframe_from_counts(prediction_counts)
+    prediction_analysis.plot_prediction_rates_per_eaves(df)
+
+
+def analyse_estimator_rates(estimator_counts):
+    """
+    Compare the prediction rates of all source estimators for all topologies
+    :param estimator_counts: the prediction counts of all source estimators, see aggregates.py
+    """
+    df = prediction_analysis.create_prediction_rates_dataframe_from_counts(estimator_counts)
+    prediction_analysis.plot_estimator_rates(df)
 
 
 def analyse_ttf_for_0_eaves(metrics):
     """
     Analyse the time to fetch for all topologies with 0 eavesdroppers
-    :param metrics: the metrics to analyse
+    :param metrics: the metrics to analyse, e.g. the time to fetch samples of aggregates.py
     """
-    metrics_by_eavescount = process.group_by(metrics, "eavesCount")
-
-    metrics_for_eaves_count = None
-    if "0" in metrics_by_eavescount:
-        # Only consider the metrics for 0 eavesdroppers
-        metrics_for_eaves_count = metrics_by_eavescount["0"]
+    # Only consider the metrics for 0 eavesdroppers
+    metrics_for_eaves_count = metrics[metrics["eavesCount"] == 0]
 
-    if metrics_for_eaves_count is None:
+    if len(metrics_for_eaves_count) == 0:
         print("No metrics for 0 eavesdroppers")
         return
 
     df, averages = ttf_analysis.create_ttf_dataframe(metrics_for_eaves_count, 0, False)
-    ttf_analysis.plot_time_to_fetch_per_extype(df)
+    intervals = ttf_analysis.create_ttf_intervals_dataframe(metrics_for_eaves_count)
+    ttf_analysis.plot_time_to_fetch_per_extype(df, intervals)
 
 
-def analyse_average_messages_comparing_0_delay(metrics):
+def analyse_average_messages_comparing_0_delay(message_counters):
     """
     Analyse the average messages for all topologies with 0 eavesdroppers
-    :param metrics: the metrics to analyse
+    :param message_counters: the message counters to analyse, see aggregates.py
     """
-    metrics_by_eaves_count = process.group_by(metrics, "eavesCount")
-
     # Only consider the metrics for 0 eavesdroppers
-    metrics_for_eaves_count = None
-    if "0" in metrics_by_eaves_count:
-        # Only consider the metrics for 0 eavesdroppers
-        metrics_for_eaves_count = metrics_by_eaves_count["0"]
+    counters_for_eaves_count = message_counters[message_counters["eavesCount"] == 0]
 
-    if metrics_for_eaves_count is None:
+    if len(counters_for_eaves_count) == 0:
         print("No metrics for 0 eavesdroppers")
         return
 
-    df = message_metrics_analysis.create_average_messages_dataframe_compact(metrics_for_eaves_count, 0)
+    df = message_metrics_analysis.create_average_messages_dataframe_from_counters(counters_for_eaves_count, 0)
 
     message_metrics_analysis.plot_messages_for_0_trickling(df)
 
 
-def create_pdfs():
+def analyse_throughput_for_0_eaves(metrics):
     """
-    Create the pdfs for the plots
+    Analyse the goodput and the slowdown compared to TCP for all topologies with 0 eavesdroppers
+    :param metrics: the metrics to analyse, e.g. the time to fetch samples of aggregates.py
     """
-    dir_path = os.path.dirname(os.path.realpath(__file__))
+    metrics_for_eaves_count = metrics[metrics["eavesCount"] == 0]
 
-    results_dir = dir_path + "/../experiments/results"
+    if len(metrics_for_eaves_count) == 0:
+        print("No metrics for 0 eavesdroppers")
+        return
 
-    if len(sys.argv) == 2:
-        results_dir = sys.argv[1]
+    df = throughput_analysis.create_throughput_dataframe(metrics_for_eaves_count)
+    throughput_analysis.plot_throughput_per_delay(df)
 
-    target_dir = results_dir
 
-    # Load all metrics (ttf, duplicate blocks, ...)
-    metrics, testcases = process.aggregate_metrics(results_dir)
+def analyse_overhead_for_0_eaves(message_counters):
+    """
+    Analyse the bandwidth overhead for all topologies with 0 eavesdroppers
+    :param message_counters: the message counters to analyse, see aggregates.py
+    """
+    counters_for_eaves_count = message_counters[message_counters["eavesCount"] == 0]
 
-    # Load the messages
-    message_items = process.aggregate_message_histories(results_dir)
-    # Only consider the messages received by Eavesdropper nodes
-    message_items = [item for item in message_items if item["nodeType"] == "Eavesdropper"]
-    # Load the info items containing the meta info about everly leech fetch
-    info_items = process.aggregate_global_info(results_dir)
+    if len(counters_for_eaves_count) == 0:
+        print("No metrics for 0 eavesdroppers")
+        return
 
-    # Create a PDF file for each dialer
-    dialers = ["center", "edge"]
+    df = throughput_analysis.create_overhead_dataframe(counters_for_eaves_count)
+    throughput_analysis.plot_overhead_per_delay(df)
 
-    sns.set(font_scale=1.1)
 
-    for dialer in dialers:
-        message_items_for_dialer = [item for item in message_items if item["dialer"] == dialer]
-        info_items_for_dialer = [item for item in info_items if item["dialer"] == dialer]
-        metrics_for_dialer = [item for item in metrics if item["dialer"] == dialer]
+# The dialers a PDF file is created for
+dialers = ["center", "edge"]
 
-        with PdfPages(target_dir + "/" + f"prediction_rates-overall-{dialer}.pdf") as export_pdf_prediction_rates:
-            if len(message_items_for_dialer) > 0 and len(info_items_for_dialer) > 0:
-                analyse_prediction_rates(message_items_for_dialer, info_items_for_dialer)
-                export_pdf_prediction_rates.savefig(pad_inches=0.4, bbox_inches='tight')
+# The figures rendered for every dialer, mapped to the function rendering them, the aggregate they are rendered from
+# and whether they only show the experiments without eavesdroppers
+figures = {
+    "prediction_rates-overall": (analyse_prediction_rates, "prediction_counts", False),
+    "prediction_rates-estimators": (analyse_estimator_rates, "estimator_counts", False),
+    "time-to-fetch": (analyse_ttf_for_0_eaves, "ttf_samples", True),
+    "average-messages": (analyse_average_messages_comparing_0_delay, "message_counters", True),
+    "throughput": (analyse_throughput_for_0_eaves, "ttf_samples", True),
+    "overhead": (analyse_overhead_for_0_eaves, "message_counters", True),
+}
 
-        with PdfPages(target_dir + "/" + f"time-to-fetch-{dialer}.pdf") as export_pdf_ttf:
-            if len(metrics_for_dialer) > 0:
-                analyse_ttf_for_0_eaves(metrics_for_dialer)
-                export_pdf_ttf.savefig(pad_inches=0.4, bbox_inches='tight')
 
-        with PdfPages(target_dir + "/" + f"average-messages-{dialer}.pdf") as export_pdf_messages:
-            if len(metrics_for_dialer) > 0:
-                analyse_average_messages_comparing_0_delay(metrics_for_dialer)
-                export_pdf_messages.savefig(pad_inches=0.4, bbox_inches='tight')
+def filter_by(df, column, value):
+    """
+    Only keep the rows of a dataframe with the given value in a column
+    :param df: the dataframe to filter, which has no columns at all if no results of its kind were found
+    :param column: the column to compare
+    :param value: the value to keep
+    :return: the filtered dataframe
+    """
+    if len(df) == 0:
+        return df
+    return df[df[column] == value]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Create the PDFs of the results')
+    parser.add_argument('dir', nargs='?', type=str, help="""
+                        Result directory to process, ../experiments/results by default
+                        """)
+    parser.add_argument('-f', '--figures', nargs='+', choices=list(figures.keys()), help="""
+                        One or more figures to be created, all by default
+                        """)
+    parser.add_argument('-d', '--dialers', nargs='+', choices=dialers, help="""
+                        One or more dialers to create the figures for, all by default
+                        """)
+    parser.add_argument('-p', '--processes', type=int, help="""
+                        Number of figures rendered at once, the number of CPUs by default
+                        """)
+    parser.add_argument('--force', action='store_true', help="""
+                        Render the figures even if their data didn't change
+                        """)
+    parser.add_argument('--stats', action='store_true', help="""
+                        Measure the wall time, records and throughput of every stage of the pipeline and write them
+                        as JSON to pipeline-stats.json in the result directory
+                        """)
+    parser.add_argument('--memory', action='store_true', help="""
+                        Also measure the peak memory of every stage with tracemalloc, which slows the pipeline down
+                        """)
+    parser.add_argument('--profile', action='store_true', help="""
+                        Profile the pipeline with cProfile and dump the statistics to pipeline.prof in the result
+                        directory, e.g. for flameprof or snakeviz. Figures rendered in worker processes aren't included,
+                        use --processes 1 to profile them too.
+                        """)
+
+    return parser.parse_args()
+
+
+def render_figure(task):
+    """
+    Render a figure of a dialer into its PDF file. The data is read from the aggregates on disk, so that a worker
+    process only loads the rows it plots instead of receiving them pickled.
+    :param task: a (results_dir, figure name, dialer) tuple
+    :return: the path of the PDF file
+    """
+    results_dir, name, dialer = task
+    analyse, aggregate, _ = figures[name]
+    with instrumentation.stage("render", figure=name, dialer=dialer) as measurement:
+        data = aggregates.load_aggregate(results_dir, aggregate, dialer)
+        measurement["records"] = len(data)
+
+        sns.set(font_scale=1.1)
+        path = results_dir + "/" + f"{name}-{dialer}.pdf"
+        with PdfPages(path) as export_pdf:
+            if len(data) > 0:
+                analyse(data)
+                with instrumentation.stage("save", figure=name, dialer=dialer):
+                    export_pdf.savefig(pad_inches=0.4, bbox_inches='tight')
+        plt.close('all')
+    return path
+
+
+def _render_figure_in_worker(task):
+    """
+    Render a figure in a worker process, measuring its stages like the parent process does
+    :param task: a (results_dir, figure name, dialer, instrumentation options) tuple
+    :return: a tuple of the path of the PDF file and the measurements of its stages
+    """
+    *task, options = task
+    if options is None:
+        return render_figure(task), []
+    instrumentation.enable(**options)
+    try:
+        return render_figure(task), instrumentation.disable()
+    except BaseException:
+        instrumentation.disable()
+        raise
+
+
+def create_pdfs(results_dir=None, figure_names=None, dialer_names=None, processes=None, force=False):
+    """
+    Create the pdfs for the plots, rendering the figures in a process pool
+    :param results_dir: the directory containing the results, ../experiments/results by default
+    :param figure_names: the names of the figures to create, all figures by default
+    :param dialer_names: the dialers to create the figures for, all dialers by default
+    :param processes: the number of figures rendered at once, the number of CPUs by default
+    :param force: whether to render the figures even if their data didn't change
+    :return: the paths of the rendered PDF files
+    """
+    if results_dir is None:
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        results_dir = dir_path + "/../experiments/results"
+    figure_names = list(figures.keys()) if figure_names is None else figure_names
+    dialer_names = dialers if dialer_names is None else dialer_names
+
+    # Merge the contribution of the experiments added since the last run into the aggregates of all experiments
+    _, changes = aggregates.update(results_dir)
+
+    tasks = []
+    for dialer in dialer_names:
+        for name in figure_names:
+            _, aggregate, only_0_eaves = figures[name]
+            # Only render the figures whose data changed or which don't exist yet
+            changed = filter_by(changes[aggregate], "dialer", dialer)
+            if only_0_eaves:
+                changed = filter_by(changed, "eavesCount", 0)
+            path = results_dir + "/" + f"{name}-{dialer}.pdf"
+            if force or len(changed) > 0 or not os.path.exists(path):
+                tasks.append((results_dir, name, dialer))
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(tasks) <= 1:
+        return list(map(render_figure, tasks))
+
+    options = instrumentation.options()
+    with multiprocessing.Pool(min(processes, len(tasks))) as pool:
+        rendered = pool.map(_render_figure_in_worker, [task + (options,) for task in tasks])
+    for _, measurements in rendered:
+        instrumentation.add_measurements(measurements)
+    return [path for path, _ in rendered]
 
 
 if __name__ == '__main__':
-    create_pdfs()
+    args = parse_args()
+    results_dir = args.dir if args.dir else os.path.dirname(os.path.realpath(__file__)) + "/../experiments/results"
+    if args.stats or args.memory:
+        instrumentation.enable(memory=args.memory)
+
+    with instrumentation.profile(os.path.join(results_dir, "pipeline.prof") if args.profile else None):
+        with instrumentation.stage("create_pdfs"):
+            create_pdfs(results_dir, args.figures, args.dialers, args.processes, args.force)
+
+    if args.stats or args.memory:
+        stats_path = os.path.join(results_dir, "pipeline-stats.json")
+        instrumentation.write_report(stats_path, arguments=vars(args))
+        print(stats_path)
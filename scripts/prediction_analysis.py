@@ -1,51 +1,106 @@
 import pandas as pd
-import seaborn as sns
-from matplotlib import pyplot as plt
 
+import bootstrap
 import first_timestamp_estimator
-import process
+import frames
+import instrumentation
+import source_estimators
 
+# Columns identifying a cell of the prediction rate plots
+keys = ["eavesCount", "latencyMS", "experiment", "tricklingDelay"]
 
-def analyse_prediction_rates_per_eaves(messages, info_items):
+
+def create_prediction_rates_dataframe(messages, info_items):
     """
-    Analyse the prediction rates per number of eavesdroppers
+    Create a dataframe with the prediction rate of every experiment per number of eavesdroppers, latency and delay
     :param messages: The messages to use for prediction
     :param info_items: The info items emitted by the leech node containing info about the true source
+    :return: the dataframe with the prediction rates
     """
-    # Store results for each experiment and trickling delay in a dict
-    results = list()
+    counts = create_prediction_counts(messages, info_items)
+    return create_prediction_rates_dataframe_from_counts(counts)
+
+
+@instrumentation.timed("prediction_counts")
+def create_prediction_counts(messages, info_items, cell_keys=keys):
+    """
+    Count the correct predictions of the first timestamp estimator and the targets of every cell
+    :param messages: The messages to use for prediction
+    :param info_items: The info items emitted by the leech node containing info about the true source
+    :param cell_keys: The columns identifying a cell
+    :return: the dataframe with the keys, the number of correct predictions and of targets
+    """
+    messages = frames.ensure_frame("messageHistory.out", messages)
+    info_items = frames.ensure_frame("globalInfo.out", info_items)
 
     # Holds the items that describe the true target of the prediction
-    prediction_targets = [item for item in info_items if item['type'] == 'LeechInfo']
-
-    messages_by_eaves_count = process.group_by(messages, "eavesCount")
-    for eavesCount, messages_for_eavesCount in messages_by_eaves_count.items():
-        # Group by latency
-        by_latency = process.group_by(messages_for_eavesCount, "latencyMS")
-        for latency, messagesWithLatency in by_latency.items():
-            # Group by experiments
-            by_latency_and_experiment = process.group_by(messagesWithLatency, "experiment")
-            for experiment, messagesWithExperiment in by_latency_and_experiment.items():
-                by_trickling_delay_with_latency_and_experiment = process.group_by(messagesWithExperiment,
-                                                                                 "tricklingDelay")
-                # Group by delay
-                for delay, messagesWithDelay in by_trickling_delay_with_latency_and_experiment.items():
-                    targets = [item for item in prediction_targets if
-                               item['experiment'] == experiment and item['latencyMS'] == latency and item[
-                                   'tricklingDelay'] == delay and item[
-                                   'eavesCount'] == eavesCount]
-                    # Get the prediction rate
-                    rate = first_timestamp_estimator.get_prediction_rate(messagesWithDelay, targets)
-                    results.append(
-                        {'latency': latency, 'experiment': experiment, 'delay': delay,
-                         'eavesdroppers': eavesCount,
-                         'rate': rate})
-
-    df = pd.DataFrame({'Delay': [int(item['delay']) for item in results],
-                       'Latency': [item['latency'] + ' ms' for item in results],
-                       'Rate': [item['rate'] for item in results],
-                       'Eavesdroppers': [item['eavesdroppers'] for item in results],
+    prediction_targets = info_items[info_items['type'] == 'LeechInfo']
+
+    return first_timestamp_estimator.get_prediction_counts(messages, prediction_targets, cell_keys)
+
+
+@instrumentation.timed("prediction_rates_dataframe")
+def create_prediction_rates_dataframe_from_counts(counts):
+    """
+    Create a dataframe with the prediction rates from the prediction counts of one or more sets of experiments
+    :param counts: the counts returned by create_prediction_counts or create_estimator_counts
+    :return: the dataframe with the prediction rate, the number of correct predictions and of targets of every
+    experiment, with the name of the estimator if the counts contain it
+    """
+    cell_keys = keys + (['estimator'] if 'estimator' in counts else [])
+    counts = counts.groupby(cell_keys, sort=False)[['hits', 'targets']].sum().reset_index()
+    rates = counts['hits'] / counts['targets']
+
+    df = pd.DataFrame({'Delay': counts['tricklingDelay'].astype(int),
+                       'Latency': counts['latencyMS'].astype(str) + ' ms',
+                       'Rate': rates,
+                       'Hits': counts['hits'].astype(int),
+                       'Targets': counts['targets'].astype(int),
+                       'Eavesdroppers': counts['eavesCount'].astype(str),
                        })
+    if 'estimator' in counts:
+        df['Estimator'] = counts['estimator']
+    return df
+
+
+def analyse_prediction_rates_per_eaves(messages, info_items):
+    """
+    Analyse the prediction rates per number of eavesdroppers
+    :param messages: The messages to use for prediction
+    :param info_items: The info items emitted by the leech node containing info about the true source
+    """
+    df = create_prediction_rates_dataframe(messages, info_items)
+    plot_prediction_rates_per_eaves(df)
+
+
+def _plot_pooled_rate(delays, hits, targets, color=None, label=None, **kwargs):
+    """
+    Draw the prediction rate of a line with its confidence band. The correct predictions and targets of all experiments
+    of the line with the same delay are pooled, so the line is the rate over all their targets and the band is the 95%
+    percentile bootstrap confidence interval of that rate.
+    :param delays: the trickling delays
+    :param hits: the numbers of correct predictions
+    :param targets: the numbers of targets
+    :param color: the color of the line
+    :param label: the label of the line
+    """
+    from matplotlib import pyplot as plt
+
+    counts = pd.DataFrame({'hits': hits.to_numpy(), 'targets': targets.to_numpy()}, index=delays.to_numpy())
+    counts = counts.groupby(level=0).sum().sort_index()
+    low, high = bootstrap.bootstrap_rates(counts['hits'], counts['targets'])
+    ax = plt.gca()
+    ax.plot(counts.index, counts['hits'] / counts['targets'], color=color, label=label)
+    ax.fill_between(counts.index, low, high, color=color, alpha=0.2, linewidth=0)
+
+
+def plot_prediction_rates_per_eaves(df):
+    """
+    Plots the prediction rates per number of eavesdroppers
+    :param df: the dataframe with the prediction rates
+    """
+    import seaborn as sns
+    from matplotlib import pyplot as plt
 
     plt.figure(figsize=(10, 10))
     sns.set_style("darkgrid", {"grid.color": ".6", "grid.linestyle": ":"})
@@ -55,7 +110,72 @@ def analyse_prediction_rates_per_eaves(messages, info_items):
 
     hue_order = ["50 ms", "100 ms", "150 ms"]
     g = sns.FacetGrid(df, col="Eavesdroppers", hue="Latency", hue_order=hue_order, margin_titles=True)
-    g.map(sns.lineplot, "Delay", "Rate")
+    if 'Hits' in df:
+        # Draw the bootstrap confidence intervals of the pooled rates instead of the spread between experiments
+        g.map(_plot_pooled_rate, "Delay", "Hits", "Targets")
+    else:
+        g.map(sns.lineplot, "Delay", "Rate")
+    g.set(xlabel='Trickling delay (ms)', ylabel='Prediction rate', ylim=(0, 1.1))
+    g.add_legend()
+    sns.despine(offset=10, trim=False)
+
+
+def create_estimator_rates_dataframe(messages, info_items, topology_messages=None):
+    """
+    Create a dataframe with the prediction rate of every source estimator per number of eavesdroppers, latency and delay
+    :param messages: The messages to use for prediction
+    :param info_items: The info items emitted by the nodes, containing the true source and the nodes of the overlay
+    :param topology_messages: The messages of all nodes, used to approximate the overlay of older results
+    :return: the dataframe with the prediction rates
+    """
+    counts = create_estimator_counts(messages, info_items, topology_messages)
+    return create_prediction_rates_dataframe_from_counts(counts)
+
+
+@instrumentation.timed("estimator_counts")
+def create_estimator_counts(messages, info_items, topology_messages=None, cell_keys=keys):
+    """
+    Count the correct predictions of every source estimator and the targets of every cell
+    :param messages: The messages to use for prediction
+    :param info_items: The info items emitted by the nodes, containing the true source and the nodes of the overlay
+    :param topology_messages: The messages of all nodes, used to approximate the overlay of older results
+    :param cell_keys: The columns identifying a cell
+    :return: the dataframe with the keys, the name of the estimator, the number of correct predictions and of targets
+    """
+    messages = frames.ensure_frame("messageHistory.out", messages)
+    info_items = frames.ensure_frame("globalInfo.out", info_items)
+    if topology_messages is not None:
+        topology_messages = frames.ensure_frame("messageHistory.out", topology_messages)
+
+    # Holds the items that describe the true target of the prediction
+    prediction_targets = info_items[info_items['type'] == 'LeechInfo']
+
+    estimators = source_estimators.create_estimators(messages, info_items, topology_messages)
+    counts = source_estimators.get_prediction_counts(estimators, prediction_targets, cell_keys)
+    # Only cells with messages get a prediction rate
+    return counts.merge(messages[cell_keys].drop_duplicates(), on=cell_keys)
+
+
+def plot_estimator_rates(df):
+    """
+    Plots the prediction rate of every source estimator per number of eavesdroppers, averaged over all latencies
+    :param df: the dataframe with the prediction rates of the estimators
+    """
+    import seaborn as sns
+    from matplotlib import pyplot as plt
+
+    plt.figure(figsize=(10, 10))
+    sns.set_style("darkgrid", {"grid.color": ".6", "grid.linestyle": ":"})
+
+    # Sort dataframe by eavesdroppers ascending
+    df.sort_values(by=['Eavesdroppers', 'Delay'], ascending=True, inplace=True)
+
+    g = sns.FacetGrid(df, col="Eavesdroppers", hue="Estimator", margin_titles=True)
+    if 'Hits' in df:
+        # Draw the bootstrap confidence intervals of the pooled rates instead of the spread between experiments
+        g.map(_plot_pooled_rate, "Delay", "Hits", "Targets")
+    else:
+        g.map(sns.lineplot, "Delay", "Rate")
     g.set(xlabel='Trickling delay (ms)', ylabel='Prediction rate', ylim=(0, 1.1))
     g.add_legend()
     sns.despine(offset=10, trim=False)
@@ -1,112 +1,315 @@
 import argparse
+import functools
 import json
+import multiprocessing
 import os
+import re
+
+import frames
+import instrumentation
+
+try:
+    # orjson decodes the lines several times faster, but is optional
+    import orjson
+
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
 
+# The plots that can be requested on the command line, mapped to the figures of pdf.py showing them
+plots = {
+    "latency": ["time-to-fetch"],
+    "throughput": ["throughput"],
+    "overhead": ["overhead"],
+    "messages": ["average-messages"],
+    "wants": ["prediction_rates-overall", "prediction_rates-estimators"],
+    # The TCP fetch is shown in the throughput figure, as the slowdown of the time to fetch compared to it
+    "tcp": ["throughput"],
+}
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument('-p', '--plots', nargs='+', help='''
+    parser.add_argument('-p', '--plots', nargs='+', choices=list(plots.keys()), help='''
                         One or more plots to be shown.
-                        Available: latency, throughput, overhead, messages, wants, tcp.
-                        ''')
-    parser.add_argument('-o', '--outputs', nargs='+', help='''
+                        Available: {}.
+                        '''.format(', '.join(plots.keys())))
+    parser.add_argument('-o', '--outputs', nargs='+', choices=['data'], help='''
                         One or more outputs to be shown.
                         Available: data
                         ''')
     parser.add_argument('-dir', '--dir', type=str, help='''
                         Result directory to process
                         ''')
+    parser.add_argument('-f', '--format', choices=['csv', 'json', 'parquet'], default='csv', help='''
+                        Format of the exported data
+                        ''')
+    parser.add_argument('-e', '--export-dir', type=str, help='''
+                        Directory to export the data to, the exports folder of the result directory by default
+                        ''')
 
     return parser.parse_args()
 
 
+# Number of distinct meta strings whose parsed attributes are kept. A single output file only holds a handful.
+META_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=META_CACHE_SIZE)
+def parse_meta(meta):
+    """
+    Split a meta string like exType:trickle/permutationIndex:0/run:1/... into its attributes
+    :param meta: the meta string
+    :return: a dict mapping the name of every attribute to its value. It is cached, so it must not be modified.
+    """
+    return dict(attr.split(":", 2)[:2] for attr in meta.split("/"))
+
+
 def process_info_line(line, experiment_id):
-    line = json.loads(line)
+    line = loads(line)
     item = line
-    # assume trickle experiment by default
-    item['exType'] = 'trickle'
-    item['dialer'] = 'edge'
+    # assume trickle experiment by default, NodeInfo lines carry their own values
+    item.setdefault('exType', 'trickle')
+    item.setdefault('dialer', 'edge')
     if 'meta' in line:
-        name = line['meta'].split("/")
-        for attr in name:
-            attr = attr.split(":")
-            item[attr[0]] = attr[1]
+        item.update(parse_meta(line['meta']))
     if 'topology' in item:
         item['eavesCount'] = item['topology'].split('-')[-1][0]
     item['experiment'] = experiment_id
     return item
 
 
-def aggregate_global_info(results_dir):
-    aggregated_items = []
-    for subdir, _, files in os.walk(results_dir):
-        for filename in files:
-            filepath = subdir + os.sep + filename
-            if filepath.split("/")[-1] == "globalInfo.out":
-                experiment_id = filepath.split("/")[-4]  # use testground experiment ID
-                result_file = open(filepath, 'r')
-                for line in result_file.readlines():
-                    aggregated_items.append(process_info_line(line, experiment_id))
-    return aggregated_items
+def aggregate_global_info(results_dir, filters=None):
+    return load_results(results_dir, ["globalInfo.out"], filters=filters)["globalInfo.out"]
 
 
-def process_message_line(line, experiment_id):
-    line = json.loads(line)
-    name = line['meta'].split("/")
-    item = line
+@functools.lru_cache(maxsize=META_CACHE_SIZE)
+def _message_attrs(meta):
     # assume trickle experiment by default
-    item['exType'] = 'trickle'
-    item['dialer'] = 'edge'
-    for attr in name:
-        attr = attr.split(":")
-        item[attr[0]] = attr[1]
+    item = {'exType': 'trickle', 'dialer': 'edge'}
+    item.update(parse_meta(meta))
     if 'topology' in item:
         item['eavesCount'] = item['topology'].split('-')[-1][0]
-    item['ts'] = line['ts']
+    return item
+
+
+def process_message_line(line, experiment_id):
+    item = loads(line)
+    # The defaults and meta attributes are only parsed once per distinct meta string
+    item.update(_message_attrs(item['meta']))
     item['experiment'] = experiment_id
     return item
 
 
-def aggregate_message_histories(results_dir):
-    aggregated_items = []
-    for subdir, _, files in os.walk(results_dir):
-        for filename in files:
-            filepath = subdir + os.sep + filename
-            if filepath.split("/")[-1] == "messageHistory.out":
-                experiment_id = filepath.split("/")[-4]  # use testground experiment ID
-                result_file = open(filepath, 'r')
-                for line in result_file.readlines():
-                    aggregated_items.append(process_message_line(line, experiment_id))
-    return aggregated_items
+def aggregate_message_histories(results_dir, filters=None):
+    return load_results(results_dir, ["messageHistory.out"], filters=filters)["messageHistory.out"]
 
 
-def process_metric_line(line, experiment_id):
-    line = json.loads(line)
-    name = line["name"].split('/')
-    value = (line["measures"])["value"]
+@functools.lru_cache(maxsize=META_CACHE_SIZE)
+def _metric_attrs(meta):
     # set default values
     item = {'eavesCount': '0', 'exType': 'trickle', 'dialer': 'edge', 'tricklingDelay': '0'}
-    for attr in name:
-        attr = attr.split(":")
-        item[attr[0]] = attr[1]
-    item["value"] = value
+    if meta:
+        item.update(parse_meta(meta))
+    return item
+
+
+def process_metric_line(line, experiment_id):
+    line = loads(line)
+    # The name is the meta string of the node followed by meta:<metric>. The defaults and meta attributes are only
+    # parsed once per node, so that all metrics of a node share them.
+    meta, _, metric = line["name"].rpartition("/")
+    item = dict(_metric_attrs(meta))
+    item.update(parse_meta(metric))
+    item["value"] = (line["measures"])["value"]
     item['experiment'] = experiment_id
     return item
 
 
-def aggregate_metrics(results_dir):
-    res = []
+def aggregate_metrics(results_dir, filters=None):
+    result_files = find_result_files(results_dir, ["results.out"])
+    res = load_result_files(result_files, ["results.out"], filters=filters)["results.out"]
+    # Only count the experiments with results, the results directory also holds the cache, exports and figures
+    return res, len({experiment_id for _, _, experiment_id in result_files})
+
+
+# Maps the name of every output file of the test plans to the function parsing its lines
+line_processors = {
+    "results.out": process_metric_line,
+    "messageHistory.out": process_message_line,
+    "globalInfo.out": process_info_line,
+}
+
+
+def find_result_files(results_dir, kinds=None):
+    """
+    Walk the results directory once and collect the output files of the given kinds
+    :param results_dir: the directory containing the testground results
+    :param kinds: the names of the output files to collect, all known kinds by default
+    :return: a list of (kind, filepath, experiment_id) tuples
+    """
+    kinds = line_processors.keys() if kinds is None else kinds
+    result_files = []
     for subdir, _, files in os.walk(results_dir):
-        for filename in files:
-            filepath = subdir + os.sep + filename
-            if filepath.split("/")[-1] == "results.out":
+        for filename in sorted(files):
+            if filename in kinds:
+                filepath = subdir + os.sep + filename
                 experiment_id = filepath.split("/")[-4]  # use testground experiment ID
-                result_file = open(filepath, 'r')
-                for l in result_file.readlines():
-                    res.append(process_metric_line(l, experiment_id))
-    return res, len(os.listdir(results_dir))
+                result_files.append((filename, filepath, experiment_id))
+    return result_files
+
+
+# Find the meta string of a line without decoding it
+_meta_patterns = {
+    "results.out": re.compile(r'"name"\s*:\s*"([^"]*)/meta:[^"/]*"'),
+    "messageHistory.out": re.compile(r'"meta"\s*:\s*"([^"]*)"'),
+}
+# Functions returning the attributes of the items parsed from a line with the given meta string
+_meta_attrs = {
+    "results.out": _metric_attrs,
+    "messageHistory.out": _message_attrs,
+}
+# Attributes shared by all lines of a results.out or messageHistory.out file, since they are fixed for the lifetime of
+# the instance the file belongs to. The sequence number is assigned once by the sync service and reused by all
+# permutations, whereas the file size and the trickling delay change with the permutation.
+INSTANCE_ATTRS = {"nodeType", "nodeTypeIndex", "seq", "dialer", "eavesCount", "latencyMS"}
+
+
+def _matches(attrs, filters):
+    for attr, values in filters.items():
+        if attrs.get(attr) not in values:
+            return False
+    return True
+
+
+def iter_result_file(kind, filepath, experiment_id, filters=None):
+    """
+    Lazily parse an output file line by line without reading it into memory first
+    :param kind: the name of the output file, used to pick the line parser
+    :param filepath: the path of the file
+    :param experiment_id: the testground experiment ID the file belongs to
+    :param filters: only parse the items matching these filters, see frames.normalize_filters. Items without a filtered
+    attribute don't match. Lines whose meta string doesn't match are skipped before they are decoded, and whole files
+    are skipped if the filters only concern attributes of the instance.
+    :return: a generator over the parsed items
+    """
+    filters = frames.normalize_filters(filters)
+    if "experiment" in filters:
+        if experiment_id not in filters["experiment"]:
+            return
+        filters = {attr: values for attr, values in filters.items() if attr != "experiment"}
+
+    process_line = line_processors[kind]
+    pattern = _meta_patterns.get(kind) if filters else None
+    instance_filters = pattern is not None and set(filters.keys()) <= INSTANCE_ATTRS
+    with open(filepath, 'r') as result_file:
+        for line in result_file:
+            if not line.strip():
+                continue
+            if pattern is not None:
+                match = pattern.search(line)
+                if match is not None:
+                    if not _matches(_meta_attrs[kind](match.group(1)), filters):
+                        if instance_filters:
+                            # No other line of the instance can match
+                            return
+                        continue
+                    yield process_line(line, experiment_id)
+                    continue
+            item = process_line(line, experiment_id)
+            if not filters or _matches(item, filters):
+                yield item
+
+
+def iter_results(results_dir, kind, filters=None):
+    """
+    Lazily parse all output files of one kind in the results directory
+    :param results_dir: the directory containing the testground results
+    :param kind: the name of the output files to parse
+    :param filters: only parse the items matching these filters, see iter_result_file
+    :return: a generator over the parsed items
+    """
+    for _, filepath, experiment_id in find_result_files(results_dir, [kind]):
+        yield from iter_result_file(kind, filepath, experiment_id, filters)
+
+
+def _load_result_file(result_file, filters=None):
+    kind, filepath, experiment_id = result_file
+    return kind, list(iter_result_file(kind, filepath, experiment_id, filters))
+
+
+def load_results(results_dir, kinds=None, processes=None, filters=None):
+    """
+    Parse the output files of the given kinds in the results directory, spreading the files over a process pool
+    :param results_dir: the directory containing the testground results
+    :param kinds: the names of the output files to parse, all known kinds by default
+    :param processes: the number of worker processes, the number of CPUs by default
+    :param filters: only parse the items matching these filters, see iter_result_file
+    :return: a dict mapping every kind to the list of its parsed items
+    """
+    kinds = list(line_processors.keys()) if kinds is None else kinds
+    return load_result_files(find_result_files(results_dir, kinds), kinds, processes, filters)
+
+
+def load_result_files(result_files, kinds, processes=None, filters=None):
+    """
+    Parse the given output files, spreading them over a process pool
+    :param result_files: the (kind, filepath, experiment_id) tuples returned by find_result_files
+    :param kinds: the kinds to return, even if no file of that kind was given
+    :param processes: the number of worker processes, the number of CPUs by default
+    :param filters: only parse the items matching these filters, see iter_result_file
+    :return: a dict mapping every kind to the list of its parsed items
+    """
+    results = {kind: [] for kind in kinds}
+    load_result_file = functools.partial(_load_result_file, filters=filters)
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(result_files) <= 1:
+        for kind, items in map(load_result_file, result_files):
+            results[kind].extend(items)
+        return results
+
+    with multiprocessing.Pool(processes) as pool:
+        for kind, items in pool.imap(load_result_file, result_files):
+            results[kind].extend(items)
+    return results
+
+
+def _load_result_records(result_file, filters=None):
+    kind, filepath, experiment_id = result_file
+    records = frames.Records(kind)
+    for item in iter_result_file(kind, filepath, experiment_id, filters):
+        records.append(item)
+    return kind, records
+
+
+def load_result_records(result_files, kinds, processes=None, filters=None):
+    """
+    Parse the given output files into compact column-wise records, spreading them over a process pool. Unlike
+    load_result_files, the items are not kept as dicts of strings, which saves most of their memory.
+    :param result_files: the (kind, filepath, experiment_id) tuples returned by find_result_files
+    :param kinds: the kinds to return, even if no file of that kind was given
+    :param processes: the number of worker processes, the number of CPUs by default
+    :param filters: only parse the items matching these filters, see iter_result_file
+    :return: a dict mapping every kind to its frames.Records
+    """
+    results = {kind: frames.Records(kind) for kind in kinds}
+    load_result_file = functools.partial(_load_result_records, filters=filters)
+
+    processes = processes or os.cpu_count() or 1
+    with instrumentation.stage("parse", files=len(result_files)) as measurement:
+        if processes == 1 or len(result_files) <= 1:
+            for kind, records in map(load_result_file, result_files):
+                results[kind].extend(records)
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                for kind, records in pool.imap(load_result_file, result_files):
+                    results[kind].extend(records)
+        measurement["records"] = sum(len(records) for records in results.values())
+    return results
 
 
 def group_by(agg, metric):
@@ -116,3 +319,28 @@ def group_by(agg, metric):
             res[item[metric]] = []
         res[item[metric]].append(item)
     return res
+
+
+def main():
+    args = parse_args()
+    results_dir = args.dir if args.dir else dir_path + "/../experiments/results"
+    outputs = args.outputs or ([] if args.plots else ["data"])
+
+    # The analysis and plotting modules are only imported when they are needed, so that exporting the data doesn't pay
+    # for importing the plotting libraries
+    if "data" in outputs:
+        import aggregates
+        merged, _ = aggregates.update(results_dir)
+        export_dir = args.export_dir if args.export_dir else os.path.join(results_dir, "exports")
+        for path in aggregates.export_tables(aggregates.create_tables(merged), export_dir, args.format):
+            print(path)
+
+    if args.plots:
+        import pdf
+        figure_names = [figure for plot in args.plots for figure in plots[plot]]
+        for path in pdf.create_pdfs(results_dir, figure_names, force=True):
+            print(path)
+
+
+if __name__ == '__main__':
+    main()
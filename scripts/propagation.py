@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+
+import frames
+import instrumentation
+
+# Columns identifying a want, the same as the key of the source estimators
+KEY = ['experiment', 'permutationIndex', 'run', 'cid']
+
+# Columns of the cell of a want, copied to its hops
+CELL_COLUMNS = ['exType', 'dialer', 'eavesCount', 'latencyMS', 'fileSize', 'tricklingDelay']
+
+
+class PropagationIndex:
+    """
+    Rebuilds how every want spread through the network from the messages received by all nodes. The first message a
+    node received with a want is the hop the want reached it by, so the hops of a want form a tree rooted at the leech,
+    with the sender of every hop as parent. The trees of all wants are built at once in a single sorted pass, the hops
+    only hold per-row arrays pointing to the row of their parent.
+    """
+
+    def __init__(self, messages, info_items, metrics=None):
+        """
+        :param messages: the messages received by all nodes as typed dataframe
+        :param info_items: the info items as typed dataframe, whose LeechInfo items name the leech and the time it
+        started to fetch
+        :param metrics: the metrics as typed dataframe, used to tell which hops happened before the leech had the
+        block, optional
+        """
+        messages = frames.ensure_frame("messageHistory.out", messages)
+        info_items = frames.ensure_frame("globalInfo.out", info_items)
+        self.hops = build_hops(messages, info_items, metrics)
+        self._wants = None
+
+    def wants(self):
+        """
+        Summarize the spread of every want
+        :return: a dataframe with the KEY and cell columns, the leech as source, the number of nodes the want reached,
+        of them connected to the leech and of them eavesdroppers, its longest path, the sum of the path lengths, the
+        time until the last node had it in ns and the number of nodes it reached before the leech had the block
+        """
+        if self._wants is None:
+            self._wants = summarize_wants(self.hops)
+        return self._wants
+
+    def timeline(self, experiment, permutation, run, cid):
+        """
+        Get the hops of a single want in the order they happened
+        :param experiment: the ID of the experiment
+        :param permutation: the permutation index
+        :param run: the number of the run
+        :param cid: the wanted CID
+        :return: a dataframe with the hops of the want, see build_hops
+        """
+        hops = self.hops
+        selected = (hops['experiment'] == experiment) & (hops['permutationIndex'] == permutation) & \
+                   (hops['run'] == run) & (hops['cid'] == cid)
+        return hops[selected].reset_index(drop=True)
+
+
+def _find_rows(sorted_keys, order, keys):
+    """
+    Look up the rows of keys in an array of unique keys
+    :param sorted_keys: the unique keys, sorted
+    :param order: the row of every sorted key
+    :param keys: the keys to look up
+    :return: the row of every key, -1 for keys that don't exist
+    """
+    positions = np.minimum(np.searchsorted(sorted_keys, keys), max(len(sorted_keys) - 1, 0))
+    found = (len(sorted_keys) > 0) & (sorted_keys[positions] == keys)
+    return np.where(found, order[positions], -1)
+
+
+@instrumentation.timed("propagation_index")
+def build_hops(messages, info_items, metrics=None):
+    """
+    Build the hops of all wants. Without the message history of all messages, only the hops of the CID the leech is
+    looking for are recorded.
+    :param messages: the messages received by all nodes as typed dataframe
+    :param info_items: the info items as typed dataframe
+    :param metrics: the metrics as typed dataframe, optional
+    :return: a dataframe with a row per node and want, holding the KEY and cell columns, the sender, receiver and type
+    of the receiving node, the time the node received the want, the row of the hop its sender received the want by
+    (-1 for hops sent by the leech or a sender that never recorded the want), the depth of the node in the tree (NA
+    if it isn't connected to the leech), the delay the hop added in ns, the time since the leech started to fetch in
+    ns, and whether the hop happened before the leech had the block (NA without metrics)
+    """
+    columns = KEY[:-1] + CELL_COLUMNS + ['ts', 'sender', 'receiver', 'nodeType', 'wants']
+    hops = messages[columns].explode('wants').rename(columns={'wants': 'cid'}).dropna(subset=['cid'])
+    # Sorting once puts the hops of a want next to each other in the order they happened. A stable sort keeps the
+    # first message seen on equal timestamps first, and only the first message of every receiver is a hop.
+    hops = hops.sort_values(KEY + ['ts'], kind='mergesort')
+    hops = hops.drop_duplicates(subset=KEY + ['receiver']).reset_index(drop=True)
+
+    # The leech is the root of the trees of all wants of a run, it started to fetch when it logged the LeechInfo
+    leeches = info_items[info_items['type'] == 'LeechInfo']
+    runs = leeches[KEY[:-1] + ['peer']].drop_duplicates(subset=KEY[:-1]).rename(columns={'peer': 'source'})
+    starts = leeches[KEY[:-1] + ['lookingFor', 'timestamp']].rename(columns={'lookingFor': 'cid'})
+    starts = starts.drop_duplicates(subset=KEY).assign(start=starts['timestamp'].astype('int64') * 1000)
+    hops = hops.merge(runs, on=KEY[:-1], how='left').merge(starts[KEY + ['start']], on=KEY, how='left')
+    # The leech may receive its own want back, but it isn't infected by that
+    hops = hops[hops['receiver'] != hops['source']].reset_index(drop=True)
+
+    want = hops.groupby(KEY, sort=False).ngroup().to_numpy().astype(np.int64)
+    nodes, node_names = pd.factorize(pd.concat([hops['receiver'], hops['sender']], ignore_index=True))
+    receivers, senders = nodes[:len(hops)].astype(np.int64), nodes[len(hops):].astype(np.int64)
+
+    # Every hop points to the hop its sender received the want by
+    receiver_keys = want * len(node_names) + receivers
+    order = np.argsort(receiver_keys, kind='stable')
+    parents = _find_rows(receiver_keys[order], order, want * len(node_names) + senders)
+    from_source = (hops['sender'] == hops['source']).to_numpy()
+    parents[from_source] = -1
+
+    # The depth of a hop is the depth of its parent plus one, so it is resolved level by level from the leech outwards
+    depth = np.where(from_source, 1, 0)
+    safe_parents = np.maximum(parents, 0)
+    resolved = from_source
+    while True:
+        reached = ~resolved & (parents >= 0) & resolved[safe_parents]
+        if not reached.any():
+            break
+        depth[reached] = depth[parents[reached]] + 1
+        resolved = resolved | reached
+
+    start = hops['start'].astype('Int64')
+    parent_ts = pd.Series(hops['ts'].to_numpy()[safe_parents], dtype='Int64').where(parents >= 0)
+    hops['parent'] = parents
+    hops['depth'] = pd.Series(depth, dtype='Int64').where(resolved)
+    hops['arrival'] = hops['ts'] - start
+    # The first hop is delayed relative to the start of the fetch, every other one relative to its parent
+    hops['hopDelay'] = (hops['ts'] - parent_ts).where(~from_source, hops['arrival'])
+
+    hops['beforeFetch'] = pd.array([pd.NA] * len(hops), dtype='boolean')
+    if metrics is not None and len(metrics) > 0:
+        metrics = frames.ensure_frame("results.out", metrics)
+        fetches = metrics[(metrics['nodeType'] == 'Leech') & (metrics['meta'] == 'time_to_fetch')]
+        fetches = fetches[KEY[:-1] + ['value']].drop_duplicates(subset=KEY[:-1]).rename(columns={'value': 'ttf'})
+        hops = hops.merge(fetches, on=KEY[:-1], how='left')
+        hops['beforeFetch'] = (hops['arrival'] <= hops['ttf']).astype('boolean').where(hops['ttf'].notna())
+        hops = hops.drop(columns='ttf')
+
+    return hops[KEY + CELL_COLUMNS + ['source', 'sender', 'receiver', 'nodeType', 'ts', 'parent', 'depth', 'hopDelay',
+                                      'arrival', 'beforeFetch']]
+
+
+def summarize_wants(hops):
+    """
+    Summarize the spread of every want, see PropagationIndex.wants
+    :param hops: the hops returned by build_hops
+    :return: a dataframe with a row per want
+    """
+    hops = hops.assign(eavesdropper=hops['nodeType'] == 'Eavesdropper',
+                       reachedBeforeFetch=hops['beforeFetch'].fillna(False).astype(int))
+    groups = hops.groupby(KEY, sort=False, dropna=False)
+    wants = groups.agg(**{column: (column, 'first') for column in CELL_COLUMNS + ['source']},
+                       nodes=('receiver', 'size'), connected=('depth', 'count'), eavesdroppers=('eavesdropper', 'sum'),
+                       maxDepth=('depth', 'max'), depthSum=('depth', 'sum'), spread=('arrival', 'max'),
+                       reachedBeforeFetch=('reachedBeforeFetch', 'sum'))
+    wants.loc[groups['beforeFetch'].count() == 0, 'reachedBeforeFetch'] = np.nan
+    return wants.reset_index()
+
+
+@instrumentation.timed("hop_delays")
+def hop_delays(hops, keys=('tricklingDelay',)):
+    """
+    Calculate the delay every forwarding hop adds depending on its distance from the leech
+    :param hops: the hops returned by build_hops
+    :param keys: the columns the delays are split up by in addition to the depth
+    :return: a dataframe with the keys, the depth, the number of hops and the mean and median delay of a hop in ms
+    """
+    hops = hops.dropna(subset=['depth', 'hopDelay'])
+    delays = hops['hopDelay'].astype(float) / 1e6
+    result = delays.groupby([hops[key] for key in list(keys) + ['depth']]).agg(['count', 'mean', 'median'])
+    return result.rename(columns={'count': 'hops', 'mean': 'mean_ms', 'median': 'median_ms'}).reset_index()
+
+
+@instrumentation.timed("path_lengths")
+def path_lengths(wants, keys=('tricklingDelay',)):
+    """
+    Calculate how far the wants spread, i.e. how many hops away from the leech they got. Only the summaries of the
+    wants are needed, so the summaries of several sets of results can be concatenated first.
+    :param wants: the summaries of the wants returned by summarize_wants
+    :param keys: the columns identifying a cell
+    :return: a dataframe with the keys, the number of wants, the mean number of nodes a want reached (and reached
+    before the leech had the block), the mean path length from the leech to a node, the mean and the largest longest
+    path of a want and the mean time until the last node had a want in ms
+    """
+    wants = wants.astype({'connected': float, 'depthSum': float, 'maxDepth': float, 'spread': float,
+                          'reachedBeforeFetch': float})
+    groups = wants.groupby(list(keys), dropna=False)
+    result = groups.agg(wants=('nodes', 'size'), mean_nodes=('nodes', 'mean'),
+                        mean_nodes_before_fetch=('reachedBeforeFetch', 'mean'), mean_max_depth=('maxDepth', 'mean'),
+                        max_depth=('maxDepth', 'max'), mean_spread_ms=('spread', 'mean'))
+    result['mean_spread_ms'] /= 1e6
+    result['mean_path_length'] = groups['depthSum'].sum() / groups['connected'].sum()
+    return result.reset_index()
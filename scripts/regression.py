@@ -0,0 +1,183 @@
+import argparse
+import math
+import sys
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import bootstrap
+import message_metrics_analysis
+
+# Columns identifying a cell, the cells of the two sets of results are matched by them
+KEYS = aggregates.CELL_KEYS + ["meta"]
+
+# Metrics that can be compared, for all of them larger values are worse
+metrics = ["time_to_fetch", "tcp_fetch"] + list(message_metrics_analysis.message_types.keys())
+# The TCP fetch doesn't go through bitswap, so a change of the forwarding logic can't affect it. It is only compared
+# when asked for, e.g. to check that the network conditions of both sets of results are the same.
+default_metrics = [metric for metric in metrics if metric != "tcp_fetch"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='''
+                                     Compare the time to fetch and the message counts of two result directories and
+                                     fail if any cell got significantly worse
+                                     ''')
+    parser.add_argument('baseline', type=str, help='Result directory of the baseline, e.g. before a change')
+    parser.add_argument('candidate', type=str, help='Result directory compared to the baseline, e.g. after a change')
+    parser.add_argument('-m', '--metrics', nargs='+', choices=metrics, default=default_metrics, help='''
+                        One or more metrics to compare, all but the TCP fetch by default
+                        ''')
+    parser.add_argument('--alpha', type=float, default=0.05, help='''
+                        Significance level of the Mann-Whitney U tests, adjusted for the number of cells with the
+                        Holm-Bonferroni method
+                        ''')
+    parser.add_argument('--min-change', type=float, default=0.05, help='''
+                        Smallest change relative to the baseline that counts, the whole confidence interval of the
+                        difference has to be beyond it
+                        ''')
+    parser.add_argument('--statistic', choices=["median", "mean"], default="median", help='''
+                        Statistic whose difference is bootstrapped, the median by default
+                        ''')
+    parser.add_argument('--resamples', type=int, default=bootstrap.N_RESAMPLES, help='''
+                        Number of bootstrap resamples per cell
+                        ''')
+    parser.add_argument('-o', '--output', type=str, help='Write the comparison of all cells to this CSV file')
+    parser.add_argument('-p', '--processes', type=int, help='''
+                        Number of worker processes parsing new results, the number of CPUs by default
+                        ''')
+    return parser.parse_args()
+
+
+def load_samples(results_dir, processes=None):
+    """
+    Load the samples of the metrics that can be compared, one per leech and run for the time to fetch and the average
+    over the nodes of a run for the message counts
+    :param results_dir: the directory containing the testground results
+    :param processes: the number of worker processes used to parse new results
+    :return: a dataframe with the keys, the metric as meta and its value
+    """
+    merged, _ = aggregates.update(results_dir, processes)
+    ttf = merged["ttf_samples"][KEYS + ["value"]].astype({"value": float})
+    counters = merged["message_samples"]
+    messages = counters[KEYS].assign(value=counters["sum"].astype(float) / counters["count"])
+    return pd.concat([ttf, messages], ignore_index=True)
+
+
+def _match_cells(baseline, candidate, keys):
+    cells = baseline[keys].drop_duplicates().merge(candidate[keys].drop_duplicates(), on=keys)
+    return cells.sort_values(keys, kind="stable").reset_index(drop=True)
+
+
+def mann_whitney(baseline, candidate, keys, column):
+    """
+    Run a Mann-Whitney U test for every cell both sets of samples have samples of at once, ranking the samples of all
+    cells in one pass. The p-values use the normal approximation with tie and continuity correction, which is accurate
+    for the tens of runs per cell of the experiments.
+    :param baseline: the dataframe holding the baseline samples
+    :param candidate: the dataframe holding the samples compared to the baseline
+    :param keys: the columns identifying a cell
+    :param column: the column holding the samples, missing values are ignored
+    :return: a dataframe with the keys, the U statistic of the candidate, the probability that a candidate sample is
+    larger than a baseline sample as effect, and the two-sided p-value
+    """
+    baseline = baseline.dropna(subset=[column])
+    candidate = candidate.dropna(subset=[column])
+    cells = _match_cells(baseline, candidate, keys)
+    cells["cell"] = np.arange(len(cells))
+    samples = pd.concat([baseline[keys + [column]].merge(cells, on=keys).assign(candidate=False),
+                         candidate[keys + [column]].merge(cells, on=keys).assign(candidate=True)], ignore_index=True)
+
+    cell = samples["cell"].to_numpy()
+    is_candidate = samples["candidate"].to_numpy()
+    ranks = samples.groupby("cell")[column].rank(method="average").to_numpy()
+    n1 = np.bincount(cell[~is_candidate], minlength=len(cells)).astype(float)
+    n2 = np.bincount(cell[is_candidate], minlength=len(cells)).astype(float)
+    n = n1 + n2
+    u = np.bincount(cell, weights=np.where(is_candidate, ranks, 0), minlength=len(cells)) - n2 * (n2 + 1) / 2
+
+    ties = samples.groupby(["cell", column]).size()
+    tie_sums = np.bincount(ties.index.get_level_values("cell"), weights=ties.to_numpy() ** 3 - ties.to_numpy(),
+                           minlength=len(cells))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_sums / (n * (n - 1))))
+        z = np.maximum(np.abs(u - n1 * n2 / 2) - 0.5, 0) / sigma
+    erfc = np.frompyfunc(math.erfc, 1, 1)
+    p = np.where(sigma > 0, erfc(np.nan_to_num(z) / math.sqrt(2)).astype(float), 1.0)
+
+    result = cells[keys].copy()
+    result["u"] = u
+    result["effect"] = u / (n1 * n2)
+    result["p"] = np.minimum(p, 1.0)
+    return result
+
+
+def holm(p):
+    """
+    Adjust p-values for multiple comparisons with the Holm-Bonferroni method
+    :param p: the p-values
+    :return: the adjusted p-values
+    """
+    p = np.asarray(p, dtype=float)
+    order = np.argsort(p, kind="stable")
+    adjusted = np.empty(len(p))
+    adjusted[order] = np.minimum(np.maximum.accumulate(p[order] * (len(p) - np.arange(len(p)))), 1.0)
+    return adjusted
+
+
+def compare(baseline, candidate, keys=None, alpha=0.05, min_change=0.05, statistic="median",
+            n_resamples=bootstrap.N_RESAMPLES, seed=0):
+    """
+    Compare two sets of samples cell by cell. A cell regressed if its Mann-Whitney U test is significant after
+    adjusting for the number of cells and the bootstrap confidence interval of the difference of the statistic lies
+    above the minimum change relative to the baseline; it improved if the same holds below it.
+    :param baseline: the dataframe holding the baseline samples, see load_samples
+    :param candidate: the dataframe holding the samples compared to the baseline
+    :param keys: the columns identifying a cell, KEYS by default
+    :param alpha: the significance level of the tests
+    :param min_change: the smallest change relative to the statistic of the baseline that counts
+    :param statistic: the statistic whose difference is bootstrapped, median or mean
+    :param n_resamples: the number of bootstrap resamples per cell
+    :param seed: the seed of the random number generator
+    :return: a dataframe with the keys, the bootstrapped difference, the test results and whether the cell regressed
+    or improved, for every cell both sets have samples of
+    """
+    keys = KEYS if keys is None else keys
+    differences = bootstrap.bootstrap_difference(baseline, candidate, keys, "value", statistic, n_resamples,
+                                                 seed=seed)
+    tests = mann_whitney(baseline, candidate, keys, "value")
+    result = differences.merge(tests, on=keys, how="left")
+    result["p_adjusted"] = holm(result["p"].to_numpy())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["relative_change"] = result["difference"] / result["baseline"].abs()
+    threshold = min_change * result["baseline"].abs()
+    significant = result["p_adjusted"] < alpha
+    result["regression"] = significant & (result["difference_low"] > threshold)
+    result["improvement"] = significant & (result["difference_high"] < -threshold)
+    return result
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    baseline = load_samples(args.baseline, args.processes)
+    candidate = load_samples(args.candidate, args.processes)
+    baseline = baseline[baseline["meta"].isin(args.metrics)]
+    candidate = candidate[candidate["meta"].isin(args.metrics)]
+
+    comparison = compare(baseline, candidate, alpha=args.alpha, min_change=args.min_change,
+                         statistic=args.statistic, n_resamples=args.resamples)
+    if args.output:
+        comparison.to_csv(args.output, index=False)
+
+    unmatched = len(_match_cells(baseline, baseline, KEYS)) + len(_match_cells(candidate, candidate, KEYS)) \
+        - 2 * len(comparison)
+    print(f"Compared {len(comparison)} cells, {unmatched} cells only exist in one of the result directories")
+    columns = KEYS + ["baseline", "candidate", "difference_low", "difference_high", "relative_change", "p_adjusted"]
+    for name, column in [("Improvements", "improvement"), ("Regressions", "regression")]:
+        cells = comparison[comparison[column]]
+        print(f"{name}: {len(cells)}")
+        if len(cells) > 0:
+            print(cells[columns].to_string(index=False))
+    if comparison["regression"].any():
+        sys.exit(1)
@@ -0,0 +1,125 @@
+import json
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+import frames
+import instrumentation
+import process
+
+# Bump whenever the layout of the cached frames changes to force a reparse of all results
+CACHE_VERSION = 2
+CACHE_DIR = ".cache"
+
+# Name of the cached frame of every output file
+FRAME_NAMES = {
+    "results.out": "metrics",
+    "messageHistory.out": "messages",
+    "globalInfo.out": "info",
+}
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "manifest.json"), 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != CACHE_VERSION:
+        return {}
+    return manifest.get("files", {})
+
+
+def _write_manifest(cache_dir, files):
+    tmp_path = os.path.join(cache_dir, "manifest.json.tmp")
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump({"version": CACHE_VERSION, "files": files}, manifest_file)
+    os.replace(tmp_path, os.path.join(cache_dir, "manifest.json"))
+
+
+def cached_files(results_dir):
+    """
+    Get the output files the cache of a results directory was built from
+    :param results_dir: the directory containing the testground results
+    :return: a dict mapping the path of every file relative to the results directory to its experiment ID, modification
+    time and size
+    """
+    return _read_manifest(os.path.join(results_dir, CACHE_DIR))
+
+
+def _read_frame(cache_dir, kind, filters=None):
+    path = os.path.join(cache_dir, FRAME_NAMES[kind] + ".parquet")
+    if not os.path.exists(path):
+        return None
+    if filters:
+        if not set(filters.keys()) <= set(pq.read_schema(path).names):
+            # Like the parsed items, rows without a filtered attribute don't match
+            return pd.read_parquet(path).iloc[0:0]
+        # Only the rows matching the filters are read
+        return pd.read_parquet(path, filters=frames.parquet_filters(filters))
+    return pd.read_parquet(path)
+
+
+def _write_frame(cache_dir, kind, df):
+    path = os.path.join(cache_dir, FRAME_NAMES[kind] + ".parquet")
+    tmp_path = path + ".tmp"
+    df.reset_index(drop=True).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def load(results_dir, kinds=None, processes=None, filters=None):
+    """
+    Load the typed frames of the results directory, only parsing the experiments whose output files are not cached yet
+    or changed since they were cached. The cache lives in the .cache folder of the results directory and is keyed by
+    the experiment ID as well as the modification time and size of every output file.
+    :param results_dir: the directory containing the testground results
+    :param kinds: the names of the output files to load, all known kinds by default
+    :param processes: the number of worker processes used to parse new results
+    :param filters: only load the rows matching these filters, see frames.normalize_filters. If the cache is up to date,
+    only the matching rows are read from it.
+    :return: a dict mapping every kind to its typed dataframe
+    """
+    kinds = list(FRAME_NAMES.keys()) if kinds is None else kinds
+    cache_dir = os.path.join(results_dir, CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    cached_files = _read_manifest(cache_dir)
+    cache_complete = all(os.path.exists(os.path.join(cache_dir, name + ".parquet")) for name in FRAME_NAMES.values())
+    if not cache_complete:
+        # Without all frames the cache is unusable, so everything is parsed again
+        cached_files = {}
+
+    result_files = process.find_result_files(results_dir)
+    current_files = {}
+    for _, filepath, experiment_id in result_files:
+        stat = os.stat(filepath)
+        current_files[os.path.relpath(filepath, results_dir)] = {
+            "experiment": experiment_id, "mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+    if cache_complete and cached_files == current_files:
+        with instrumentation.stage("cache_read") as measurement:
+            loaded = {kind: _read_frame(cache_dir, kind, filters) for kind in kinds}
+            measurement["records"] = sum(len(df) for df in loaded.values())
+        return loaded
+
+    # Reparse every experiment with a new, changed or removed output file
+    stale_experiments = {f["experiment"] for path, f in current_files.items() if cached_files.get(path) != f}
+    stale_experiments |= {f["experiment"] for path, f in cached_files.items() if path not in current_files}
+    to_parse = [f for f in result_files if f[2] in stale_experiments]
+    parsed = process.load_result_records(to_parse, list(FRAME_NAMES.keys()), processes)
+
+    loaded = {}
+    with instrumentation.stage("cache_update", experiments=len(stale_experiments)) as measurement:
+        for kind in FRAME_NAMES.keys():
+            df = frames.to_frame(kind, parsed[kind])
+            cached = _read_frame(cache_dir, kind) if cache_complete else None
+            if cached is not None and len(cached) > 0:
+                cached = cached[~cached["experiment"].isin(stale_experiments)]
+                df = pd.concat([cached, df], ignore_index=True) if len(df) > 0 else cached
+            loaded[kind] = df
+            _write_frame(cache_dir, kind, df)
+        _write_manifest(cache_dir, current_files)
+        measurement["records"] = sum(len(df) for df in loaded.values())
+
+    return {kind: frames.filter_frame(loaded[kind], filters) for kind in kinds}
@@ -0,0 +1,312 @@
+import argparse
+import heapq
+import math
+import multiprocessing
+import os
+import random
+
+import synthetic_results
+import topology
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+# Blocks up to this size are sent right away in response to a want-have instead of a HAVE, see
+# maxBlockSizeReplaceHasWithBlock in the decision engine
+MAX_BLOCK_SIZE_REPLACE_HAS_WITH_BLOCK = 1024
+# Segment size and initial congestion window of TCP, used to model the slow start of the TCP fetch
+TCP_SEGMENT_SIZE = 1460
+TCP_INITIAL_WINDOW = 10
+# Time the runs of a permutation are apart, only used for the timestamps
+RUN_INTERVAL_NS = 10 ** 9
+# Time to fetch recorded for the runs the leech couldn't fetch the file in, like RunTimeout of the test plan
+RUN_TIMEOUT_NS = 60 * 10 ** 9
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='''
+                                     Simulate the trickle-spreading test plan and write its outputs in the format of
+                                     testground, so that the analysis scripts run on them unchanged
+                                     ''')
+    parser.add_argument('-dir', '--dir', type=str, required=True, help='''
+                        Result directory to write to
+                        ''')
+    parser.add_argument('--runs', type=int, default=25, help='Runs per permutation')
+    parser.add_argument('--eaves', type=int, nargs='+', default=[0, 1, 4, 7], help='Eavesdropper counts')
+    parser.add_argument('--delays', type=int, nargs='+', default=[0, 50, 100, 150, 200, 250, 300],
+                        help='Trickling delays in ms')
+    parser.add_argument('--latencies', type=int, nargs='+', default=[50, 100, 150], help='Latencies in ms')
+    parser.add_argument('--file-sizes', type=int, nargs='+', default=[512, 153600, 1048576],
+                        help='File sizes in bytes')
+    parser.add_argument('--dialers', nargs='+', choices=list(topology.dialers.keys()),
+                        default=list(topology.dialers.keys()), help='Dialers')
+    parser.add_argument('--jitter-ms', type=float, default=1.0, help='''
+                        Mean of the exponentially distributed processing time added to every message in ms
+                        ''')
+    parser.add_argument('--record-all-messages', action='store_true', help='''
+                        Record every want a node receives instead of only the first one, like the
+                        record_all_messages parameter of the test plan
+                        ''')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the random generator')
+    parser.add_argument('-p', '--processes', type=int, help='''
+                        Number of compositions simulated at once, the number of CPUs by default
+                        ''')
+    return parser.parse_args()
+
+
+def count_blocks(file_size):
+    """
+    Count the blocks of a file chunked like the test plan does, a root block linking the leaves if there is more
+    than one
+    :param file_size: the size of the file in bytes
+    :return: a tuple of the number of leaves and the number of levels of the DAG
+    """
+    leaves = max(1, math.ceil(file_size / synthetic_results.BLOCK_SIZE))
+    return leaves, 1 if leaves == 1 else 2
+
+
+def tcp_fetch_time(latency_ns, file_size):
+    """
+    Model the TCP fetch of the test plan, which starts once the leech dialed the seed. The seed only accepts the
+    connection and sends the file once the last packet of the handshake arrived, so the file arrives two latencies
+    later, plus one round trip for every round of the slow start after the first.
+    :param latency_ns: the latency of every link in ns
+    :param file_size: the size of the file in bytes
+    :return: the time of the fetch in ns
+    """
+    segments = max(1, math.ceil(file_size / TCP_SEGMENT_SIZE))
+    rounds = max(1, math.ceil(math.log2(segments / TCP_INITIAL_WINDOW + 1)))
+    return 2 * latency_ns * rounds
+
+
+class Node:
+    __slots__ = ("node_id", "node_type", "peers", "has_block", "broadcast", "interested", "wants", "counters")
+
+    def __init__(self, node_id, node_type, peers):
+        self.node_id = node_id
+        self.node_type = node_type
+        self.peers = peers
+        self.has_block = node_type == "Seed"
+        self.broadcast = False
+        # Peers that sent a want for the root block, which the block is forwarded to once it arrives
+        self.interested = []
+        # (ts, sender) of every want received
+        self.wants = []
+        self.counters = dict.fromkeys(synthetic_results.METRIC_KEYS, 0)
+
+
+def simulate_run(rng, graph, node_types, latency_ns, delay_ns, file_size, jitter_ns):
+    """
+    Simulate the fetch of the root block of a file by the leech with a discrete event simulation. The trickle-spreading
+    bitswap sends a want-have to its peers one after another in random order, waiting the trickling delay after every
+    one of them. A node that doesn't have the block starts a relay session, which broadcasts the want the same way,
+    and forwards the block to every peer that wanted it as soon as it arrives. Eavesdroppers record the wants but never
+    send any.
+    :param rng: the random generator
+    :param graph: a dict mapping every node ID to the list of IDs of its neighbours, including the eavesdroppers
+    :param node_types: a dict mapping every node ID to its type
+    :param latency_ns: the latency of every link in ns
+    :param delay_ns: the trickling delay in ns
+    :param file_size: the size of the file in bytes
+    :param jitter_ns: the mean processing time added to every message in ns
+    :return: a tuple of the simulated nodes by ID and the time the leech got the file in ns, None if it didn't
+    """
+    nodes = {node_id: Node(node_id, node_types[node_id], peers) for node_id, peers in graph.items()}
+    leaves, levels = count_blocks(file_size)
+    root_size = file_size if leaves == 1 else 0
+    # Large blocks are only sent after a HAVE and a want-block, which takes another round trip
+    response_hops = 1 if root_size <= MAX_BLOCK_SIZE_REPLACE_HAS_WITH_BLOCK else 3
+
+    events = []
+    sequence = 0
+
+    def schedule(ts, kind, receiver, sender):
+        nonlocal sequence
+        ts += latency_ns + (rng.expovariate(1 / jitter_ns) if jitter_ns > 0 else 0)
+        heapq.heappush(events, (ts, sequence, kind, receiver, sender))
+        sequence += 1
+
+    def broadcast(node, ts):
+        node.broadcast = True
+        peers = list(node.peers)
+        rng.shuffle(peers)
+        # The trickling lock is held for the delay after every send
+        for i, peer in enumerate(peers):
+            schedule(ts + i * delay_ns, "want", peer, node.node_id)
+
+    leech = next(node for node in nodes.values() if node.node_type == "Leech")
+    broadcast(leech, 0)
+    # Blocks received along the path, to fetch the leaves along the path the root took
+    block_senders = {}
+    fetched = None
+    while events:
+        ts, _, kind, receiver, sender = heapq.heappop(events)
+        node = nodes[receiver]
+        node.counters["msgs_rcvd"] += 1
+        if kind == "want":
+            node.wants.append((ts, sender))
+            if node.node_type == "Eavesdropper":
+                continue
+            if node.has_block:
+                schedule(ts + (response_hops - 1) * latency_ns, "block", sender, receiver)
+                node.counters["blks_sent"] += 1
+            else:
+                node.interested.append(sender)
+                if not node.broadcast:
+                    broadcast(node, ts)
+        elif kind == "block":
+            node.counters["blks_rcvd"] += 1
+            if node.has_block:
+                node.counters["dup_blks_rcvd"] += 1
+                continue
+            node.has_block = True
+            block_senders[receiver] = sender
+            if node.node_type == "Leech":
+                fetched = ts
+            for peer in node.interested:
+                if peer != sender:
+                    schedule(ts, "block", peer, receiver)
+                    node.counters["blks_sent"] += 1
+
+    if fetched is not None and levels > 1:
+        # The leaves are requested with want-blocks from the peer that sent the root, which request them from the peer
+        # they got it from in turn, without any trickling
+        path = [leech.node_id]
+        while path[-1] in block_senders:
+            path.append(block_senders[path[-1]])
+        fetched += 2 * (len(path) - 1) * latency_ns
+        for hop, node_id in enumerate(path):
+            node = nodes[node_id]
+            if hop > 0:
+                # The want-blocks of the leaves
+                node.counters["msgs_rcvd"] += 1
+                node.counters["blks_sent"] += leaves
+            if hop < len(path) - 1:
+                node.counters["msgs_rcvd"] += 1
+                node.counters["blks_rcvd"] += leaves
+
+    block_size = file_size / (leaves + (1 if levels > 1 else 0))
+    for node in nodes.values():
+        for key in ["sent", "rcvd"]:
+            node.counters["data_" + key] = int(node.counters["blks_" + key] * block_size)
+        node.counters["dup_data_rcvd"] = int(node.counters["dup_blks_rcvd"] * block_size)
+    return nodes, fetched
+
+
+def simulate_experiment(results_dir, experiment_id, seed, eaves_count, latency, dialer, delays, file_sizes, runs,
+                        jitter_ms=1.0, record_all_messages=False):
+    """
+    Simulate a composition of the trickle-spreading test plan and write its outputs, one instance directory per node
+    :param results_dir: the directory to write the experiment to
+    :param experiment_id: the ID of the experiment
+    :param seed: the seed of the random generator of the experiment
+    :param eaves_count: the number of eavesdroppers
+    :param latency: the latency in ms
+    :param dialer: the dialer, either center or edge
+    :param delays: the trickling delays in ms, one permutation each
+    :param file_sizes: the file sizes in bytes, one permutation each
+    :param runs: the number of runs per permutation
+    :param jitter_ms: the mean processing time added to every message in ms
+    :param record_all_messages: whether to record every want a node receives instead of only the first one
+    :return: the ID of the experiment
+    """
+    rng = random.Random(seed)
+    types = synthetic_results.node_types(eaves_count)
+    peer_ids = [synthetic_results.random_id(rng, "12D3KooW", 44) for _ in types]
+    graph = topology.build_topology([(peer_ids[i], t, ti) for i, (t, ti) in enumerate(types)], dialer)
+    # Sort the neighbours, so that the simulation only depends on the seed
+    graph = {node_id: sorted(peers) for node_id, peers in graph.items()}
+    node_types = {peer_ids[i]: t for i, (t, _) in enumerate(types)}
+    index_of = {peer_id: i for i, peer_id in enumerate(peer_ids)}
+    latency_ns = latency * 10 ** 6
+    # The test plan runs the file sizes in the outer and the delays in the inner loop
+    permutations = [(f, d) for f in file_sizes for d in delays]
+
+    outputs = []
+    for index in range(len(types)):
+        instance_dir = os.path.join(results_dir, experiment_id, "nodes", str(index))
+        os.makedirs(instance_dir, exist_ok=True)
+        outputs.append({kind: open(os.path.join(instance_dir, kind), 'w')
+                        for kind in ["results.out", "messageHistory.out", "globalInfo.out"]})
+
+    ts = 1670000000000000000
+    for p_index, (file_size, delay) in enumerate(permutations):
+        for index, (node_type, type_index) in enumerate(types):
+            outputs[index]["globalInfo.out"].write(synthetic_results.format_node_info(
+                ts, peer_ids[index], node_type, type_index, dialer, eaves_count))
+        tcp_fetch = tcp_fetch_time(latency_ns, file_size)
+        for run in range(1, runs + 1):
+            ts += RUN_INTERVAL_NS
+            root_cid = synthetic_results.random_id(rng, "Qm", 44)
+            metas = [synthetic_results.create_meta('trickle', p_index, run, dialer, eaves_count, latency, delay,
+                                                   index + 1, file_size, node_type, type_index)
+                     for index, (node_type, type_index) in enumerate(types)]
+            outputs[0]["globalInfo.out"].write(synthetic_results.format_leech_info(metas[0], ts, peer_ids[0],
+                                                                                   root_cid))
+
+            nodes, fetched = simulate_run(rng, graph, node_types, latency_ns, delay * 10 ** 6, file_size,
+                                          jitter_ms * 10 ** 6)
+            for node_id, node in nodes.items():
+                index = index_of[node_id]
+                wants = node.wants if record_all_messages else node.wants[:1]
+                for arrival, sender in wants:
+                    outputs[index]["messageHistory.out"].write(synthetic_results.format_message(
+                        metas[index], node_id, ts + int(arrival), sender, [root_cid]))
+
+                values = dict(node.counters)
+                if node.node_type == "Leech":
+                    values["time_to_fetch"] = fetched if fetched is not None else RUN_TIMEOUT_NS
+                    values["leech_fails"] = 0 if fetched is not None else 1
+                    values["tcp_fetch"] = tcp_fetch
+                for key, value in values.items():
+                    outputs[index]["results.out"].write(synthetic_results.format_metric(
+                        ts, metas[index], key, value))
+
+    for files in outputs:
+        for f in files.values():
+            f.close()
+    return experiment_id
+
+
+def _simulate_experiment(task):
+    return simulate_experiment(*task)
+
+
+def simulate(results_dir, runs, eaves_counts, delays, latencies, file_sizes, dialers, jitter_ms=1.0,
+             record_all_messages=False, seed=1, processes=None):
+    """
+    Simulate a sweep over the parameters of the trickle-spreading test plan, one composition per eavesdropper count,
+    latency and dialer like the compositions of the experiments folder
+    :param results_dir: the directory to write the experiments to
+    :param runs: the number of runs per permutation
+    :param eaves_counts: the eavesdropper counts
+    :param delays: the trickling delays in ms
+    :param latencies: the latencies in ms
+    :param file_sizes: the file sizes in bytes
+    :param dialers: the dialers
+    :param jitter_ms: the mean processing time added to every message in ms
+    :param record_all_messages: whether to record every want a node receives instead of only the first one
+    :param seed: the seed of the random generator
+    :param processes: the number of compositions simulated at once, the number of CPUs by default
+    :return: the IDs of the simulated experiments
+    """
+    rng = random.Random(seed)
+    tasks = []
+    for eaves_count in eaves_counts:
+        for latency in latencies:
+            for dialer in dialers:
+                experiment_id = synthetic_results.random_id(rng, "c", 19).lower()
+                tasks.append((results_dir, experiment_id, rng.getrandbits(64), eaves_count, latency, dialer, delays,
+                              file_sizes, runs, jitter_ms, record_all_messages))
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(tasks) <= 1:
+        return list(map(_simulate_experiment, tasks))
+
+    with multiprocessing.Pool(min(processes, len(tasks))) as pool:
+        return pool.map(_simulate_experiment, tasks)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    simulate(args.dir, args.runs, args.eaves, args.delays, args.latencies, args.file_sizes, args.dialers,
+             args.jitter_ms, args.record_all_messages, args.seed, args.processes)
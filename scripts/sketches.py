@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+# Relative accuracy of the quantiles, every quantile is within 1% of the true value
+RELATIVE_ACCURACY = 0.01
+
+# Bucket of the values that are not positive, e.g. the time to fetch of failed fetches
+ZERO_BUCKET = np.iinfo(np.int32).min
+
+
+def _gamma(relative_accuracy):
+    return (1 + relative_accuracy) / (1 - relative_accuracy)
+
+
+def bucket_index(values, relative_accuracy=RELATIVE_ACCURACY):
+    """
+    Map values to the logarithmic buckets of a DDSketch. Bucket i holds the values in (gamma^(i-1), gamma^i], so every
+    value of a bucket is within the relative accuracy of the value representing it.
+    :param values: the values to map
+    :param relative_accuracy: the relative accuracy of the sketch
+    :return: an array with the bucket index of every value
+    """
+    values = np.asarray(values, dtype=float)
+    positive = values > 0
+    indices = np.full(len(values), ZERO_BUCKET, dtype=np.int32)
+    indices[positive] = np.ceil(np.log(values[positive]) / np.log(_gamma(relative_accuracy)))
+    return indices
+
+
+def bucket_value(indices, relative_accuracy=RELATIVE_ACCURACY):
+    """
+    Get the values representing buckets
+    :param indices: the bucket indices
+    :param relative_accuracy: the relative accuracy of the sketch
+    :return: an array with the value of every bucket, 0 for the bucket of values that are not positive
+    """
+    indices = np.asarray(indices)
+    gamma = _gamma(relative_accuracy)
+    values = 2 * np.power(gamma, indices.astype(float)) / (gamma + 1)
+    return np.where(indices == ZERO_BUCKET, 0.0, values)
+
+
+def create_sketches(df, keys, column, relative_accuracy=RELATIVE_ACCURACY):
+    """
+    Build the quantile sketch of a column for every cell in a single pass. A sketch is stored as the number of values
+    in each of its buckets, so the memory of a cell is bounded by the range of its values, however many values it has.
+    :param df: the dataframe holding the values
+    :param keys: the columns identifying a cell
+    :param column: the column holding the values, missing values are ignored
+    :param relative_accuracy: the relative accuracy of the sketches
+    :return: a dataframe with the keys, the bucket index and the number of values of every non-empty bucket
+    """
+    df = df[keys + [column]].dropna(subset=[column])
+    buckets = df[keys].assign(bucket=bucket_index(df[column].to_numpy(), relative_accuracy))
+    return buckets.groupby(keys + ["bucket"], dropna=False, observed=True).size().rename("count").reset_index()
+
+
+def merge_sketches(sketches, keys):
+    """
+    Merge the sketches of the same cells, e.g. computed for different experiments or result directories
+    :param sketches: a dataframe of sketches or a list of them, see create_sketches
+    :param keys: the columns identifying a cell, cells with the same keys are merged
+    :return: the merged sketches
+    """
+    if not isinstance(sketches, pd.DataFrame):
+        sketches = pd.concat(list(sketches), ignore_index=True)
+    return sketches.groupby(keys + ["bucket"], dropna=False, observed=True)["count"].sum().reset_index()
+
+
+def quantiles(sketches, keys, qs=(0.5, 0.95, 0.99), relative_accuracy=RELATIVE_ACCURACY):
+    """
+    Get quantiles of the sketch of every cell, merging the sketches of the same cells first
+    :param sketches: the sketches, see create_sketches
+    :param keys: the columns identifying a cell
+    :param qs: the quantiles to get, between 0 and 1
+    :param relative_accuracy: the relative accuracy the sketches were built with
+    :return: a dataframe with the keys, the number of values and a column like p50 or p99.9 for every quantile
+    """
+    sketches = merge_sketches(sketches, keys).sort_values(keys + ["bucket"], kind="stable")
+    groups = sketches.groupby(keys, sort=False, dropna=False, observed=True)
+    cumulative = groups["count"].cumsum().to_numpy()
+    totals = groups["count"].transform("sum").to_numpy()
+    values = bucket_value(sketches["bucket"].to_numpy(), relative_accuracy)
+
+    result = groups["count"].sum().rename("count").reset_index()
+    # The cell of every bucket, numbered in the order of the cells of the result
+    cells = groups.ngroup().to_numpy()
+    for q in qs:
+        # The quantile is the value of the first bucket of a cell whose cumulative count exceeds its rank. The last
+        # bucket of every cell does, so every cell gets a value.
+        positions = np.flatnonzero(cumulative > q * (totals - 1))
+        first = positions[np.unique(cells[positions], return_index=True)[1]]
+        result["p" + format(q * 100, "g")] = values[first]
+    return result
@@ -0,0 +1,225 @@
+import abc
+import math
+from collections import deque
+
+import pandas as pd
+
+import topology
+
+# Columns identifying the want whose source is estimated
+KEY = ['experiment', 'permutationIndex', 'run', 'cid']
+
+
+class MessageIndex:
+    """
+    Holds the messages received by the eavesdroppers once per wanted CID, sorted by timestamp. It is shared by all
+    estimators so that each of them only needs a single pass over the observations.
+    """
+
+    def __init__(self, messages):
+        columns = KEY[:-1] + ['ts', 'sender', 'receiver', 'tricklingDelay', 'wants']
+        observations = messages[columns].explode('wants').rename(columns={'wants': 'cid'})
+        observations = observations.dropna(subset=['cid'])
+        # A stable sort keeps the first message seen on equal timestamps first
+        self.observations = observations.sort_values(KEY + ['ts'], kind='mergesort').reset_index(drop=True)
+
+
+class SourceEstimator(abc.ABC):
+    """
+    Base class of all estimators. Subclasses implement predict_all, which predicts the source of every want in the
+    index at once.
+    """
+    name = None
+
+    def __init__(self, index):
+        self.index = index
+        self._predictions = None
+
+    @abc.abstractmethod
+    def predict_all(self):
+        """
+        Predict the source of every want in the index
+        :return: a dataframe with the KEY columns and the predicted source in the prediction column
+        """
+
+    def predictions(self):
+        if self._predictions is None:
+            self._predictions = self.predict_all()
+        return self._predictions
+
+    def predict_many(self, targets):
+        """
+        Predict the sources of a batch of targets
+        :param targets: the LeechInfo items as typed dataframe
+        :return: a series with the predicted source of every target, None if the eavesdroppers saw no message
+        """
+        predicted = targets[['experiment', 'permutationIndex', 'run', 'lookingFor']].merge(
+            self.predictions(), how='left', left_on=['experiment', 'permutationIndex', 'run', 'lookingFor'],
+            right_on=KEY)
+        prediction = predicted['prediction'].to_numpy(dtype=object)
+        prediction[pd.isna(prediction)] = None
+        return pd.Series(prediction, index=targets.index, name=self.name, dtype=object)
+
+
+class FirstSpyEstimator(SourceEstimator):
+    """
+    Predicts the sender of the earliest message any eavesdropper received, like FirstTimestampEstimator
+    """
+    name = 'First Spy'
+
+    def predict_all(self):
+        first = self.index.observations.groupby(KEY, sort=False).head(1)
+        return first[KEY + ['sender']].rename(columns={'sender': 'prediction'}).reset_index(drop=True)
+
+
+class MajorityVoteEstimator(SourceEstimator):
+    """
+    Every eavesdropper votes for the sender of the first message it received. The sender with the most votes is
+    predicted, ties are broken by the earliest timestamp.
+    """
+    name = 'Majority Vote'
+
+    def predict_all(self):
+        votes = self.index.observations.groupby(KEY + ['receiver'], sort=False).head(1)
+        votes = votes.groupby(KEY + ['sender'], sort=False).agg(votes=('ts', 'size'), ts=('ts', 'min')).reset_index()
+        votes = votes.sort_values(KEY + ['votes', 'ts'], ascending=[True] * len(KEY) + [False, True], kind='mergesort')
+        winner = votes.groupby(KEY, sort=False).head(1)
+        return winner[KEY + ['sender']].rename(columns={'sender': 'prediction'}).reset_index(drop=True)
+
+
+class DelayRankEstimator(SourceEstimator):
+    """
+    Estimates the time every sender started spreading the want and predicts the earliest one. A sender trickles its
+    wants to one peer after another, so its i-th message seen by the eavesdroppers was sent at least i trickling
+    delays after it started. Every observation is a message sent directly to an eavesdropper over a link of the same
+    latency, so the latency doesn't change which sender started first and isn't corrected for.
+    """
+    name = 'Delay Rank'
+
+    def predict_all(self):
+        observations = self.index.observations
+        rank = observations.groupby(KEY + ['sender'], sort=False).cumcount()
+        start = observations['ts'] - rank * observations['tricklingDelay'].astype('int64') * 1_000_000
+        starts = observations[KEY + ['sender']].assign(start=start)
+        starts = starts.groupby(KEY + ['sender'], sort=False)['start'].min().reset_index()
+        first = starts.loc[starts.groupby(KEY, sort=False)['start'].idxmin().to_numpy()]
+        return first[KEY + ['sender']].rename(columns={'sender': 'prediction'}).reset_index(drop=True)
+
+
+class RumorCentralityEstimator(SourceEstimator):
+    """
+    Predicts the node with the highest rumor centrality in the part of the overlay known to hold the want, i.e. the
+    senders seen by the eavesdroppers. The rumor centrality is computed on the BFS tree rooted at each candidate.
+    """
+    name = 'Rumor Centrality'
+
+    def __init__(self, index, graphs):
+        """
+        :param index: the shared message index
+        :param graphs: a dict mapping every experiment to its overlay without eavesdroppers, see topology.py
+        """
+        super().__init__(index)
+        self.graphs = graphs
+
+    def predict_all(self):
+        observations = self.index.observations
+        # Senders ordered by the time they were first seen, used to break ties
+        senders = observations.drop_duplicates(subset=KEY + ['sender'])
+        rows = []
+        for key, infected in senders.groupby(KEY, sort=False)['sender']:
+            graph = self.graphs.get(key[0])
+            prediction = None
+            if graph is not None:
+                prediction = predict_rumor_source(graph, list(infected))
+            rows.append(key + (prediction,))
+        return pd.DataFrame(rows, columns=KEY + ['prediction'])
+
+
+def rumor_centrality(graph, infected, root):
+    """
+    Calculate the logarithm of the rumor centrality of a root on the BFS tree of the infected subgraph
+    :param graph: a dict mapping every node to the set of its neighbours
+    :param infected: the set of infected nodes
+    :param root: the node to calculate the rumor centrality for
+    :return: the logarithm of the rumor centrality
+    """
+    parents = {root: None}
+    order = []
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        for neighbour in graph.get(node, ()):
+            if neighbour in infected and neighbour not in parents:
+                parents[neighbour] = node
+                queue.append(neighbour)
+
+    # Sizes of the subtrees, accumulated from the leaves upwards
+    sizes = dict.fromkeys(order, 1)
+    for node in reversed(order):
+        if parents[node] is not None:
+            sizes[parents[node]] += sizes[node]
+    return math.lgamma(len(order) + 1) - sum(math.log(size) for size in sizes.values())
+
+
+def predict_rumor_source(graph, infected):
+    """
+    Predict the source of a rumor as the infected node with the highest rumor centrality
+    :param graph: a dict mapping every node to the set of its neighbours
+    :param infected: the infected nodes ordered by the time they were seen, the earlier one wins ties
+    :return: the predicted source
+    """
+    infected_set = set(infected)
+    best, best_centrality = None, None
+    for node in infected:
+        centrality = rumor_centrality(graph, infected_set, node)
+        if best_centrality is None or centrality > best_centrality + 1e-9:
+            best, best_centrality = node, centrality
+    return best
+
+
+def create_estimators(messages, info_items, topology_messages=None):
+    """
+    Create all estimators sharing one message index
+    :param messages: the messages received by the eavesdroppers as typed dataframe
+    :param info_items: the info items as typed dataframe, whose NodeInfo items are used to build the overlay
+    :param topology_messages: the messages of all nodes used to approximate the overlay of experiments whose NodeInfo
+    items don't contain the node type index
+    :return: the list of estimators
+    """
+    index = MessageIndex(messages)
+    graphs = {}
+    if topology_messages is not None and len(topology_messages) > 0:
+        graphs.update(topology.graphs_from_messages(topology_messages))
+    graphs.update(topology.graphs_from_node_info(info_items))
+    return [FirstSpyEstimator(index), MajorityVoteEstimator(index), DelayRankEstimator(index),
+            RumorCentralityEstimator(index, graphs)]
+
+
+def get_prediction_counts(estimators, targets, keys):
+    """
+    Count the correct predictions of every estimator and the targets of every cell
+    :param estimators: the estimators to evaluate
+    :param targets: the LeechInfo items containing info about the true source as typed dataframe
+    :param keys: the columns identifying a cell, e.g. eavesCount, latencyMS, experiment and tricklingDelay
+    :return: a long dataframe with the keys, the name of the estimator, the number of hits and of targets
+    """
+    counts = []
+    for estimator in estimators:
+        correct = (estimator.predict_many(targets) == targets['peer']).astype(int)
+        count = correct.groupby([targets[key] for key in keys], sort=False).agg(['sum', 'size'])
+        count = count.rename(columns={'sum': 'hits', 'size': 'targets'})
+        counts.append(count.reset_index().assign(estimator=estimator.name))
+    return pd.concat(counts, ignore_index=True)
+
+
+def get_prediction_rates(estimators, targets, keys):
+    """
+    Calculate the prediction rate of every estimator for every cell
+    :param estimators: the estimators to evaluate
+    :param targets: the LeechInfo items containing info about the true source as typed dataframe
+    :param keys: the columns identifying a cell, e.g. eavesCount, latencyMS, experiment and tricklingDelay
+    :return: a long dataframe with the keys, the name of the estimator and the rate
+    """
+    counts = get_prediction_counts(estimators, targets, keys)
+    return counts[keys].assign(rate=counts['hits'] / counts['targets'], estimator=counts['estimator'])
@@ -0,0 +1,213 @@
+import argparse
+import os
+import random
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+PASSIVE_COUNT = 9
+METRIC_KEYS = ["msgs_rcvd", "data_sent", "data_rcvd", "dup_data_rcvd", "blks_sent", "blks_rcvd", "dup_blks_rcvd"]
+BLOCK_SIZE = 256 * 1024
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Write a synthetic testground results tree')
+    parser.add_argument('-dir', '--dir', type=str, required=True, help='''
+                        Result directory to write to
+                        ''')
+    parser.add_argument('--runs', type=int, default=10, help='Runs per permutation')
+    parser.add_argument('--eaves', type=int, nargs='+', default=[0, 1, 4, 7], help='Eavesdropper counts')
+    parser.add_argument('--delays', type=int, nargs='+', default=[0, 50, 100, 150, 200, 250, 300],
+                        help='Trickling delays in ms')
+    parser.add_argument('--latencies', type=int, nargs='+', default=[50, 100, 150], help='Latencies in ms')
+    parser.add_argument('--file-sizes', type=int, nargs='+', default=[512], help='File sizes in bytes')
+    parser.add_argument('--dialers', nargs='+', default=['center', 'edge'], help='Dialers')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the random generator')
+    parser.add_argument('--no-baseline', action='store_true', help='Don\'t write baseline compositions')
+    return parser.parse_args()
+
+
+def random_id(rng, prefix, length):
+    return prefix + "".join(rng.choice(BASE58_ALPHABET) for _ in range(length))
+
+
+def create_meta(ex_type, permutation, run, dialer, eaves_count, latency, delay, seq, file_size, node_type, type_index):
+    """
+    Create the meta string of a node the same way CreateMetaFromParams of the test plans does
+    """
+    if ex_type == 'baseline':
+        return f"exType:baseline/permutationIndex:0/run:{run}/dialer:{dialer}/eavesCount:{eaves_count}/" \
+               f"latencyMS:{latency}/seq:{seq}/fileSize:{file_size}/nodeType:{node_type}/nodeTypeIndex:{type_index}"
+    return f"exType:trickle/permutationIndex:{permutation}/run:{run}/dialer:{dialer}/eavesCount:{eaves_count}/" \
+           f"latencyMS:{latency}/tricklingDelay:{delay}/seq:{seq}/fileSize:{file_size}/nodeType:{node_type}/" \
+           f"nodeTypeIndex:{type_index}"
+
+
+def format_node_info(ts, node_id, node_type, type_index, dialer, eaves_count):
+    """
+    Format a NodeInfo line of globalInfo.out, see RecordNodeInfo of the test plan
+    """
+    return "{ \"timestamp\": \"%d\", \"type\": \"NodeInfo\", \"nodeId\": \"%s\", \"nodeType\": \"%s\", " \
+           "\"nodeTypeIndex\": \"%d\", \"dialer\": \"%s\", \"exType\": \"trickle\", \"eavesCount\": \"%d\" }\n" \
+           % (ts // 1000, node_id, node_type, type_index, dialer, eaves_count)
+
+
+def format_leech_info(meta, ts, peer_id, root_cid):
+    """
+    Format a LeechInfo line of globalInfo.out, naming the leech and the CID it is looking for
+    """
+    return "{ \"meta\": \"%s\", \"timestamp\": \"%d\", \"type\": \"LeechInfo\", \"peer\": \"%s\", " \
+           "\"lookingFor\": \"%s\" }\n" % (meta, ts // 1000, peer_id, root_cid)
+
+
+def format_message(meta, receiver, ts, sender, wants):
+    """
+    Format a line of messageHistory.out, see appendMessageHistoryEntry of the test plan
+    """
+    return "{ \"meta\": \"%s\", \"receiver\": \"%s\", \"ts\": \"%d\", \"sender\": \"%s\", \"message\": " \
+           "{ \"wants\": [%s] } }\n" % (meta, receiver, ts, sender, ", ".join("\"%s\"" % want for want in wants))
+
+
+def format_metric(ts, meta, key, value):
+    """
+    Format a metric point of results.out
+    """
+    return "{\"ts\":%d,\"type\":\"point\",\"name\":\"%s/meta:%s\",\"measures\":{\"value\":%s}}\n" \
+           % (ts, meta, key, float(value))
+
+
+def node_types(eaves_count):
+    """
+    Create the list of (nodeType, nodeTypeIndex) of all instances, in the order ParseType assigns them by seq
+    """
+    types = [("Leech", 0), ("Seed", 0)]
+    types += [("Eavesdropper", i) for i in range(eaves_count)]
+    types += [("Passive", i) for i in range(PASSIVE_COUNT)]
+    return types
+
+
+def write_experiment(results_dir, rng, ex_type, experiment_id, eaves_count, latency, dialer, delays, file_sizes, runs):
+    """
+    Write the outputs of a single composition, one instance directory per node
+    """
+    if ex_type == 'baseline':
+        eaves_count = 0
+        delays = [0]
+    types = node_types(eaves_count)
+    peer_ids = [random_id(rng, "12D3KooW", 44) for _ in types]
+    permutations = [(f, d) for f in file_sizes for d in delays]
+
+    # the baseline test plan only emits metrics
+    kinds = ["results.out"] if ex_type == 'baseline' else ["results.out", "messageHistory.out", "globalInfo.out"]
+    outputs = []
+    for index in range(len(types)):
+        instance_dir = os.path.join(results_dir, experiment_id, "nodes", str(index))
+        os.makedirs(instance_dir, exist_ok=True)
+        outputs.append({kind: open(os.path.join(instance_dir, kind), 'w') for kind in kinds})
+
+    ts = 1670000000000000000
+    for p_index, (file_size, delay) in enumerate(permutations):
+        blocks = max(1, file_size // BLOCK_SIZE + (1 if file_size % BLOCK_SIZE else 0))
+        for index, (node_type, type_index) in enumerate(types):
+            if ex_type == 'baseline':
+                continue
+            outputs[index]["globalInfo.out"].write(
+                format_node_info(ts, peer_ids[index], node_type, type_index, dialer, eaves_count))
+        tcp_fetch = latency * 4e6 + file_size * 20 + rng.gauss(0, 1e6)
+        for run in range(1, runs + 1):
+            ts += 10 ** 9
+            root_cid = random_id(rng, "Qm", 44)
+            metas = [create_meta(ex_type, p_index, run, dialer, eaves_count, latency, delay, index + 1, file_size,
+                                 node_type, type_index) for index, (node_type, type_index) in enumerate(types)]
+            if ex_type != 'baseline':
+                outputs[0]["globalInfo.out"].write(format_leech_info(metas[0], ts, peer_ids[0], root_cid))
+                write_message_history(rng, outputs, types, peer_ids, metas, root_cid, ts, latency, delay)
+
+            # hops of the want from the leech to the seed, each adding latency and trickling delay
+            hops = rng.randint(2, 4)
+            time_to_fetch = (hops * (latency + delay) + 2 * latency * blocks) * 1e6 + rng.expovariate(1 / 50e6)
+            for index, (node_type, _) in enumerate(types):
+                values = node_metrics(rng, node_type, blocks, file_size, eaves_count)
+                if node_type == "Leech":
+                    values["time_to_fetch"] = time_to_fetch
+                    values["leech_fails"] = 0
+                    values["tcp_fetch"] = tcp_fetch
+                for key, value in values.items():
+                    outputs[index]["results.out"].write(format_metric(ts, metas[index], key, value))
+
+    for files in outputs:
+        for f in files.values():
+            f.close()
+
+
+def write_message_history(rng, outputs, types, peer_ids, metas, root_cid, ts, latency, delay):
+    """
+    Write the first want every node received in a run. The leech trickles its want to its peers in random order, so
+    the later an eavesdropper is served by the leech, the more likely a relaying passive reaches it first.
+    """
+    peer_count = len(types) - 1
+    for index, (node_type, _) in enumerate(types):
+        if node_type == "Leech":
+            continue
+        rank = rng.randrange(peer_count)
+        arrival = ts + (latency + rank * delay) * 10 ** 6 + rng.randint(0, 2 * 10 ** 6)
+        sender = peer_ids[0]
+        relayed = ts + (2 * latency + delay) * 10 ** 6 + rng.randint(0, 4 * 10 ** 6)
+        if relayed < arrival:
+            arrival = relayed
+            sender = peer_ids[rng.choice([i for i, t in enumerate(types) if t[0] == "Passive" and i != index])]
+        outputs[index]["messageHistory.out"].write(
+            format_message(metas[index], peer_ids[index], arrival, sender, [root_cid]))
+
+
+def node_metrics(rng, node_type, blocks, file_size, eaves_count):
+    """
+    Create the bitswap stats a node emits at the end of a run
+    """
+    values = dict.fromkeys(METRIC_KEYS, 0)
+    values["msgs_rcvd"] = rng.randint(1, 4 + eaves_count)
+    if node_type == "Seed":
+        values["blks_sent"] = blocks + rng.randint(0, 1)
+        values["data_sent"] = file_size * values["blks_sent"] // blocks
+    elif node_type in ("Leech", "Passive") and (node_type == "Leech" or rng.random() < 0.3):
+        values["blks_rcvd"] = blocks + rng.randint(0, 1)
+        values["dup_blks_rcvd"] = values["blks_rcvd"] - blocks
+        values["data_rcvd"] = file_size * values["blks_rcvd"] // blocks
+        values["dup_data_rcvd"] = file_size * values["dup_blks_rcvd"] // blocks
+        if node_type == "Passive":
+            values["blks_sent"] = rng.randint(0, blocks)
+            values["data_sent"] = file_size * values["blks_sent"] // blocks
+    return values
+
+
+def generate(results_dir, runs, eaves_counts, delays, latencies, file_sizes, dialers, seed=1, baseline=True):
+    """
+    Generate a synthetic results tree in the formats emitted by the testground test plans
+    :param results_dir: the directory to write the experiments to
+    :param runs: the number of runs per permutation
+    :param eaves_counts: the eavesdropper counts, one composition each
+    :param delays: the trickling delays in ms
+    :param latencies: the latencies in ms, one composition each
+    :param file_sizes: the file sizes in bytes
+    :param dialers: the dialers, one composition each
+    :param seed: the seed of the random generator
+    :param baseline: whether to also write baseline compositions
+    :return: the ids of the generated experiments
+    """
+    rng = random.Random(seed)
+    experiments = []
+    configs = [('trickle', e, l, d) for e in eaves_counts for l in latencies for d in dialers]
+    if baseline:
+        configs += [('baseline', 0, l, d) for l in latencies for d in dialers]
+    for ex_type, eaves_count, latency, dialer in configs:
+        experiment_id = random_id(rng, "c", 19).lower()
+        write_experiment(results_dir, rng, ex_type, experiment_id, eaves_count, latency, dialer, delays, file_sizes,
+                         runs)
+        experiments.append(experiment_id)
+    return experiments
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    generate(args.dir, args.runs, args.eaves, args.delays, args.latencies, args.file_sizes, args.dialers, args.seed,
+             not args.no_baseline)
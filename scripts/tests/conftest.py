@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# The scripts import each other as top level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import simulator  # noqa: E402
+import synthetic_results  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def synthetic_dir(tmp_path_factory):
+    """
+    A small synthetic results tree with two file sizes and two trickling delays per instance
+    """
+    results_dir = str(tmp_path_factory.mktemp("synthetic"))
+    synthetic_results.generate(results_dir, runs=2, eaves_counts=[1], delays=[0, 50], latencies=[50],
+                               file_sizes=[512, 153600], dialers=["edge"], baseline=False)
+    return results_dir
+
+
+@pytest.fixture(scope="session")
+def simulated_dir(tmp_path_factory):
+    """
+    A small simulated results tree with one composition per dialer, two trickling delays and two file sizes
+    """
+    results_dir = str(tmp_path_factory.mktemp("simulated"))
+    simulator.simulate(results_dir, runs=3, eaves_counts=[1], delays=[0, 100], latencies=[50],
+                       file_sizes=[512, 1048576], dialers=["center", "edge"], processes=1)
+    return results_dir
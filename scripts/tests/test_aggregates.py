@@ -0,0 +1,81 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+import aggregates
+import result_cache
+import synthetic_results
+
+
+def _sorted(df):
+    df = df.reset_index(drop=True)
+    return df.sort_values(list(df.columns), kind="mergesort").reset_index(drop=True)
+
+
+def _assert_same(actual, expected):
+    for name in aggregates.AGGREGATE_COLUMNS.keys():
+        pd.testing.assert_frame_equal(_sorted(actual[name]), _sorted(expected[name]), check_dtype=False,
+                                      check_categorical=False)
+
+
+@pytest.fixture
+def results_dir(synthetic_dir, tmp_path):
+    results_dir = str(tmp_path / "results")
+    shutil.copytree(synthetic_dir, results_dir)
+    return results_dir
+
+
+def _add_experiment(results_dir, tmp_path):
+    new_dir = str(tmp_path / "new")
+    [experiment] = synthetic_results.generate(new_dir, runs=2, eaves_counts=[1], delays=[50], latencies=[100],
+                                              file_sizes=[512], dialers=["center"], seed=2, baseline=False)
+    shutil.copytree(f"{new_dir}/{experiment}", f"{results_dir}/{experiment}")
+    return experiment
+
+
+def test_all_aggregates_are_computed(results_dir):
+    merged, changes = aggregates.update(results_dir, processes=1)
+    for name, columns in aggregates.AGGREGATE_COLUMNS.items():
+        assert list(merged[name].columns) == columns
+        assert len(merged[name]) > 0, name
+    _assert_same(changes, merged)
+
+
+def test_update_only_computes_added_experiments(results_dir, tmp_path):
+    aggregates.update(results_dir, processes=1)
+    experiment = _add_experiment(results_dir, tmp_path)
+
+    merged, changes = aggregates.update(results_dir, processes=1)
+    for name in aggregates.AGGREGATE_COLUMNS.keys():
+        assert set(changes[name]["experiment"]) == {experiment}, name
+    _assert_same(merged, aggregates.compute(result_cache.load(results_dir, processes=1)))
+
+    merged_again, changes = aggregates.update(results_dir, processes=1)
+    assert all(len(df) == 0 for df in changes.values())
+    _assert_same(merged_again, merged)
+
+
+def test_removed_experiments_are_dropped(results_dir, tmp_path):
+    before, _ = aggregates.update(results_dir, processes=1)
+    experiment = _add_experiment(results_dir, tmp_path)
+    aggregates.update(results_dir, processes=1)
+    shutil.rmtree(f"{results_dir}/{experiment}")
+
+    after, changes = aggregates.update(results_dir, processes=1)
+    _assert_same(after, before)
+    assert set(changes["ttf_samples"]["experiment"]) == {experiment}
+
+
+def test_tables(results_dir, tmp_path):
+    merged, _ = aggregates.update(results_dir, processes=1)
+    tables = aggregates.create_tables(merged)
+    ttf = tables["ttf"]
+    assert (ttf["min_ms"] <= ttf["median_ms"]).all() and (ttf["median_ms"] <= ttf["max_ms"]).all()
+    assert ttf["count"].sum() == len(merged["ttf_samples"])
+    rates = tables["prediction_rates"]
+    assert rates["rate"].between(0, 1).all()
+    assert (rates["rate_low"] <= rates["rate"]).all() and (rates["rate"] <= rates["rate_high"]).all()
+
+    paths = aggregates.export_tables(tables, str(tmp_path / "exports"), "parquet")
+    assert len(pd.read_parquet(paths[0])) == len(tables["ttf"])
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bootstrap
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(3)
+    return pd.DataFrame({"cell": np.repeat(["a", "b", "c"], [7, 6, 40]),
+                         "value": np.concatenate([[1, 2, 3, 5, 8, 13, 21], [4, 4, 6, 9, 10, 30],
+                                                  rng.exponential(100, 40)])})
+
+
+def test_point_estimates(samples):
+    result = bootstrap.bootstrap_statistics(samples, ["cell"], "value", n_resamples=200)
+    groups = samples.groupby("cell")["value"]
+    np.testing.assert_allclose(result["mean"], groups.mean().to_numpy())
+    np.testing.assert_allclose(result["median"], groups.median().to_numpy())
+    assert result["samples"].tolist() == [7, 6, 40]
+    for statistic in ["mean", "median"]:
+        assert (result[statistic + "_low"] <= result[statistic]).all()
+        assert (result[statistic] <= result[statistic + "_high"]).all()
+
+
+@pytest.mark.parametrize("values", [[1, 2, 3, 5, 8, 13, 21], [4, 4, 6, 9, 10, 30]])
+def test_resampled_medians_match_naive_resampling(values):
+    values = np.array(values, dtype=float)
+    n_resamples = 40000
+    fast, _ = bootstrap._resample(values, np.array([len(values)]), ("median",), n_resamples,
+                                  np.random.default_rng(1))
+    draws = np.random.default_rng(2).choice(values, size=(n_resamples, len(values)))
+    naive = np.median(draws, axis=1)
+    for median in np.union1d(fast["median"][:, 0], naive):
+        assert abs((fast["median"][:, 0] == median).mean() - (naive == median).mean()) < 0.01
+
+
+def test_mean_resamples_do_not_depend_on_the_chunk_size(samples, monkeypatch):
+    result = bootstrap.bootstrap_statistics(samples, ["cell"], "value", statistics=("mean",), n_resamples=500)
+    monkeypatch.setattr(bootstrap, "MAX_CHUNK_SIZE", 100)
+    chunked = bootstrap.bootstrap_statistics(samples, ["cell"], "value", statistics=("mean",), n_resamples=500)
+    pd.testing.assert_frame_equal(result, chunked)
+
+
+def test_constant_and_missing_samples():
+    df = pd.DataFrame({"cell": ["a", "a", "a", "b"], "value": [5.0, 5.0, 5.0, np.nan]})
+    result = bootstrap.bootstrap_statistics(df, ["cell"], "value", n_resamples=100)
+    assert result["cell"].tolist() == ["a"]
+    assert result[["median_low", "median_high", "mean_low", "mean_high"]].iloc[0].tolist() == [5.0] * 4
+    empty = bootstrap.bootstrap_statistics(df[df["cell"] == "b"], ["cell"], "value")
+    assert len(empty) == 0 and "median_low" in empty
+
+
+def test_rate_intervals():
+    low, high = bootstrap.bootstrap_rates([0, 10, 5, 0], [10, 10, 10, 0], n_resamples=1000)
+    assert low[0] == high[0] == 0 and low[1] == high[1] == 1
+    assert low[2] < 0.5 < high[2]
+    assert np.isnan(low[3]) and np.isnan(high[3])
+
+    counts = pd.DataFrame({"hits": [30, 70], "targets": [100, 100]}, index=[4, 9])
+    result = bootstrap.add_rate_intervals(counts, n_resamples=1000)
+    assert result.index.tolist() == [4, 9]
+    assert (result["rate_low"] < result["hits"] / 100).all() and (result["hits"] / 100 < result["rate_high"]).all()
+    pd.testing.assert_frame_equal(result, bootstrap.add_rate_intervals(counts, n_resamples=1000))
+
+
+def test_prediction_rate_band_pools_the_experiments():
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    import prediction_analysis
+
+    # Two experiments per delay, with 10 and 30 targets
+    df = pd.DataFrame({"Delay": [0, 0, 50, 50], "Hits": [2, 18, 1, 3], "Targets": [10, 30, 10, 30]})
+    fig = plt.figure()
+    prediction_analysis._plot_pooled_rate(df["Delay"], df["Hits"], df["Targets"], color="C0")
+    ax = fig.axes[0]
+    line, = ax.get_lines()
+    np.testing.assert_allclose(line.get_ydata(), [20 / 40, 4 / 40])
+
+    low, high = bootstrap.bootstrap_rates([20, 4], [40, 40])
+    band = ax.collections[0].get_paths()[0].vertices
+    for delay, expected_low, expected_high in zip([0, 50], low, high):
+        bounds = band[band[:, 0] == delay, 1]
+        np.testing.assert_allclose([bounds.min(), bounds.max()], [expected_low, expected_high])
+    plt.close(fig)
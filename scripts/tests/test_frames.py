@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+import frames
+import process
+
+
+@pytest.fixture(scope="module")
+def parsed(synthetic_dir):
+    kinds = list(process.line_processors.keys())
+    result_files = process.find_result_files(synthetic_dir, kinds)
+    items = process.load_result_files(result_files, kinds, processes=1)
+    records = process.load_result_records(result_files, kinds, processes=1)
+    return items, records
+
+
+@pytest.mark.parametrize("kind", ["results.out", "messageHistory.out", "globalInfo.out"])
+def test_records_and_items_give_the_same_frame(parsed, kind):
+    items, records = parsed
+    from_items = frames.to_frame(kind, items[kind])
+    from_records = frames.to_frame(kind, records[kind])
+    assert len(from_items) > 0
+    pd.testing.assert_frame_equal(from_items, from_records[list(from_items.columns)], check_dtype=False)
+
+
+@pytest.mark.parametrize("kind", ["results.out", "messageHistory.out"])
+def test_items_round_trip(parsed, kind):
+    items, _ = parsed
+    assert frames.to_items(kind, frames.to_frame(kind, items[kind])) == items[kind]
+
+
+def test_records_pad_missing_attributes():
+    records = frames.Records("results.out")
+    records.append({"meta": "time_to_fetch", "value": 1.0, "fileSize": "512"})
+    records.append({"meta": "tcp_fetch", "value": 2.0})
+    records.append({"meta": "time_to_fetch", "value": 3.0, "run": "1"})
+    df = frames.to_frame("results.out", records)
+    assert df["fileSize"].tolist() == [512, pd.NA, pd.NA]
+    assert df["run"].tolist() == [pd.NA, pd.NA, 1]
+
+
+def test_filter_frame():
+    df = pd.DataFrame({"nodeType": ["Leech", "Eavesdropper", "Passive"],
+                       "fileSize": pd.array([512, 153600, 512], dtype="Int64")})
+    assert frames.filter_frame(df, {"fileSize": 512})["nodeType"].tolist() == ["Leech", "Passive"]
+    filtered = frames.filter_frame(df, {"nodeType": ["Leech", "Eavesdropper"], "fileSize": [153600]})
+    assert filtered["nodeType"].tolist() == ["Eavesdropper"]
+    assert len(frames.filter_frame(df, {"dialer": "edge"})) == 0
+    assert frames.filter_frame(df, None) is df
+
+
+def test_parquet_filters():
+    assert frames.parquet_filters(None) is None
+    assert frames.parquet_filters({"fileSize": ["512", 153600], "nodeType": "Leech"}) == \
+        [("fileSize", "in", [512, 153600]), ("nodeType", "in", ["Leech"])]
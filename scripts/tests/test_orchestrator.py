@@ -0,0 +1,185 @@
+import json
+import os
+import tarfile
+
+import pytest
+import toml
+
+import orchestrator
+
+tests_dir = os.path.dirname(os.path.realpath(__file__))
+composition_path = os.path.join(tests_dir, "..", "..", "experiments", "composition-docker-1-eaves.toml")
+fake_testground = os.path.join(tests_dir, "fake_testground")
+
+
+@pytest.fixture
+def fake_state(tmp_path, monkeypatch):
+    state_dir = tmp_path / "state"
+    state_dir.mkdir()
+    monkeypatch.setenv("FAKE_TESTGROUND_STATE", str(state_dir))
+
+    def read():
+        with open(state_dir / "state.json") as state_file:
+            return json.load(state_file)
+
+    return read
+
+
+def _orchestrate(tmp_path, grid, **kwargs):
+    kwargs = {"retries": 0, "poll_interval": 0.01, "timeout": 10, **kwargs}
+    return orchestrator.orchestrate(composition_path, grid, str(tmp_path / "results"), str(tmp_path / "work"),
+                                    testground_bin=fake_testground, **kwargs)
+
+
+def test_expand_grid():
+    with open(composition_path) as composition_file:
+        composition = toml.load(composition_file)
+    compositions = orchestrator.expand_grid(composition, [("eavesdropper_count", ["0", "4"]),
+                                                          ("latency_ms", ["50", "100"])])
+
+    assert [name for name, _ in compositions] == [
+        "eavesdropper_count_0-latency_ms_50", "eavesdropper_count_0-latency_ms_100",
+        "eavesdropper_count_4-latency_ms_50", "eavesdropper_count_4-latency_ms_100"]
+    for name, derived in compositions:
+        eavesdroppers = 0 if name.startswith("eavesdropper_count_0") else 4
+        group = derived["groups"][0]
+        assert group["instances"]["count"] == orchestrator.NODES_WITHOUT_EAVESDROPPERS + eavesdroppers
+        assert derived["global"]["total_instances"] == orchestrator.NODES_WITHOUT_EAVESDROPPERS + eavesdroppers
+        assert group["run"]["test_params"]["eavesdropper_count"] == str(eavesdroppers)
+        assert group["run"]["test_params"]["latency_ms"] in ("50", "100")
+    # The composition the grid is derived from is left as it is
+    assert composition["groups"][0]["run"]["test_params"]["eavesdropper_count"] == "1"
+
+
+def test_expand_grid_keeps_instances_without_eavesdropper_count():
+    with open(composition_path) as composition_file:
+        composition = toml.load(composition_file)
+    (_, derived), = orchestrator.expand_grid(composition, [("dialer", ["center"])])
+    assert derived["groups"][0]["instances"] == composition["groups"][0]["instances"]
+    assert derived["groups"][0]["run"]["test_params"]["dialer"] == "center"
+
+
+def test_expand_grid_sums_the_instances_of_all_groups():
+    composition = {"global": {"plan": "trickle-spreading", "total_instances": 12},
+                   "groups": [{"id": "a", "instances": {"count": 12}}, {"id": "b", "instances": {"count": 12}}]}
+    (_, derived), = orchestrator.expand_grid(composition, [("eavesdropper_count", ["4"])])
+    assert [group["instances"]["count"] for group in derived["groups"]] == [15, 15]
+    assert derived["global"]["total_instances"] == 30
+
+    (_, derived), = orchestrator.expand_grid({"groups": composition["groups"]}, [("eavesdropper_count", ["0"])])
+    assert "global" not in derived
+    assert derived["groups"][0]["instances"]["count"] == orchestrator.NODES_WITHOUT_EAVESDROPPERS
+
+
+def test_dry_run_writes_compositions(tmp_path):
+    paths = _orchestrate(tmp_path, [("latency_ms", ["50", "100"])], dry_run=True)
+    assert [os.path.basename(path) for path in paths] == ["latency_ms_50.toml", "latency_ms_100.toml"]
+    with open(paths[1]) as composition_file:
+        assert toml.load(composition_file)["groups"][0]["run"]["test_params"]["latency_ms"] == "100"
+    assert not os.path.exists(tmp_path / "results")
+
+
+def test_results_are_collected(tmp_path, fake_state):
+    results = _orchestrate(tmp_path, [("latency_ms", ["50", "100"])])
+    assert [result["success"] for result in results] == [True, True]
+    for result in results:
+        assert result["attempts"] == 1
+        assert result["results"] == str(tmp_path / "results" / result["task"])
+        assert os.path.exists(os.path.join(result["results"], "single", "0", "results.out"))
+    # The archives are removed once they are extracted
+    assert not [f for f in os.listdir(tmp_path / "work") if f.endswith(".tgz")]
+
+
+def test_failed_outcome_is_retried(tmp_path, fake_state, monkeypatch):
+    monkeypatch.setenv("FAKE_TESTGROUND_FAILURES", "1")
+    result, = _orchestrate(tmp_path, [("latency_ms", ["50"])], retries=2)
+    assert result["success"]
+    assert result["attempts"] == 2
+    assert result["error"] is None
+    assert os.listdir(tmp_path / "results") == [result["task"]]
+
+
+def test_failures_exhaust_retries(tmp_path, fake_state, monkeypatch):
+    monkeypatch.setenv("FAKE_TESTGROUND_FAILURES", "5")
+    result, = _orchestrate(tmp_path, [("latency_ms", ["50"])], retries=1)
+    assert not result["success"]
+    assert result["attempts"] == 2
+    assert "outcome failure" in result["error"]
+    assert not os.path.exists(tmp_path / "results") or os.listdir(tmp_path / "results") == []
+
+
+def test_timeout(tmp_path, fake_state, monkeypatch):
+    monkeypatch.setenv("FAKE_TESTGROUND_POLLS", "never")
+    result, = _orchestrate(tmp_path, [("latency_ms", ["50"])], timeout=0.2, retries=1)
+    assert not result["success"]
+    assert result["attempts"] == 2
+    assert "didn't complete" in result["error"]
+    state = fake_state()
+    # Every task that timed out was terminated before it was run again
+    assert len(state["tasks"]) == 2
+    assert state["terminated"] == 2
+    assert state["max_in_flight"] == 1
+    assert state["in_flight"] == 0
+
+
+def test_timeouts_keep_the_jobs_bound(tmp_path, fake_state, monkeypatch):
+    monkeypatch.setenv("FAKE_TESTGROUND_POLLS", "never")
+    results = _orchestrate(tmp_path, [("latency_ms", ["50", "100", "150"])], jobs=2, timeout=0.2, retries=1,
+                           poll_interval=0.05)
+    assert [result["attempts"] for result in results] == [2, 2, 2]
+    state = fake_state()
+    assert len(state["tasks"]) == 6
+    assert state["max_in_flight"] == 2
+
+
+def test_testground_errors_are_not_retried(tmp_path, fake_state, monkeypatch):
+    monkeypatch.setenv("FAKE_TESTGROUND_STATUS_ERRORS", "1")
+    result, = _orchestrate(tmp_path, [("latency_ms", ["50"])], retries=2)
+    assert not result["success"]
+    assert result["attempts"] == 1
+    assert "daemon unreachable" in result["error"]
+    # The task whose status is unknown is stopped
+    assert fake_state()["terminated"] == 1
+
+
+def test_jobs_bound_the_runs_in_flight(tmp_path, fake_state, monkeypatch):
+    monkeypatch.setenv("FAKE_TESTGROUND_POLLS", "3")
+    results = _orchestrate(tmp_path, [("latency_ms", ["50", "100", "150"]), ("dialer", ["center", "edge"])],
+                           jobs=2, poll_interval=0.05)
+    assert all(result["success"] for result in results)
+    state = fake_state()
+    assert len(state["tasks"]) == 6
+    assert state["max_in_flight"] == 2
+
+
+def _write_archive(path, task_id, files):
+    with tarfile.open(path, "w:gz") as archive:
+        for name, content in files.items():
+            file_path = path.parent / "src" / task_id / name
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            file_path.write_bytes(content)
+        archive.add(path.parent / "src" / task_id, arcname=task_id)
+
+
+def test_extract_results(tmp_path):
+    archive_path = tmp_path / "task1.tgz"
+    _write_archive(archive_path, "task1", {"single/0/results.out": b"{}\n"})
+    results_dir = tmp_path / "results"
+
+    target = orchestrator.extract_results(str(archive_path), "task1", str(results_dir))
+    assert target == str(results_dir / "task1")
+    assert (results_dir / "task1" / "single" / "0" / "results.out").read_bytes() == b"{}\n"
+    # Neither the temporary directory nor the archive are left behind
+    assert os.listdir(results_dir) == ["task1"]
+    assert not archive_path.exists()
+
+
+def test_extract_results_leaves_nothing_behind_on_error(tmp_path):
+    archive_path = tmp_path / "task1.tgz"
+    archive_path.write_bytes(b"not an archive")
+    results_dir = tmp_path / "results"
+
+    with pytest.raises(tarfile.TarError):
+        orchestrator.extract_results(str(archive_path), "task1", str(results_dir))
+    # A failed extraction never shows up as a partial experiment in the result directory
+    assert os.listdir(results_dir) == []
@@ -0,0 +1,37 @@
+import shutil
+
+import process
+
+
+def test_file_size_filter_scans_whole_file(synthetic_dir):
+    # The file size changes with the permutation, so a line of another file size must not end the scan of a file
+    mixed = 0
+    for kind in ["results.out", "messageHistory.out"]:
+        for _, filepath, experiment_id in process.find_result_files(synthetic_dir, [kind]):
+            items = list(process.iter_result_file(kind, filepath, experiment_id))
+            filtered = list(process.iter_result_file(kind, filepath, experiment_id, {"fileSize": 153600}))
+            assert filtered == [item for item in items if item["fileSize"] == "153600"]
+            mixed += {item["fileSize"] for item in items} == {"512", "153600"}
+    assert mixed > 0
+
+
+def test_instance_filter_skips_other_instances(synthetic_dir):
+    metrics = process.load_results(synthetic_dir, ["results.out"], processes=1)["results.out"]
+    eavesdroppers = process.load_results(synthetic_dir, ["results.out"], processes=1,
+                                         filters={"nodeType": "Eavesdropper"})["results.out"]
+    assert eavesdroppers == [item for item in metrics if item["nodeType"] == "Eavesdropper"]
+    assert len(eavesdroppers) > 0
+
+
+def test_aggregate_metrics_counts_experiments(synthetic_dir, tmp_path):
+    results_dir = tmp_path / "results"
+    shutil.copytree(synthetic_dir, results_dir)
+    # Outputs of the analysis that live next to the experiments
+    (results_dir / ".cache").mkdir()
+    (results_dir / "exports").mkdir()
+    (results_dir / "time-to-fetch-edge.pdf").write_bytes(b"")
+    (results_dir / "pipeline-stats.json").write_text("{}")
+
+    metrics, testcases = process.aggregate_metrics(str(results_dir))
+    assert testcases == 1
+    assert len(metrics) > 0
@@ -0,0 +1,100 @@
+import pandas as pd
+import pytest
+
+import propagation
+
+CELL = {"exType": "trickle", "dialer": "edge", "eavesCount": 1, "latencyMS": 50, "fileSize": 512,
+        "tricklingDelay": 0}
+
+
+def _run_columns(n):
+    return {"experiment": ["e1"] * n, "permutationIndex": pd.array([0] * n, dtype="Int64"),
+            "run": pd.array([1] * n, dtype="Int64")}
+
+
+def _messages(rows):
+    """
+    :param rows: (ts in ns, sender, receiver, node type of the receiver) tuples, all wanting the same CID
+    """
+    df = pd.DataFrame({**_run_columns(len(rows)), "ts": [row[0] for row in rows], "sender": [row[1] for row in rows],
+                       "receiver": [row[2] for row in rows], "nodeType": [row[3] for row in rows],
+                       "wants": [("cid1",)] * len(rows)})
+    for column, value in CELL.items():
+        df[column] = pd.array([value] * len(rows), dtype="Int64") if isinstance(value, int) else value
+    return df
+
+
+@pytest.fixture
+def index():
+    messages = _messages([
+        (10, "leech", "a", "Passive"),
+        (20, "a", "b", "Passive"),
+        (25, "b", "eve", "Eavesdropper"),
+        # The leech isn't infected by its own want and a only counts the first message it received
+        (26, "b", "leech", "Leech"),
+        (40, "b", "a", "Passive"),
+        # c and d only received the want from each other, so neither of them is connected to the leech
+        (30, "d", "c", "Passive"),
+        (31, "c", "d", "Passive"),
+    ])
+    info_items = pd.DataFrame({**_run_columns(1), "type": ["LeechInfo"], "peer": ["leech"], "lookingFor": ["cid1"],
+                               "timestamp": [0]})
+    metrics = pd.DataFrame({**_run_columns(1), "nodeType": ["Leech"], "meta": ["time_to_fetch"], "value": [22.0]})
+    return propagation.PropagationIndex(messages, info_items, metrics)
+
+
+def test_hops_form_a_tree_rooted_at_the_leech(index):
+    hops = index.timeline("e1", 0, 1, "cid1").set_index("receiver")
+    assert hops.index.tolist() == ["a", "b", "eve", "c", "d"]
+    assert hops["depth"].tolist()[:3] == [1, 2, 3]
+    assert hops.loc["b", "parent"] == hops.index.get_loc("a")
+    assert hops.loc["a", "parent"] == -1
+    assert hops["hopDelay"].tolist()[:3] == [10, 10, 5]
+    assert hops["beforeFetch"].tolist()[:3] == [True, True, False]
+
+
+def test_cycle_is_not_connected_to_the_leech(index):
+    hops = index.timeline("e1", 0, 1, "cid1").set_index("receiver")
+    assert hops.loc["c", "depth"] is pd.NA and hops.loc["d", "depth"] is pd.NA
+    # c and d point to each other
+    assert hops.loc["c", "parent"] == hops.index.get_loc("d")
+    assert hops.loc["d", "parent"] == hops.index.get_loc("c")
+
+
+def test_wants(index):
+    want = index.wants().iloc[0]
+    assert want["source"] == "leech"
+    assert (want["nodes"], want["connected"], want["eavesdroppers"]) == (5, 3, 1)
+    assert (want["maxDepth"], want["depthSum"], want["spread"], want["reachedBeforeFetch"]) == (3, 6, 31, 2)
+
+    lengths = propagation.path_lengths(index.wants()).iloc[0]
+    assert lengths["mean_path_length"] == 2
+    assert lengths["mean_spread_ms"] == 31 / 1e6
+
+
+def test_hop_delays(index):
+    delays = propagation.hop_delays(index.hops)
+    assert delays["depth"].tolist() == [1, 2, 3]
+    assert delays["hops"].tolist() == [1, 1, 1]
+    assert delays["mean_ms"].tolist() == [10 / 1e6, 10 / 1e6, 5 / 1e6]
+
+
+def test_without_metrics_the_hops_before_the_fetch_are_unknown():
+    hops = propagation.build_hops(_messages([(10, "leech", "a", "Passive")]),
+                                  pd.DataFrame({**_run_columns(1), "type": ["LeechInfo"], "peer": ["leech"],
+                                                "lookingFor": ["cid1"], "timestamp": [0]}))
+    assert hops["beforeFetch"].isna().all()
+    assert pd.isna(propagation.summarize_wants(hops)["reachedBeforeFetch"].iloc[0])
+
+
+def test_simulated_wants_reach_every_node(simulated_dir):
+    import result_cache
+
+    results = result_cache.load(simulated_dir, processes=1)
+    index = propagation.PropagationIndex(results["messageHistory.out"], results["globalInfo.out"],
+                                         results["results.out"])
+    wants = index.wants()
+    assert len(wants) == (results["globalInfo.out"]["type"] == "LeechInfo").sum()
+    # Every node but the leech received the want, and along a path from the leech
+    assert (wants["connected"] == wants["nodes"]).all()
+    assert (wants["maxDepth"] >= 1).all()
@@ -0,0 +1,70 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import regression
+
+
+def _samples(cells):
+    return pd.DataFrame([(cell, value) for cell, values in cells.items() for value in values],
+                        columns=["name", "value"])
+
+
+def test_holm():
+    np.testing.assert_allclose(regression.holm([0.01, 0.04, 0.03, 0.005]), [0.03, 0.06, 0.06, 0.02])
+    np.testing.assert_allclose(regression.holm([0.5, 0.6]), [1.0, 1.0])
+    assert len(regression.holm([])) == 0
+
+
+def test_mann_whitney_with_ties():
+    baseline = _samples({"a": [1, 2, 2, 3]})
+    candidate = _samples({"a": [2, 3, 3, 4]})
+    result = regression.mann_whitney(baseline, candidate, ["name"], "value")
+    # Ranks of the candidate 3 + 6 + 6 + 8 = 23, two groups of three ties
+    u = 23 - 4 * 5 / 2
+    sigma = math.sqrt(4 * 4 / 12 * ((8 + 1) - (24 + 24) / (8 * 7)))
+    assert result["u"].iloc[0] == u
+    assert result["effect"].iloc[0] == u / 16
+    assert result["p"].iloc[0] == pytest.approx(math.erfc((abs(u - 8) - 0.5) / sigma / math.sqrt(2)))
+
+
+def test_mann_whitney_ranks_every_cell_on_its_own():
+    baseline = _samples({"a": [1, 2, 3], "b": [100, 200, 300], "c": [5, 5], "d": [1]})
+    candidate = _samples({"a": [4, 5, 6], "b": [1, 2, 3], "c": [5, 5, 5]})
+    result = regression.mann_whitney(baseline, candidate, ["name"], "value").set_index("name")
+    assert result.index.tolist() == ["a", "b", "c"]
+    assert result.loc["a", "effect"] == 1 and result.loc["b", "effect"] == 0
+    # All samples of c are tied, so there is nothing to test
+    assert result.loc["c", "p"] == 1
+    assert result.loc["a", "p"] == pytest.approx(result.loc["b", "p"])
+
+
+def test_compare_flags_regressions_and_improvements():
+    rng = np.random.default_rng(4)
+    baseline = _samples({"same": rng.normal(100, 5, 40), "slower": rng.normal(100, 5, 40),
+                         "faster": rng.normal(100, 5, 40), "slightly": rng.normal(100, 5, 40)})
+    candidate = _samples({"same": rng.normal(100, 5, 40), "slower": rng.normal(130, 5, 40),
+                          "faster": rng.normal(70, 5, 40), "slightly": rng.normal(102, 5, 40)})
+    result = regression.compare(baseline, candidate, keys=["name"], n_resamples=500).set_index("name")
+    assert result["regression"].to_dict() == {"faster": False, "same": False, "slightly": False, "slower": True}
+    assert result["improvement"].to_dict() == {"faster": True, "same": False, "slightly": False, "slower": False}
+    assert result.loc["slower", "relative_change"] == pytest.approx(0.3, abs=0.05)
+    assert (result["p_adjusted"] >= result["p"]).all()
+    assert (result["difference_low"] <= result["difference"]).all()
+    assert (result["difference"] <= result["difference_high"]).all()
+
+
+def test_regression_of_result_directory_against_itself(synthetic_dir):
+    samples = regression.load_samples(synthetic_dir, processes=1)
+    assert set(samples["meta"]) <= set(regression.metrics) | {"tcp_fetch"}
+    result = regression.compare(samples, samples, n_resamples=200)
+    assert len(result) > 0
+    assert not result["regression"].any() and not result["improvement"].any()
+
+
+def test_tcp_fetch_is_not_compared_by_default():
+    assert "tcp_fetch" in regression.metrics
+    assert "tcp_fetch" not in regression.default_metrics
+    assert "time_to_fetch" in regression.default_metrics
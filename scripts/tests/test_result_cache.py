@@ -0,0 +1,41 @@
+import shutil
+
+import pandas as pd
+
+import process
+import result_cache
+
+
+def test_cache_matches_parsed_results(synthetic_dir, tmp_path):
+    results_dir = str(tmp_path / "results")
+    shutil.copytree(synthetic_dir, results_dir)
+    parsed = result_cache.load(results_dir, processes=1)
+    cached = result_cache.load(results_dir, processes=1)
+    for kind, df in parsed.items():
+        pd.testing.assert_frame_equal(df.reset_index(drop=True), cached[kind].reset_index(drop=True))
+    items = process.load_results(results_dir, ["results.out"], processes=1)["results.out"]
+    assert len(cached["results.out"]) == len(items)
+
+
+def test_filters_are_pushed_into_the_cache_read(synthetic_dir, tmp_path):
+    results_dir = str(tmp_path / "results")
+    shutil.copytree(synthetic_dir, results_dir)
+    messages = result_cache.load(results_dir, ["messageHistory.out"], processes=1)["messageHistory.out"]
+    filters = {"nodeType": "Eavesdropper", "fileSize": 153600}
+    filtered = result_cache.load(results_dir, ["messageHistory.out"], processes=1, filters=filters)
+    expected = messages[(messages["nodeType"] == "Eavesdropper") & (messages["fileSize"] == 153600)]
+    assert len(filtered["messageHistory.out"]) == len(expected) > 0
+    assert set(filtered["messageHistory.out"]["nodeType"]) == {"Eavesdropper"}
+
+
+def test_changed_experiment_is_reparsed(synthetic_dir, tmp_path):
+    results_dir = str(tmp_path / "results")
+    shutil.copytree(synthetic_dir, results_dir)
+    before = result_cache.load(results_dir, ["results.out"], processes=1)["results.out"]
+    path = process.find_result_files(results_dir, ["results.out"])[0][1]
+    with open(path) as result_file:
+        lines = result_file.readlines()
+    with open(path, "w") as result_file:
+        result_file.writelines(lines[:-1])
+    after = result_cache.load(results_dir, ["results.out"], processes=1)["results.out"]
+    assert len(after) == len(before) - 1
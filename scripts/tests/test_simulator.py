@@ -0,0 +1,90 @@
+import filecmp
+import random
+
+import pytest
+
+import result_cache
+import simulator
+
+L = 50 * 10 ** 6
+
+
+def _run(graph, node_types, file_size, delay_ns=0):
+    return simulator.simulate_run(random.Random(1), graph, node_types, L, delay_ns, file_size, 0)
+
+
+@pytest.fixture
+def path():
+    graph = {"leech": ["p"], "p": ["leech", "seed", "eve"], "seed": ["p"], "eve": ["p"]}
+    node_types = {"leech": "Leech", "p": "Passive", "seed": "Seed", "eve": "Eavesdropper"}
+    return graph, node_types
+
+
+def test_small_block_is_sent_right_away(path):
+    # want leech -> p, want p -> seed, block seed -> p, block p -> leech
+    nodes, fetched = _run(*path, file_size=512)
+    assert fetched == 4 * L
+    assert [sender for _, sender in nodes["eve"].wants] == ["p"]
+    assert nodes["eve"].counters["blks_rcvd"] == 0
+    assert nodes["seed"].counters["blks_sent"] == 1
+
+
+def test_large_block_takes_another_round_trip(path):
+    nodes, fetched = _run(*path, file_size=simulator.MAX_BLOCK_SIZE_REPLACE_HAS_WITH_BLOCK + 1)
+    assert fetched == 6 * L
+
+
+def test_leaves_are_fetched_along_the_path_of_the_root(path):
+    file_size = 3 * simulator.synthetic_results.BLOCK_SIZE
+    nodes, fetched = _run(*path, file_size=file_size)
+    assert simulator.count_blocks(file_size) == (3, 2)
+    assert fetched == 4 * L + 4 * L
+    assert nodes["leech"].counters["blks_rcvd"] == 4
+    assert nodes["seed"].counters["blks_sent"] == 4
+
+
+def test_trickling_delays_the_want_to_the_seed():
+    graph = {"leech": ["p"], "p": ["leech", "seed"], "seed": ["p"]}
+    node_types = {"leech": "Leech", "p": "Passive", "seed": "Seed"}
+    delay_ns = 10 ** 8
+    # p sends the want to its two peers in random order, so the seed gets it right away or one trickling delay later
+    delays = {simulator.simulate_run(random.Random(seed), graph, node_types, L, delay_ns, 512, 0)[1] - 4 * L
+              for seed in range(20)}
+    assert delays == {0, delay_ns}
+
+
+def test_tcp_fetch_time():
+    assert simulator.tcp_fetch_time(L, 512) == 2 * L
+    # 1 MiB is 719 segments, which take 7 rounds of slow start from an initial window of 10
+    assert simulator.tcp_fetch_time(L, 1048576) == 2 * L * 7
+
+
+def test_simulated_results_are_parsed(simulated_dir):
+    results = result_cache.load(simulated_dir, processes=1)
+    metrics = results["results.out"]
+    leech = metrics[metrics["nodeType"] == "Leech"]
+    ttf = leech[leech["meta"] == "time_to_fetch"]
+    # Two compositions of 2 file sizes times 2 delays times 3 runs
+    assert len(ttf) == 2 * 2 * 2 * 3
+    assert (ttf["value"] < simulator.RUN_TIMEOUT_NS).all()
+    assert len(leech[leech["meta"] == "tcp_fetch"]) == len(ttf)
+
+    messages = results["messageHistory.out"]
+    assert set(messages["nodeType"]) >= {"Passive", "Eavesdropper", "Seed"}
+    # Only the first want of every node and run is recorded
+    assert not messages.duplicated(subset=["experiment", "permutationIndex", "run", "receiver"]).any()
+    leech_info = results["globalInfo.out"]
+    assert (leech_info["type"] == "LeechInfo").sum() == len(ttf)
+
+    means = ttf.groupby("tricklingDelay")["value"].mean()
+    assert means.loc[100] > means.loc[0]
+
+
+def test_simulation_only_depends_on_the_seed(tmp_path):
+    dirs = []
+    for name in ["a", "b"]:
+        results_dir = str(tmp_path / name)
+        [experiment] = simulator.simulate(results_dir, runs=2, eaves_counts=[1], delays=[50], latencies=[50],
+                                          file_sizes=[512], dialers=["edge"], seed=7, processes=1)
+        dirs.append(f"{results_dir}/{experiment}/nodes/0")
+    assert filecmp.dircmp(*dirs).diff_files == []
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import sketches
+
+QS = (0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 1.0)
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(5)
+    return pd.DataFrame({"cell": np.repeat(["a", "b"], [5000, 300]),
+                         "value": np.concatenate([rng.lognormal(20, 2, 5000), rng.uniform(1e6, 3e6, 300)])})
+
+
+def test_quantiles_are_within_the_relative_accuracy(values):
+    result = sketches.quantiles(sketches.create_sketches(values, ["cell"], "value"), ["cell"], QS)
+    for cell, row in result.set_index("cell").iterrows():
+        cell_values = values.loc[values["cell"] == cell, "value"].to_numpy()
+        assert row["count"] == len(cell_values)
+        for q in QS:
+            exact = np.quantile(cell_values, q, method="lower")
+            estimate = row["p" + format(q * 100, "g")]
+            assert abs(estimate - exact) <= sketches.RELATIVE_ACCURACY * exact, (cell, q)
+
+
+def test_merged_sketches_equal_the_sketch_of_all_values(values):
+    values = values.assign(part=np.arange(len(values)) % 3)
+    parts = [sketches.create_sketches(df, ["cell"], "value") for _, df in values.groupby("part")]
+    merged = sketches.merge_sketches(parts, ["cell"])
+    whole = sketches.create_sketches(values, ["cell"], "value")
+    pd.testing.assert_frame_equal(merged, whole, check_dtype=False)
+    # The sketch of a cell is much smaller than its values
+    assert len(whole) < len(values) / 5
+
+
+def test_values_that_are_not_positive():
+    df = pd.DataFrame({"cell": "a", "value": [0.0, -1.0, 100.0, np.nan]})
+    sketch = sketches.create_sketches(df, ["cell"], "value")
+    assert sketch["count"].sum() == 3
+    result = sketches.quantiles(sketch, ["cell"], (0.5, 1.0))
+    assert result["p50"].iloc[0] == 0
+    assert result["p100"].iloc[0] == pytest.approx(100, rel=sketches.RELATIVE_ACCURACY)
@@ -0,0 +1,86 @@
+import math
+
+import pandas as pd
+import pytest
+
+import source_estimators
+
+MS = 1_000_000
+
+
+def _messages(rows, delay=100):
+    """
+    Build the messages received by the eavesdroppers of one run, all wanting the same CID
+    :param rows: (ts in ms, sender, receiver) tuples
+    :param delay: the trickling delay in ms
+    """
+    return pd.DataFrame({
+        "experiment": "e1", "permutationIndex": pd.array([0] * len(rows), dtype="Int64"),
+        "run": pd.array([1] * len(rows), dtype="Int64"), "ts": [ts * MS for ts, _, _ in rows],
+        "sender": [sender for _, sender, _ in rows], "receiver": [receiver for _, _, receiver in rows],
+        "tricklingDelay": pd.array([delay] * len(rows), dtype="Int64"), "wants": [("cid1",)] * len(rows)})
+
+
+def _predict(estimator_class, rows, *args):
+    estimator = estimator_class(source_estimators.MessageIndex(_messages(rows)), *args)
+    return estimator.predictions()["prediction"].tolist()
+
+
+def test_first_spy_predicts_the_earliest_sender():
+    rows = [(30, "a", "e1"), (10, "b", "e2"), (20, "c", "e1")]
+    assert _predict(source_estimators.FirstSpyEstimator, rows) == ["b"]
+
+
+def test_majority_vote_counts_the_first_message_of_every_eavesdropper():
+    # b only reaches e1 after a, so a gets one vote and b the votes of e2 and e3
+    rows = [(5, "a", "e1"), (6, "b", "e1"), (8, "b", "e2"), (9, "b", "e3"), (1, "c", "e3")]
+    assert _predict(source_estimators.MajorityVoteEstimator, rows) == ["c"]
+    rows = [(5, "a", "e1"), (6, "b", "e1"), (8, "b", "e2"), (9, "b", "e3")]
+    assert _predict(source_estimators.MajorityVoteEstimator, rows) == ["b"]
+
+
+def test_delay_rank_corrects_for_the_trickling_delay():
+    # a trickled its second message only 10 ms after the first, so it started 90 ms before it was first seen
+    rows = [(160, "a", "e1"), (170, "a", "e2"), (150, "b", "e1")]
+    assert _predict(source_estimators.FirstSpyEstimator, rows) == ["b"]
+    assert _predict(source_estimators.DelayRankEstimator, rows) == ["a"]
+
+
+def test_rumor_centrality_predicts_the_center():
+    graph = {"a": {"b"}, "b": {"a", "c"}, "c": {"b", "d"}, "d": {"c"}}
+    assert math.isclose(source_estimators.rumor_centrality(graph, {"a", "b", "c"}, "b"), math.log(2))
+    assert source_estimators.predict_rumor_source(graph, ["a", "b", "c"]) == "b"
+    # a and d are equally central on the path of four nodes, the one seen first wins
+    assert source_estimators.predict_rumor_source(graph, ["c", "b", "a", "d"]) == "c"
+
+    rows = [(10, "a", "e1"), (20, "b", "e1"), (30, "c", "e2")]
+    assert _predict(source_estimators.RumorCentralityEstimator, rows, {"e1": graph}) == ["b"]
+    assert _predict(source_estimators.RumorCentralityEstimator, rows, {}) == [None]
+
+
+def test_predict_many_returns_none_for_unseen_wants():
+    index = source_estimators.MessageIndex(_messages([(10, "a", "e1")]))
+    targets = pd.DataFrame({"experiment": "e1", "permutationIndex": pd.array([0, 0], dtype="Int64"),
+                            "run": pd.array([1, 1], dtype="Int64"), "lookingFor": ["cid1", "cid2"]}, index=[3, 7])
+    predictions = source_estimators.FirstSpyEstimator(index).predict_many(targets)
+    assert predictions.tolist() == ["a", None]
+    assert predictions.index.tolist() == [3, 7]
+
+
+def test_source_estimator_is_abstract():
+    with pytest.raises(TypeError):
+        source_estimators.SourceEstimator(source_estimators.MessageIndex(_messages([])))
+
+
+def test_prediction_rates_of_synthetic_results(synthetic_dir):
+    import result_cache
+
+    results = result_cache.load(synthetic_dir, ["messageHistory.out", "globalInfo.out"], processes=1)
+    messages, info_items = results["messageHistory.out"], results["globalInfo.out"]
+    estimators = source_estimators.create_estimators(messages[messages["nodeType"] == "Eavesdropper"], info_items,
+                                                     messages)
+    targets = info_items[info_items["type"] == "LeechInfo"]
+    rates = source_estimators.get_prediction_rates(estimators, targets, ["tricklingDelay"])
+    assert set(rates["estimator"]) == {estimator.name for estimator in estimators}
+    assert len(rates) == 2 * len(estimators)
+    assert rates["rate"].between(0, 1).all()
@@ -0,0 +1,51 @@
+import pandas as pd
+
+import topology
+
+
+def _nodes(passives=9):
+    nodes = [("seed", "Seed", 0), ("leech", "Leech", 0), ("eve", "Eavesdropper", 0)]
+    return nodes + [(f"p{i}", "Passive", i) for i in range(passives)]
+
+
+def test_edge_topology():
+    graph = topology.build_topology(_nodes(), "edge")
+    assert graph["seed"] == {"p0", "p1", "p2", "eve"}
+    assert graph["leech"] == {"p6", "p7", "p8", "eve"}
+    # The rows of the grid wrap around, p2 dials p0 and the passive below it
+    assert graph["p2"] == {"p0", "p1", "p5", "seed", "eve"}
+    assert graph["eve"] == {node_id for node_id, _, _ in _nodes()} - {"eve"}
+
+
+def test_center_topology_without_eavesdroppers():
+    graph = topology.build_topology(_nodes(), "center", with_eavesdroppers=False)
+    assert "eve" not in graph
+    assert graph["leech"] == {"p1", "p3", "p4", "p6"}
+    assert graph["seed"] == {"p0", "p1", "p2"}
+
+
+def test_topology_is_undirected():
+    for dialer in topology.dialers:
+        graph = topology.build_topology(_nodes(), dialer)
+        for node, neighbours in graph.items():
+            assert node not in neighbours
+            assert all(node in graph[neighbour] for neighbour in neighbours)
+
+
+def test_graphs_from_node_info_skips_experiments_without_type_index():
+    nodes = _nodes()
+    info_items = pd.DataFrame({
+        "type": "NodeInfo", "experiment": ["e1"] * len(nodes) + ["e2"] * len(nodes),
+        "nodeId": [node_id for node_id, _, _ in nodes] * 2, "nodeType": [node_type for _, node_type, _ in nodes] * 2,
+        "nodeTypeIndex": pd.array([index for _, _, index in nodes] + [None] * len(nodes), dtype="Int64"),
+        "dialer": "edge"})
+    graphs = topology.graphs_from_node_info(info_items)
+    assert list(graphs.keys()) == ["e1"]
+    assert graphs["e1"] == topology.build_topology(nodes, "edge", with_eavesdroppers=False)
+
+
+def test_graphs_from_messages_ignore_eavesdroppers():
+    messages = pd.DataFrame({"experiment": ["e1", "e1", "e1", "e2"], "sender": ["a", "b", "a", "c"],
+                             "receiver": ["b", "a", "eve", "d"],
+                             "nodeType": ["Passive", "Passive", "Eavesdropper", "Leech"]})
+    assert topology.graphs_from_messages(messages) == {"e1": {"a": {"b"}, "b": {"a"}}, "e2": {"c": {"d"}, "d": {"c"}}}
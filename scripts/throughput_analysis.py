@@ -0,0 +1,139 @@
+import pandas as pd
+
+import frames
+import instrumentation
+import message_metrics_analysis
+
+# Columns identifying a cell of the throughput and overhead tables
+keys = ["exType", "latencyMS", "tricklingDelay", "fileSize"]
+
+# Columns identifying the fetch of a leech in a run
+fetch_keys = ["experiment", "permutationIndex", "run", "seq"]
+
+
+@instrumentation.timed("throughput_dataframe")
+def create_throughput_dataframe(metrics, cell_keys=keys):
+    """
+    Create a dataframe with the goodput and the slowdown compared to the TCP fetch of every fetch of a leech
+    :param metrics: the metrics to analyze, or the time to fetch samples of aggregates.py
+    :param cell_keys: the columns identifying a cell
+    :return: the dataframe with the keys, the time to fetch and the tcp fetch in ms, the goodput in Mbit/s and the
+    slowdown of every fetch. Failed fetches have no goodput, fetches without TCP comparison have no slowdown.
+    """
+    metrics = frames.ensure_frame("results.out", metrics)
+    leech = metrics[(metrics["nodeType"] == "Leech") & metrics["meta"].isin(["time_to_fetch", "tcp_fetch"])]
+
+    # Pair the time to fetch with the tcp fetch of the same leech in the same run
+    samples = leech.groupby(cell_keys + fetch_keys + ["meta"], dropna=False, observed=True)["value"].first()
+    samples = samples.unstack("meta").reindex(columns=["time_to_fetch", "tcp_fetch"]).reset_index()
+
+    ttf = samples["time_to_fetch"].where(samples["time_to_fetch"] > 0)
+    tcp = samples["tcp_fetch"].where(samples["tcp_fetch"] > 0)
+    df = samples[cell_keys].copy()
+    df["ttf_ms"] = ttf / 1e6
+    df["tcp_ms"] = tcp / 1e6
+    # The times are in ns, so bytes per ns times 8e3 are Mbit/s
+    df["goodput_mbps"] = samples["fileSize"].astype(float) * 8e3 / ttf
+    df["slowdown"] = ttf / tcp
+    return df
+
+
+@instrumentation.timed("overhead_dataframe")
+def create_overhead_dataframe(counters, cell_keys=keys):
+    """
+    Create a dataframe with the bandwidth overhead of every cell
+    :param counters: the message counters of message_metrics_analysis.count_messages, keyed by at least the cell keys
+    :param cell_keys: the columns identifying a cell
+    :return: the dataframe with the keys, the blocks sent and duplicate blocks received per message received and the
+    share of duplicates among the received blocks
+    """
+    sums = counters.groupby(cell_keys + ["meta"], dropna=False, observed=True)["sum"].sum().unstack("meta")
+    sums = sums.reindex(columns=list(message_metrics_analysis.message_types.keys())).astype(float)
+    messages = sums["msgs_rcvd"].where(sums["msgs_rcvd"] > 0)
+
+    df = pd.DataFrame({
+        "blks_sent_per_msg": sums["blks_sent"] / messages,
+        "dup_blks_rcvd_per_msg": sums["dup_blks_rcvd"] / messages,
+        "dup_ratio": sums["dup_blks_rcvd"] / sums["blks_rcvd"].where(sums["blks_rcvd"] > 0),
+    })
+    return df.reset_index()
+
+
+@instrumentation.timed("cost_dataframe")
+def create_cost_dataframe(metrics, counters=None, cell_keys=keys):
+    """
+    Quantify the latency, throughput and bandwidth cost of every cell, relative to the cell without trickling delay
+    :param metrics: the metrics to analyze, or the time to fetch samples of aggregates.py
+    :param counters: the message counters of the metrics, counted from the metrics if not given
+    :param cell_keys: the columns identifying a cell, including the trickling delay
+    :return: the dataframe with the averages of the throughput and overhead dataframes per cell, and the time to fetch
+    and goodput relative to the same cell with 0 delay
+    """
+    if counters is None:
+        counters = message_metrics_analysis.count_messages(metrics, [key for key in cell_keys if key not in keys])
+    throughput = create_throughput_dataframe(metrics, cell_keys)
+    averages = throughput.groupby(cell_keys, dropna=False, observed=True).agg(
+        fetches=("ttf_ms", "size"), ttf_ms=("ttf_ms", "mean"), tcp_ms=("tcp_ms", "mean"),
+        goodput_mbps=("goodput_mbps", "mean"), slowdown=("slowdown", "mean"),
+        slowdown_median=("slowdown", "median")).reset_index()
+    df = averages.merge(create_overhead_dataframe(counters, cell_keys), on=cell_keys, how="outer")
+
+    # Compare every delay with no delay in the same cell
+    other_keys = [key for key in cell_keys if key != "tricklingDelay"]
+    no_delay = df[df["tricklingDelay"] == 0][other_keys + ["ttf_ms", "goodput_mbps"]]
+    no_delay = no_delay.rename(columns={"ttf_ms": "ttf_ms_no_delay", "goodput_mbps": "goodput_mbps_no_delay"})
+    df = df.merge(no_delay, on=other_keys, how="left")
+    df["ttf_increase"] = df["ttf_ms"] / df.pop("ttf_ms_no_delay")
+    df["goodput_ratio"] = df["goodput_mbps"] / df.pop("goodput_mbps_no_delay")
+    return df.sort_values(cell_keys).reset_index(drop=True)
+
+
+def plot_throughput_per_delay(df):
+    """
+    Plots the goodput and the slowdown compared to TCP per trickling delay
+    :param df: the dataframe of create_throughput_dataframe
+    """
+    import seaborn as sns
+    from matplotlib import pyplot as plt
+
+    df = df.assign(**{"Experiment Type | Latency": df["exType"].astype(str) + ' | ' + df["latencyMS"].astype(str) +
+                      ' ms', "File Size": df["fileSize"].astype(str) + ' B', "x": df["tricklingDelay"].astype(int)})
+    long = df.melt(id_vars=["x", "Experiment Type | Latency", "File Size"],
+                   value_vars=["goodput_mbps", "slowdown"], var_name="Measure", value_name="value")
+    long["Measure"] = long["Measure"].replace({"goodput_mbps": "Goodput (Mbit/s)", "slowdown": "Slowdown vs. TCP"})
+
+    plt.figure(figsize=(10, 10))
+    sns.set_style("darkgrid", {"grid.color": ".6", "grid.linestyle": ":"})
+    # Dodging a single line divides by zero
+    dodge = df["Experiment Type | Latency"].nunique() > 1
+    g = sns.catplot(data=long.dropna(subset=["value"]), x="x", y="value", hue="Experiment Type | Latency",
+                    kind="point", dodge=dodge, height=4, col="File Size", row="Measure", sharey=False,
+                    margin_titles=True)
+    g.set(xlabel='Trickling delay (ms)', ylabel='')
+    sns.despine(offset=10, trim=False)
+
+
+def plot_overhead_per_delay(df):
+    """
+    Plots the bandwidth overhead per trickling delay
+    :param df: the dataframe of create_overhead_dataframe
+    """
+    import seaborn as sns
+    from matplotlib import pyplot as plt
+
+    df = df.assign(**{"Experiment Type | Latency": df["exType"].astype(str) + ' | ' + df["latencyMS"].astype(str) +
+                      ' ms', "File Size": df["fileSize"].astype(str) + ' B', "x": df["tricklingDelay"].astype(int)})
+    long = df.melt(id_vars=["x", "Experiment Type | Latency", "File Size"],
+                   value_vars=["blks_sent_per_msg", "dup_blks_rcvd_per_msg"], var_name="Type", value_name="value")
+    long["Type"] = long["Type"].replace({"blks_sent_per_msg": "Blocks Sent per Message",
+                                         "dup_blks_rcvd_per_msg": "Duplicate Blocks per Message"})
+
+    plt.figure(figsize=(10, 10))
+    sns.set_style("darkgrid", {"grid.color": ".6", "grid.linestyle": ":"})
+    # Dodging a single line divides by zero
+    dodge = df["Experiment Type | Latency"].nunique() > 1
+    g = sns.catplot(data=long.dropna(subset=["value"]), x="x", y="value", hue="Experiment Type | Latency",
+                    kind="point", dodge=dodge, height=4, col="File Size", row="Type", sharey=False,
+                    margin_titles=True)
+    g.set(xlabel='Trickling delay (ms)', ylabel='')
+    sns.despine(offset=10, trim=False)
@@ -0,0 +1,126 @@
+
+def dial_fixed_topology_centered_leech(node_type, type_index, passives):
+    """
+    Get the peers a node dials in the topology with the leech in the center, see DialFixedTopologyCenteredLeech
+    :param node_type: the type of the dialing node
+    :param type_index: the index of the dialing node among the nodes of its type
+    :param passives: the IDs of the passive nodes sorted by their type index
+    :return: the IDs of the dialed peers
+    """
+    if node_type == "Seed":
+        # Connect Seed to first 3 Passives
+        return passives[:3]
+    if node_type == "Leech":
+        # Make leech connect to passives 1, 3, 4 and 6 so that it is centered in the overall topology
+        return [passives[1], passives[3], passives[4], passives[6]]
+    if node_type == "Passive":
+        # Manually connect passives to each other so that they form a grid with the leech in the center
+        grid = {0: [1, 2, 3], 1: [2], 2: [4], 3: [4, 5], 4: [7], 5: [6, 7, 8], 6: [7, 8], 7: [8]}
+        return [passives[i] for i in grid.get(type_index, [])]
+    return []
+
+
+def dial_fixed_topology_edge_leech(node_type, type_index, passives):
+    """
+    Get the peers a node dials in the topology with the leech at the edge, see DialFixedTopologyEdgeLeech
+    :param node_type: the type of the dialing node
+    :param type_index: the index of the dialing node among the nodes of its type
+    :param passives: the IDs of the passive nodes sorted by their type index
+    :return: the IDs of the dialed peers
+    """
+    # degree of leech and seed node
+    degree = 3
+    grid_size = 3
+
+    if node_type == "Seed":
+        # Connect Seed to first 3 Passives
+        return passives[:degree]
+    if node_type == "Leech":
+        # Connect Leech to last 3 Passives
+        return passives[len(passives) - degree:]
+    if node_type == "Passive":
+        # Connect Passives to each other in a grid of {grid_size}x{grid_size}
+        dialed = []
+        # Connect to Passive in same row to the right, wrapping around the row
+        index_same_row = type_index + 1 - grid_size if (type_index + 1) % grid_size == 0 else type_index + 1
+        if index_same_row < len(passives):
+            dialed.append(passives[index_same_row])
+        # Connect to Passive in next row
+        index_next_row = type_index + grid_size
+        if index_next_row < len(passives):
+            dialed.append(passives[index_next_row])
+        return dialed
+    return []
+
+
+dialers = {
+    "center": dial_fixed_topology_centered_leech,
+    "edge": dial_fixed_topology_edge_leech,
+}
+
+
+def build_topology(nodes, dialer, with_eavesdroppers=True):
+    """
+    Build the undirected overlay the test plan dials for the given nodes
+    :param nodes: (nodeId, nodeType, nodeTypeIndex) tuples of all nodes of an experiment
+    :param dialer: the dialer of the experiment, either center or edge
+    :param with_eavesdroppers: whether to add the eavesdroppers, which dial all nodes that are no eavesdroppers
+    :return: a dict mapping every node ID to the set of IDs of its neighbours
+    """
+    passives = [node_id for node_id, node_type, _ in sorted(
+        (node for node in nodes if node[1] == "Passive"), key=lambda node: node[2])]
+    graph = {node_id: set() for node_id, node_type, _ in nodes
+             if with_eavesdroppers or node_type != "Eavesdropper"}
+
+    for node_id, node_type, type_index in nodes:
+        if node_type == "Eavesdropper":
+            if not with_eavesdroppers:
+                continue
+            dialed = [other_id for other_id, other_type, _ in nodes if other_type != "Eavesdropper"]
+        else:
+            dialed = dialers[dialer](node_type, type_index, passives)
+        for other_id in dialed:
+            graph[node_id].add(other_id)
+            graph[other_id].add(node_id)
+    return graph
+
+
+def graphs_from_node_info(info_items, with_eavesdroppers=False):
+    """
+    Build the overlay of every experiment from the NodeInfo items of globalInfo.out
+    :param info_items: the info items as typed dataframe
+    :param with_eavesdroppers: whether to add the eavesdroppers to the graphs
+    :return: a dict mapping every experiment to its graph. Experiments whose NodeInfo items don't contain the type
+    index of the nodes, which older versions of the test plan didn't record, are left out.
+    """
+    if 'nodeTypeIndex' not in info_items or 'nodeId' not in info_items:
+        return {}
+    node_info = info_items[info_items['type'] == 'NodeInfo']
+    node_info = node_info.drop_duplicates(subset=['experiment', 'nodeId'])
+
+    graphs = {}
+    for experiment, nodes in node_info.groupby('experiment', sort=False):
+        if nodes['nodeTypeIndex'].isna().any():
+            continue
+        graphs[experiment] = build_topology(
+            list(zip(nodes['nodeId'], nodes['nodeType'], nodes['nodeTypeIndex'].astype(int))),
+            nodes['dialer'].iloc[0], with_eavesdroppers)
+    return graphs
+
+
+def graphs_from_messages(messages):
+    """
+    Approximate the overlay of every experiment by the sender and receiver of every message received by a node that
+    is no eavesdropper. As only the first want of a run is recorded, edges no want travelled along in any run are missing.
+    :param messages: the messages of all nodes as typed dataframe
+    :return: a dict mapping every experiment to its graph
+    """
+    messages = messages[messages['nodeType'] != 'Eavesdropper']
+    edges = messages[['experiment', 'sender', 'receiver']].drop_duplicates()
+
+    graphs = {}
+    for experiment, sender, receiver in zip(edges['experiment'], edges['sender'], edges['receiver']):
+        graph = graphs.setdefault(experiment, {})
+        graph.setdefault(sender, set()).add(receiver)
+        graph.setdefault(receiver, set()).add(sender)
+    return graphs
@@ -1,97 +1,124 @@
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import seaborn as sns
 
-import process
+import bootstrap
+import frames
+import instrumentation
+import sketches
 
+# Times to fetch further than this many interquartile ranges above the upper quartile of their cell are outliers
+OUTLIER_IQR_FACTOR = 1.5
 
+
+@instrumentation.timed("ttf_dataframe")
 def create_ttf_dataframe(metrics, eaves_count, filter_outliers=True):
     """
     Create a dataframe with the time-to-fetch values for each experiment type
     :param metrics: the metrics to analyze
     :param eaves_count: the number of eavesdroppers
-    :param filter_outliers: whether to filter out outliers
+    :param filter_outliers: whether to replace outliers with the median of their cell, see OUTLIER_IQR_FACTOR
     :return: the dataframe with the time-to-fetch values
     """
-    outlier_threshold = 2
-
-    overall_frame = pd.DataFrame(columns=['x', 'y', 'tc'])
-    averages = pd.DataFrame(columns=['x', 'avg_normal', 'avg_tc', 'latency', 'filesize'])
-
-    by_ex_type = process.group_by(metrics, 'exType')
-    for ex_type, ex_type_items in by_ex_type.items():
-        by_latency = process.group_by(ex_type_items, "latencyMS")
-        by_latency = sorted(by_latency.items(), key=lambda x: int(x[0]))
-        for latency, latency_items in by_latency:
-            by_filesize = process.group_by(latency_items, "fileSize")
-            by_filesize = sorted(by_filesize.items(), key=lambda x: int(x[0]))
-            for filesize, filesize_items in by_filesize:
-                by_trickling_delay = process.group_by(filesize_items, "tricklingDelay")
-                by_trickling_delay = sorted(by_trickling_delay.items(), key=lambda x: int(x[0]))
-
-                x = []
-                labels = []
-                y = {}
-                tc = {}
-
-                for delay, values in by_trickling_delay:
-                    x.append(int(delay))
-                    labels.append(int(delay))
-
-                    y[delay] = []
-                    tc[delay] = []
-                    for i in values:
-                        if i["nodeType"] == "Leech":
-                            if i["meta"] == "time_to_fetch":
-                                y[delay].append(i["value"])
-                            if i["meta"] == "tcp_fetch":
-                                tc[delay].append(i["value"])
-
-                    avg = []
-                    # calculate average first for outlier detection
-                    for i in y:
-                        scaled_y = [i / 1e6 for i in y[i]]
-                        if len(scaled_y) > 0:
-                            avg.append(sum(scaled_y) / len(scaled_y))
-                        else:
-                            avg.append(0)
-
-                    for index, i in enumerate(y.keys()):
-                        last_delay = i
-                        scaled_y = [i / 1e6 for i in y[i]]
-                        # Replace outliers with average
-                        if filter_outliers:
-                            scaled_y = [i if i < avg[index] * outlier_threshold else avg[index] for i in scaled_y]
-
-                    avg_tc = []
-                    for i in tc:
-                        scaled_tc = [i / 1e6 for i in tc[i]]
-                        if len(scaled_tc) > 0:
-                            avg_tc.append(sum(scaled_tc) / len(scaled_tc))
-                        else:
-                            avg_tc.append(0)
-
-                    test = pd.DataFrame({'x': [int(last_delay)] * len(scaled_y), 'y': scaled_y, 'tc': scaled_tc,
-                                         'File Size': [filesize + ' B'] * len(scaled_y),
-                                         'Experiment Type | Latency': [ex_type + ' | ' + latency + ' ms'] * len(
-                                             scaled_y),
-                                         })
-                    overall_frame = pd.concat([overall_frame, test])
-
-
-                average = pd.DataFrame({'x': x,
-                                        'avg_normal': avg, 'avg_tc': avg_tc,
-                                        'eaves_count': eaves_count, 'latency': latency, 'filesize': filesize})
-                averages = pd.concat([averages, average])
+    metrics = frames.ensure_frame("results.out", metrics)
+    # Keep the experiment types in the order they appear in
+    ex_types = pd.Categorical(metrics["exType"], categories=pd.unique(metrics["exType"]))
+    cells = pd.DataFrame({"exType": ex_types, "latencyMS": metrics["latencyMS"], "fileSize": metrics["fileSize"],
+                          "tricklingDelay": metrics["tricklingDelay"]}, index=metrics.index)
+    keys = list(cells.columns)
+
+    leech = metrics[(metrics["nodeType"] == "Leech") & metrics["meta"].isin(["time_to_fetch", "tcp_fetch"])]
+    leech_cells = cells.loc[leech.index].assign(meta=leech["meta"], value=leech["value"] / 1e6)
+
+    # Cell averages returned with the averages
+    means = leech_cells.groupby(keys + ["meta"], observed=True)["value"].mean().unstack("meta")
+    averages = cells.drop_duplicates().set_index(keys).sort_index()
+    averages = averages.join(means).reindex(columns=["time_to_fetch", "tcp_fetch"]).fillna(0)
+
+    # Pair the n-th time to fetch of a cell with its n-th tcp fetch
+    leech_cells["n"] = leech_cells.groupby(keys + ["meta"], observed=True).cumcount()
+    samples = leech_cells.set_index(keys + ["n", "meta"])["value"].unstack("meta")
+    samples = samples.reindex(columns=["time_to_fetch", "tcp_fetch"]).dropna(subset=["time_to_fetch"]).sort_index()
+
+    y = samples["time_to_fetch"]
+    if filter_outliers:
+        # The quartiles of the cells are taken from their sketches, so they don't need the samples sorted
+        ttf_cells = leech_cells[leech_cells["meta"] == "time_to_fetch"]
+        quartiles = sketches.quantiles(sketches.create_sketches(ttf_cells, keys, "value"), keys, (0.25, 0.5, 0.75))
+        quartiles = quartiles.set_index(keys).reindex(samples.index.droplevel("n"))
+        fence = quartiles["p75"] + OUTLIER_IQR_FACTOR * (quartiles["p75"] - quartiles["p25"])
+        y = y.where(y.to_numpy() <= fence.to_numpy(), quartiles["p50"].to_numpy())
+
+    samples = samples.reset_index()
+    overall_frame = pd.DataFrame({'x': samples["tricklingDelay"].astype(int), 'y': y.to_numpy(),
+                                  'tc': samples["tcp_fetch"].to_numpy(),
+                                  'File Size': samples["fileSize"].astype(str) + ' B',
+                                  'Experiment Type | Latency': samples["exType"].astype(str) + ' | ' +
+                                                               samples["latencyMS"].astype(str) + ' ms',
+                                  })
+
+    averages = averages.reset_index()
+    averages = pd.DataFrame({'x': averages["tricklingDelay"].astype(int),
+                             'avg_normal': averages["time_to_fetch"], 'avg_tc': averages["tcp_fetch"],
+                             'latency': averages["latencyMS"].astype(str),
+                             'filesize': averages["fileSize"].astype(str), 'eaves_count': eaves_count})
 
     return overall_frame, averages
 
 
-def plot_time_to_fetch_per_extype(df):
+@instrumentation.timed("ttf_intervals")
+def create_ttf_intervals_dataframe(metrics, n_resamples=bootstrap.N_RESAMPLES, confidence=0.95):
+    """
+    Create a dataframe with the bootstrap confidence intervals of the mean and median time to fetch of every cell
+    :param metrics: the metrics to analyze, or the time to fetch samples of aggregates.py
+    :param n_resamples: the number of resamples drawn per cell
+    :param confidence: the confidence level of the intervals
+    :return: the dataframe with the columns of the plot, the number of samples and the point estimates and bounds of
+    the mean and median in ms
+    """
+    metrics = frames.ensure_frame("results.out", metrics)
+    keys = ["exType", "latencyMS", "fileSize", "tricklingDelay"]
+    leech = metrics[(metrics["nodeType"] == "Leech") & (metrics["meta"] == "time_to_fetch")]
+    samples = leech[keys].assign(value=leech["value"] / 1e6)
+
+    intervals = bootstrap.bootstrap_statistics(samples, keys, "value", n_resamples=n_resamples, confidence=confidence)
+    df = pd.DataFrame({'x': intervals["tricklingDelay"].astype(int),
+                       'File Size': intervals["fileSize"].astype(str) + ' B',
+                       'Experiment Type | Latency': intervals["exType"].astype(str) + ' | ' +
+                                                    intervals["latencyMS"].astype(str) + ' ms',
+                       })
+    return pd.concat([df, intervals.drop(columns=keys)], axis=1)
+
+
+def _plot_intervals(ax, intervals, order, hue_order, statistic):
+    """
+    Draw the point estimates and confidence intervals of a statistic on top of the dodged strips of a facet
+    :param ax: the axes of the facet
+    :param intervals: the rows of create_ttf_intervals_dataframe shown in the facet
+    :param order: the trickling delays in the order of the categories of the x axis
+    :param hue_order: the experiment types and latencies in the order they are dodged in
+    :param statistic: the statistic to draw, mean or median
+    """
+    # The strips of the hues are dodged within a width of 0.8 around every category
+    width = 0.8 / len(hue_order)
+    intervals = intervals[intervals['x'].isin(order) & intervals['Experiment Type | Latency'].isin(hue_order)]
+    positions = np.searchsorted(order, intervals['x']) - 0.4 + width * (
+            intervals['Experiment Type | Latency'].map({hue: i for i, hue in enumerate(hue_order)}) + 0.5)
+    estimates = intervals[statistic]
+    errors = [estimates - intervals[statistic + "_low"], intervals[statistic + "_high"] - estimates]
+    ax.errorbar(positions, estimates, yerr=errors, fmt='_', color='black', markersize=8, elinewidth=1, capsize=2,
+                zorder=3)
+
+
+def plot_time_to_fetch_per_extype(df, intervals=None, statistic="median"):
     """
     Plots the time-to-fetch values for each experiment type
     :param df: the dataframe with the time-to-fetch values
+    :param intervals: the dataframe of create_ttf_intervals_dataframe, to draw the confidence interval of every cell
+    :param statistic: the statistic whose confidence interval is drawn, mean or median
     """
+    import seaborn as sns
+    from matplotlib import pyplot as plt
+
     plt.figure(figsize=(10, 10))
     sns.set_style("darkgrid", {"grid.color": ".6", "grid.linestyle": ":"})
     col_order = ['512 B', '153600 B', '1048576 B']
@@ -109,4 +136,9 @@ def plot_time_to_fetch_per_extype(df):
     g.set(yticks=ticks, yticklabels=labels)
     g.set(xlabel='Trickling delay (ms)', ylabel='Time to Fetch (ms)')
 
+    if intervals is not None:
+        order = sorted(np.unique(df["x"]))
+        for file_size, ax in g.axes_dict.items():
+            _plot_intervals(ax, intervals[intervals['File Size'] == file_size], order, hue_order, statistic)
+
     sns.despine(offset=10, trim=False)